@@ -0,0 +1,166 @@
+"""
+Daily interest and late-fee accrual on overdue dues.
+
+For an accrual date, every open due more than ``ACCRUAL_GRACE_DAYS`` past its
+``due_date`` accrues one day of simple interest on its balance, at the
+annual ``interest_rate`` of the fintech financing it through an active
+``EMIPlan`` (``ACCRUAL_DEFAULT_RATE`` when no lender with a rate finances
+it). The first time a due accrues it is also charged a late fee of
+``ACCRUAL_LATE_FEE_PERCENT`` of its balance. Accruals are ``Accrual``
+rows of their own; they do not change the due's amount or balance.
+
+The work is split by supplier. A supplier's overdue dues are read in id
+order in batches of ``ACCRUAL_BATCH_SIZE``, as raw paise, priced with numpy,
+and written with one ``bulk_create``. Each batch commits together with the
+supplier's ``AccrualRun`` checkpoint, so a run that crashed resumes after its
+last committed batch. An accrual is unique per due and date, so running a
+date again never accrues twice. ``partitions``/``partition`` divide the
+suppliers between processes or jobs.
+"""
+import logging
+from datetime import timedelta
+from decimal import Decimal
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, OuterRef, Subquery
+from django.db.models.functions import Mod
+from django.utils import timezone
+
+from .allocation import BALANCE_PAISE, OPEN_STATUSES
+from .models import Accrual, AccrualRun, DueEntry, EMIPlan, UserProfile
+
+logger = logging.getLogger(__name__)
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def _rupees(paise):
+    return Decimal(int(paise)).scaleb(-2)
+
+
+def overdue_dues(accrual_date):
+    """Dues that accrue on ``accrual_date``."""
+    cutoff = accrual_date - timedelta(days=_setting('ACCRUAL_GRACE_DAYS', 0))
+    return DueEntry.objects.filter(
+        status__in=OPEN_STATUSES,
+        due_date__lt=cutoff,
+        amount__gt=F('amount_paid')
+    )
+
+
+def lender_rate():
+    """The annual rate of the fintech financing a due through its active plan."""
+    return Subquery(
+        EMIPlan.objects.filter(due=OuterRef('pk'), status='active').values('fintech__interest_rate')[:1]
+    )
+
+
+def price(balances, annual_rates, fee_due):
+    """
+    Interest and late fees in paise for ``balances`` (paise, int64).
+
+    ``annual_rates`` are percentages per due, and ``fee_due`` marks the dues
+    that have not been charged a late fee yet.
+    """
+    interest = np.rint(balances * (annual_rates / 100 / 365)).astype(np.int64)
+    fee_percent = float(_setting('ACCRUAL_LATE_FEE_PERCENT', 2))
+    late_fee = np.where(fee_due, np.rint(balances * (fee_percent / 100)), 0).astype(np.int64)
+    return interest, late_fee
+
+
+def accrue_supplier(supplier_id, accrual_date, batch_size=None):
+    """
+    Accrue ``supplier_id``'s overdue dues for ``accrual_date``.
+
+    Returns ``(dues, interest, late_fees)``, the paise totals covering only
+    the batches written by this call.
+    """
+    batch_size = batch_size or _setting('ACCRUAL_BATCH_SIZE', 5000)
+    run, _ = AccrualRun.objects.get_or_create(supplier_id=supplier_id, accrual_date=accrual_date)
+    if run.completed_at:
+        return 0, 0, 0
+
+    default_rate = float(_setting('ACCRUAL_DEFAULT_RATE', 18))
+    dues = overdue_dues(accrual_date).filter(supplier_id=supplier_id).annotate(
+        balance_paise=BALANCE_PAISE, rate=lender_rate()
+    )
+    last_id = run.last_due_id
+    count = interest_total = fee_total = 0
+    while True:
+        rows = list(
+            dues.filter(id__gt=last_id).order_by('id').values_list('id', 'balance_paise', 'rate')[:batch_size]
+        )
+        if not rows:
+            break
+        ids = np.fromiter((row[0] for row in rows), dtype=np.int64, count=len(rows))
+        balances = np.fromiter((row[1] for row in rows), dtype=np.int64, count=len(rows))
+        rates = np.fromiter(
+            (default_rate if row[2] is None else float(row[2]) for row in rows), dtype=np.float64, count=len(rows)
+        )
+        charged = set(
+            Accrual.objects.filter(due_id__in=ids.tolist(), late_fee__gt=0).values_list('due_id', flat=True)
+        )
+        fee_due = np.fromiter((due_id not in charged for due_id in ids.tolist()), dtype=bool, count=len(rows))
+        interest, late_fee = price(balances, rates, fee_due)
+
+        accruing = np.flatnonzero((interest > 0) | (late_fee > 0))
+        last_id = int(ids[-1])
+        with transaction.atomic():
+            Accrual.objects.bulk_create(
+                [
+                    Accrual(
+                        due_id=int(ids[i]), supplier_id=supplier_id, accrual_date=accrual_date,
+                        interest=_rupees(interest[i]), late_fee=_rupees(late_fee[i])
+                    )
+                    for i in accruing
+                ],
+                ignore_conflicts=True
+            )
+            AccrualRun.objects.filter(pk=run.pk).update(
+                last_due_id=last_id, dues=F('dues') + len(accruing)
+            )
+        count += len(accruing)
+        interest_total += int(interest.sum())
+        fee_total += int(late_fee.sum())
+
+    AccrualRun.objects.filter(pk=run.pk).update(completed_at=timezone.now())
+    return count, interest_total, fee_total
+
+
+def suppliers(accrual_date, partition=0, partitions=1):
+    """Ids of the suppliers in ``partition`` with dues to accrue."""
+    supplier_ids = overdue_dues(accrual_date).values('supplier_id').distinct()
+    queryset = UserProfile.objects.filter(id__in=supplier_ids).exclude(
+        id__in=AccrualRun.objects.filter(
+            accrual_date=accrual_date, completed_at__isnull=False
+        ).values('supplier_id')
+    )
+    if partitions > 1:
+        queryset = queryset.alias(part=Mod('id', partitions)).filter(part=partition)
+    return list(queryset.order_by('id').values_list('id', flat=True))
+
+
+def run(accrual_date=None, partition=0, partitions=1, batch_size=None, progress=None):
+    """Accrue every supplier of ``partition`` for ``accrual_date`` (default today)."""
+    accrual_date = accrual_date or timezone.localdate()
+    pending = suppliers(accrual_date, partition, partitions)
+    dues = interest = late_fees = 0
+    for done, supplier_id in enumerate(pending):
+        count, supplier_interest, supplier_fees = accrue_supplier(supplier_id, accrual_date, batch_size)
+        dues += count
+        interest += supplier_interest
+        late_fees += supplier_fees
+        if progress:
+            progress((done + 1) / len(pending))
+    logger.info('Accrued %d due(s) of %d supplier(s) for %s', dues, len(pending), accrual_date)
+    return {
+        'date': accrual_date.isoformat(),
+        'suppliers': len(pending),
+        'dues': dues,
+        'interest': str(_rupees(interest)),
+        'late_fees': str(_rupees(late_fees)),
+    }
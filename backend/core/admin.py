@@ -1,4 +1,10 @@
+from django.conf import settings
 from django.contrib import admin
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Max, Min, Q
+from django.utils.functional import cached_property
+
 from .models import (
     UserProfile,
     RetailerProfile,
@@ -8,58 +14,209 @@ from .models import (
     CreditAssessment,
     Transaction,
     Payment,
-    DueEntry
+    DueEntry,
+    Accrual
 )
 
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    A paginator that never counts a whole ledger table.
+
+    An unfiltered changelist takes the row count from the database's table
+    statistics, or from the primary key range where there are none. A
+    filtered one counts at most ``ADMIN_COUNT_LIMIT`` rows; past that the
+    limit is reported and the list is narrowed with filters, the date
+    drilldown or search.
+    """
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        limit = _setting('ADMIN_COUNT_LIMIT', 10000)
+        if not queryset.query.where:
+            estimate = self._estimate(queryset)
+            if estimate is not None and estimate > limit:
+                return estimate
+        return queryset.order_by()[:limit].count()
+
+    def _estimate(self, queryset):
+        model = queryset.model
+        connection = connections[queryset.db]
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                cursor.execute('SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass', [model._meta.db_table])
+                row = cursor.fetchone()
+                if row and row[0] > 0:
+                    return row[0]
+            elif connection.vendor == 'mysql':
+                cursor.execute(
+                    'SELECT table_rows FROM information_schema.tables'
+                    ' WHERE table_schema = DATABASE() AND table_name = %s',
+                    [model._meta.db_table]
+                )
+                row = cursor.fetchone()
+                if row and row[0]:
+                    return row[0]
+        bounds = queryset.order_by().aggregate(low=Min('pk'), high=Max('pk'))
+        if bounds['low'] is None:
+            return 0
+        return bounds['high'] - bounds['low'] + 1
+
+
+class LedgerAdmin(admin.ModelAdmin):
+    """
+    Changelist settings for the tables that grow with the ledger.
+
+    Search does not ``icontains`` across joins: a term is matched as a
+    business name prefix against ``UserProfile`` first, and the list is then
+    filtered by the matching profile ids through its foreign key indexes.
+    Numeric terms also match the primary key, and ``exact_search_fields``
+    match the term exactly.
+    """
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    list_per_page = 50
+    profile_search_fields = ()
+    exact_search_fields = ()
+    search_help_text = 'Business name prefix, or an exact id or reference'
+
+    def get_search_results(self, request, queryset, search_term):
+        term = search_term.strip()
+        if not term:
+            return queryset, False
+        condition = Q()
+        if term.isdigit():
+            condition |= Q(pk=int(term))
+        for field in self.exact_search_fields:
+            condition |= Q(**{field: term})
+        profile_ids = list(
+            UserProfile.objects.filter(business_name__istartswith=term)
+            .values_list('id', flat=True)[:_setting('ADMIN_SEARCH_PROFILE_LIMIT', 500)]
+        )
+        if profile_ids:
+            for field in self.profile_search_fields:
+                condition |= Q(**{f'{field}__in': profile_ids})
+        if not condition:
+            return queryset.none(), False
+        return queryset.filter(condition), False
+
+
 @admin.register(UserProfile)
 class UserProfileAdmin(admin.ModelAdmin):
     list_display = ('user', 'user_type', 'business_name', 'phone')
     list_filter = ('user_type',)
-    search_fields = ('user__username', 'business_name', 'phone')
+    list_select_related = ('user',)
+    ordering = ('business_name', 'id')
+    # Prefix and exact matches, so the ledger autocompletes stay on indexes.
+    search_fields = ('^business_name', '=phone', '=user__username')
+    search_help_text = 'Business name prefix, or an exact phone number or username'
+
+    def get_search_results(self, request, queryset, search_term):
+        # The default search ORs a LIKE with an iexact phone and a join on
+        # auth_user, which SQLite can only answer by scanning. Each match is
+        # looked up on its own index instead and the ids are unioned.
+        term = search_term.strip()
+        if not term:
+            return queryset, False
+        profiles = UserProfile.objects.values('id')
+        ids = profiles.filter(business_name__istartswith=term).union(
+            profiles.filter(phone=term),
+            profiles.filter(user__username=term)
+        )
+        return queryset.filter(id__in=ids), False
 
 @admin.register(RetailerProfile)
 class RetailerProfileAdmin(admin.ModelAdmin):
     list_display = ('user_profile', 'business_type', 'years_in_business', 'credit_score')
     list_filter = ('business_type', 'shop_ownership')
+    list_select_related = ('user_profile',)
+    raw_id_fields = ('user_profile',)
     search_fields = ('user_profile__business_name', 'pan_number')
 
 @admin.register(BankDetails)
-class BankDetailsAdmin(admin.ModelAdmin):
+class BankDetailsAdmin(LedgerAdmin):
     list_display = ('retailer', 'bank_name', 'account_number', 'ifsc_code')
-    search_fields = ('retailer__user_profile__business_name', 'bank_name', 'account_number')
+    list_select_related = ('retailer__user_profile',)
+    raw_id_fields = ('retailer',)
+    search_fields = ('retailer__user_profile__business_name', 'account_number')
+    profile_search_fields = ('retailer__user_profile',)
+    exact_search_fields = ('account_number', 'ifsc_code')
 
 @admin.register(ExistingLoan)
 class ExistingLoanAdmin(admin.ModelAdmin):
     list_display = ('retailer', 'loan_amount', 'loan_provider', 'monthly_emi', 'created_at')
     list_filter = ('created_at',)
+    list_select_related = ('retailer__user_profile',)
+    raw_id_fields = ('retailer',)
     search_fields = ('retailer__user_profile__business_name', 'loan_provider')
 
 @admin.register(Document)
 class DocumentAdmin(admin.ModelAdmin):
     list_display = ('retailer', 'document_type', 'uploaded_at')
     list_filter = ('document_type', 'uploaded_at')
+    list_select_related = ('retailer__user_profile',)
+    raw_id_fields = ('retailer',)
     search_fields = ('retailer__user_profile__business_name',)
 
 @admin.register(CreditAssessment)
 class CreditAssessmentAdmin(admin.ModelAdmin):
     list_display = ('retailer', 'credit_score', 'status', 'approved_limit', 'assessment_date')
     list_filter = ('status', 'assessment_date')
+    list_select_related = ('retailer__user_profile',)
+    raw_id_fields = ('retailer',)
     search_fields = ('retailer__user_profile__business_name',)
 
 @admin.register(Transaction)
-class TransactionAdmin(admin.ModelAdmin):
+class TransactionAdmin(LedgerAdmin):
     list_display = ('supplier', 'retailer', 'amount', 'status', 'created_at', 'due_date')
-    list_filter = ('status', 'created_at')
+    list_filter = ('status',)
+    list_select_related = ('supplier', 'retailer')
+    autocomplete_fields = ('supplier', 'retailer')
+    date_hierarchy = 'created_at'
+    ordering = ('-created_at', '-id')
+    sortable_by = ('created_at',)
     search_fields = ('supplier__business_name', 'retailer__business_name')
+    profile_search_fields = ('supplier', 'retailer')
 
 @admin.register(Payment)
-class PaymentAdmin(admin.ModelAdmin):
-    list_display = ('transaction', 'amount', 'payment_method', 'status', 'payment_date')
-    list_filter = ('status', 'payment_date', 'payment_method')
-    search_fields = ('transaction__supplier__business_name', 'transaction__retailer__business_name')
+class PaymentAdmin(LedgerAdmin):
+    list_display = ('transaction', 'retailer', 'supplier', 'amount', 'payment_method', 'status', 'payment_date')
+    list_filter = ('status', 'payment_method')
+    list_select_related = ('transaction__supplier', 'transaction__retailer', 'retailer', 'supplier')
+    autocomplete_fields = ('retailer', 'supplier')
+    raw_id_fields = ('transaction',)
+    date_hierarchy = 'payment_date'
+    ordering = ('-payment_date', '-id')
+    sortable_by = ('payment_date',)
+    search_fields = ('retailer__business_name', 'supplier__business_name', 'reference_id')
+    profile_search_fields = ('retailer', 'supplier')
+    exact_search_fields = ('reference_id',)
 
 @admin.register(DueEntry)
-class DueEntryAdmin(admin.ModelAdmin):
+class DueEntryAdmin(LedgerAdmin):
     list_display = ('supplier', 'retailer', 'amount', 'status', 'due_date')
-    list_filter = ('status', 'due_date')
-    search_fields = ('supplier__business_name', 'retailer__business_name')
\ No newline at end of file
+    list_filter = ('status',)
+    list_select_related = ('supplier', 'retailer')
+    autocomplete_fields = ('supplier', 'retailer')
+    date_hierarchy = 'due_date'
+    ordering = ('-created_at', '-id')
+    sortable_by = ('due_date',)
+    search_fields = ('supplier__business_name', 'retailer__business_name')
+    profile_search_fields = ('supplier', 'retailer')
+
+@admin.register(Accrual)
+class AccrualAdmin(LedgerAdmin):
+    list_display = ('due', 'supplier', 'accrual_date', 'interest', 'late_fee')
+    list_select_related = ('due', 'supplier')
+    autocomplete_fields = ('supplier',)
+    raw_id_fields = ('due',)
+    date_hierarchy = 'accrual_date'
+    ordering = ('-accrual_date', '-id')
+    sortable_by = ('accrual_date',)
+    search_fields = ('supplier__business_name',)
+    profile_search_fields = ('supplier',)
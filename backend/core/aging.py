@@ -0,0 +1,115 @@
+"""
+Receivables aging report.
+
+Open balances are bucketed by days past due with conditional aggregation,
+grouped by retailer, in a single query. The result is cached per supplier
+and dropped on the next due or payment write for that supplier.
+
+Reports are cached per process, under a version kept in the ``shared`` cache
+so that a write in any process (web worker, job worker, management command)
+drops the report everywhere. The version is replaced by a fresh
+``time.time_ns()`` token once the write commits; replacing it earlier would
+let a concurrent read cache the old balances under the new version. Tokens
+never repeat, so a lost version key cannot bring an old report back.
+"""
+import time
+from datetime import timedelta
+from decimal import Decimal
+from functools import partial
+
+from django.core.cache import cache, caches
+from django.db import transaction
+from django.db.models import Q, Sum
+from django.utils import timezone
+
+from .allocation import BALANCE, OPEN_STATUSES
+from .models import DueEntry
+
+BUCKETS = ('current', 'days_1_30', 'days_31_60', 'days_61_90', 'days_90_plus')
+SORT_FIELDS = BUCKETS + ('total', 'retailer_name')
+
+CACHE_TIMEOUT = 60 * 60 * 24
+ZERO = Decimal('0.00')
+
+
+def bucket_filters(today):
+    return {
+        'current': Q(due_date__gte=today),
+        'days_1_30': Q(due_date__lt=today, due_date__gte=today - timedelta(days=30)),
+        'days_31_60': Q(due_date__lt=today - timedelta(days=30), due_date__gte=today - timedelta(days=60)),
+        'days_61_90': Q(due_date__lt=today - timedelta(days=60), due_date__gte=today - timedelta(days=90)),
+        'days_90_plus': Q(due_date__lt=today - timedelta(days=90)),
+    }
+
+
+def _version_key(supplier_id):
+    return f'aging:version:{supplier_id}'
+
+
+def invalidate(supplier_id):
+    """Drop the cached report for a supplier once the current transaction commits."""
+    transaction.on_commit(partial(_bump, supplier_id))
+
+
+def _bump(supplier_id):
+    caches['shared'].set(_version_key(supplier_id), time.time_ns(), None)
+
+
+def _money(value):
+    if value is None:
+        return ZERO
+    return Decimal(str(value)).quantize(ZERO)
+
+
+def compute_report(supplier_id, today):
+    """Run the aging query and return ``(rows, totals)``."""
+    aggregates = {
+        name: Sum(BALANCE, filter=condition)
+        for name, condition in bucket_filters(today).items()
+    }
+    queryset = DueEntry.objects.filter(
+        supplier_id=supplier_id,
+        status__in=OPEN_STATUSES
+    ).values(
+        'retailer_id', 'retailer__business_name'
+    ).annotate(
+        total=Sum(BALANCE), **aggregates
+    ).order_by('-total', 'retailer_id')
+
+    rows = []
+    totals = dict.fromkeys(BUCKETS + ('total',), ZERO)
+    for row in queryset:
+        entry = {
+            'retailer': row['retailer_id'],
+            'retailer_name': row['retailer__business_name'],
+        }
+        for name in BUCKETS + ('total',):
+            amount = _money(row[name])
+            entry[name] = amount
+            totals[name] += amount
+        rows.append(entry)
+    return rows, totals
+
+
+def get_report(supplier_id):
+    """Return the cached report for a supplier, computing it on a miss."""
+    today = timezone.localdate()
+    version = caches['shared'].get_or_set(_version_key(supplier_id), time.time_ns, None)
+    key = f'aging:{supplier_id}:{version}:{today.isoformat()}'
+    report = cache.get(key)
+    if report is None:
+        rows, totals = compute_report(supplier_id, today)
+        report = {'as_of': today, 'rows': rows, 'totals': totals}
+        cache.set(key, report, CACHE_TIMEOUT)
+    return report
+
+
+def sort_rows(rows, sort):
+    """Sort report rows by ``sort``; a leading ``-`` means descending."""
+    descending = sort.startswith('-')
+    field = sort.lstrip('-')
+    if field not in SORT_FIELDS:
+        raise ValueError(f'Invalid sort field: {field}')
+    if field == 'total' and descending:
+        return rows  # already in this order from the query
+    return sorted(rows, key=lambda row: (row[field], row['retailer']), reverse=descending)
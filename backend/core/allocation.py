@@ -0,0 +1,152 @@
+"""
+Payment allocation engine.
+
+A payment is spread across a retailer's open dues in the order given by an
+allocation strategy. Open dues are read once as a sorted ``values()`` list,
+allocations are computed in a single pass over it and then persisted in bulk.
+The running ``amount_paid`` on each due keeps the remaining balance queryable
+without summing the payment history.
+"""
+from collections import namedtuple
+from decimal import Decimal, InvalidOperation
+
+from django.conf import settings
+from django.db import models, transaction
+from django.db.models import ExpressionWrapper, F
+from django.utils import timezone
+
+from .fields import MoneyField
+from .models import DueEntry, Payment, PaymentAllocation
+from .signals import payment_allocated
+
+OPEN_STATUSES = ('pending', 'overdue')
+
+# Remaining balance of a due, usable in filters, annotations and aggregates.
+BALANCE = ExpressionWrapper(F('amount') - F('amount_paid'), output_field=MoneyField())
+# The same balance as stored, in paise, for code that works on raw integers.
+BALANCE_PAISE = ExpressionWrapper(F('amount') - F('amount_paid'), output_field=models.BigIntegerField())
+
+STRATEGIES = {
+    'fifo': ('due_date', 'purchase_date', 'id'),
+    'lifo': ('-due_date', '-purchase_date', '-id'),
+    'smallest_first': ('balance', 'due_date', 'id'),
+    'largest_first': ('-balance', 'due_date', 'id'),
+}
+
+Allocation = namedtuple('Allocation', 'due_id supplier_id amount amount_paid status')
+
+
+class AllocationError(ValueError):
+    """Raised when a payment cannot be applied to the open dues."""
+
+
+def default_strategy():
+    return getattr(settings, 'PAYMENT_ALLOCATION_STRATEGY', 'fifo')
+
+
+def parse_amount(value):
+    try:
+        amount = Decimal(str(value)).quantize(Decimal('0.01'))
+    except (InvalidOperation, TypeError, ValueError):
+        raise AllocationError('Invalid payment amount')
+    if amount <= 0:
+        raise AllocationError('Payment amount must be positive')
+    return amount
+
+
+def open_dues(retailer, supplier=None, due_ids=None, strategy=None, lock=False):
+    """Return the retailer's open dues as dicts, sorted by ``strategy``."""
+    strategy = strategy or default_strategy()
+    if strategy not in STRATEGIES:
+        raise AllocationError(f'Unknown allocation strategy: {strategy}')
+
+    queryset = DueEntry.objects.filter(retailer=retailer, status__in=OPEN_STATUSES)
+    if supplier is not None:
+        queryset = queryset.filter(supplier=supplier)
+    if due_ids is not None:
+        queryset = queryset.filter(id__in=due_ids)
+    if lock:
+        queryset = queryset.select_for_update()
+
+    return list(
+        queryset.annotate(balance=BALANCE)
+        .order_by(*STRATEGIES[strategy])
+        .values('id', 'supplier_id', 'amount', 'amount_paid', 'status')
+    )
+
+
+def compute_allocations(rows, amount):
+    """
+    Spread ``amount`` over ``rows`` in order.
+
+    Returns the allocations and whatever part of the amount could not be
+    applied because the dues were settled first.
+    """
+    allocations = []
+    remaining = amount
+    for row in rows:
+        if remaining <= 0:
+            break
+        balance = row['amount'] - row['amount_paid']
+        if balance <= 0:
+            continue
+        applied = min(balance, remaining)
+        remaining -= applied
+        allocations.append(Allocation(
+            due_id=row['id'],
+            supplier_id=row['supplier_id'],
+            amount=applied,
+            amount_paid=row['amount_paid'] + applied,
+            status='paid' if applied == balance else row['status'],
+        ))
+    return allocations, remaining
+
+
+def apply_payment(retailer, amount, payment_method, reference_id='',
+                  supplier=None, due_ids=None, strategy=None):
+    """
+    Record a payment from ``retailer`` and allocate it across open dues.
+
+    The payment is rejected if it exceeds the outstanding balance of the
+    selected dues. Returns the ``Payment`` and the list of allocations.
+    """
+    amount = parse_amount(amount)
+
+    with transaction.atomic():
+        rows = open_dues(retailer, supplier=supplier, due_ids=due_ids,
+                         strategy=strategy, lock=True)
+        if not rows:
+            raise AllocationError('No open dues to apply this payment to')
+
+        allocations, unapplied = compute_allocations(rows, amount)
+        if unapplied > 0:
+            raise AllocationError('Payment exceeds the outstanding balance')
+
+        payment = Payment.objects.create(
+            retailer=retailer,
+            supplier=supplier,
+            amount=amount,
+            payment_method=payment_method,
+            status='completed',
+            reference_id=reference_id or ''
+        )
+        PaymentAllocation.objects.bulk_create([
+            PaymentAllocation(payment=payment, due_id=a.due_id, amount=a.amount)
+            for a in allocations
+        ])
+
+        now = timezone.now()
+        DueEntry.objects.bulk_update([
+            DueEntry(
+                id=a.due_id,
+                amount_paid=a.amount_paid,
+                status=a.status,
+                paid_at=now if a.status == 'paid' else None,
+                updated_at=now
+            )
+            for a in allocations
+        ], ['amount_paid', 'status', 'paid_at', 'updated_at'])
+
+        payment_allocated.send(sender=Payment, payment=payment, allocations=allocations)
+
+    return payment, allocations
@@ -0,0 +1,286 @@
+"""
+Fintech portfolio analytics.
+
+Every ``RetailerRisk`` row contributes a fixed-length int64 vector of counts,
+paise totals and histogram bins to a few slices: the whole book, its
+``business_type`` and its approval-month cohort. ``PortfolioAggregate`` keeps
+the running sum per slice. When risk rows are refreshed, the old rows'
+vectors are subtracted and the new ones added, so analytics never rescan the
+ledger; histograms and percentiles are read straight off the stored arrays.
+Default and overdue counts also move with the calendar. The daily
+``risk.refresh_aged`` (``manage.py refresh_aged_risk``) refreshes the rows they
+changed on, and those refreshes carry the change into the aggregates like any
+other. ``rebuild`` recomputes everything in streaming chunks and reconciles any
+drift. It can be queued as the ``analytics.rebuild`` job, for example nightly.
+"""
+from collections import defaultdict
+
+import numpy as np
+from django.db import transaction
+
+from .models import PortfolioAggregate, RetailerProfile, RetailerRisk
+
+COUNTERS = (
+    'retailers', 'defaulted', 'active', 'exposure', 'outstanding', 'overdue',
+    'approved', 'score_sum', 'scored'
+)
+
+UTILIZATION_EDGES = np.round(np.arange(0.0, 1.05, 0.05), 2)
+SCORE_EDGES = np.arange(300, 925, 25)
+CREDIT_LIMIT_EDGES = np.array([0, 25_000, 50_000, 100_000, 250_000, 500_000, 1_000_000, 2_500_000])
+CREDIT_LIMIT_LABELS = ('0-25K', '25K-50K', '50K-1L', '1L-2.5L', '2.5L-5L', '5L-10L', '10L-25L', '25L+')
+
+# Each histogram has one bin per edge: bin ``i`` holds values in
+# ``[edges[i], edges[i + 1])`` and the last bin everything above.
+HISTOGRAMS = (
+    ('utilization', UTILIZATION_EDGES),
+    ('credit_score', SCORE_EDGES),
+    ('credit_limit', CREDIT_LIMIT_EDGES),
+)
+
+OFFSETS = {}
+_size = len(COUNTERS)
+for _name, _edges in HISTOGRAMS:
+    OFFSETS[_name] = _size
+    _size += len(_edges)
+VECTOR_SIZE = _size
+
+FIELDS = (
+    'business_type', 'cohort', 'defaulted', 'credit_limit', 'outstanding',
+    'overdue_amount', 'approved_limit', 'credit_score', 'utilization'
+)
+
+
+def slices(row):
+    keys = [('total', 'all'), ('business_type', row['business_type'])]
+    if row['cohort']:
+        keys.append(('cohort', row['cohort']))
+    return keys
+
+
+def _paise(values):
+    return np.rint(np.asarray(values, dtype=np.float64) * 100).astype(np.int64)
+
+
+def vectors(rows):
+    """Contribution vectors, one per row of ``FIELDS`` dicts, as an ``(n, VECTOR_SIZE)`` array."""
+    n = len(rows)
+    out = np.zeros((n, VECTOR_SIZE), dtype=np.int64)
+    if not n:
+        return out
+    columns = {field: [row[field] for row in rows] for field in FIELDS}
+    score = np.asarray(columns['credit_score'], dtype=np.int64)
+    outstanding = _paise(columns['outstanding'])
+
+    out[:, 0] = 1
+    out[:, 1] = np.asarray(columns['defaulted'], dtype=np.int64)
+    out[:, 2] = outstanding > 0
+    out[:, 3] = _paise(columns['credit_limit'])
+    out[:, 4] = outstanding
+    out[:, 5] = _paise(columns['overdue_amount'])
+    out[:, 6] = _paise([value or 0 for value in columns['approved_limit']])
+    out[:, 7] = score
+    out[:, 8] = score > 0
+
+    index = np.arange(n)
+    values = {
+        'utilization': np.asarray(columns['utilization'], dtype=np.float64),
+        'credit_score': np.where(score > 0, score, -1),
+        'credit_limit': np.asarray(columns['credit_limit'], dtype=np.float64),
+    }
+    for name, edges in HISTOGRAMS:
+        bins = np.searchsorted(edges, values[name], side='right') - 1
+        counted = bins >= 0  # unscored retailers fall below the first edge
+        out[index[counted], OFFSETS[name] + bins[counted]] = 1
+    return out
+
+
+def group(rows, sign=1, totals=None):
+    """Sum the contribution of ``rows`` per slice into ``totals``."""
+    totals = totals if totals is not None else defaultdict(lambda: np.zeros(VECTOR_SIZE, dtype=np.int64))
+    matrix = vectors(rows)
+    by_slice = defaultdict(list)
+    for i, row in enumerate(rows):
+        for key in slices(row):
+            by_slice[key].append(i)
+    for key, indexes in by_slice.items():
+        totals[key] += sign * matrix[indexes].sum(axis=0)
+    return totals
+
+
+def apply_changes(old_rows, new_rows):
+    """Move the aggregates from ``old_rows`` to ``new_rows`` (``FIELDS`` dicts)."""
+    deltas = group(old_rows, sign=-1)
+    group(new_rows, totals=deltas)
+    deltas = {key: delta for key, delta in deltas.items() if delta.any()}
+    if not deltas:
+        return
+    with transaction.atomic():
+        # Lock in a fixed order so concurrent refreshes cannot deadlock.
+        keys = sorted(deltas)
+        existing = {
+            (aggregate.dimension, aggregate.key): aggregate
+            for aggregate in PortfolioAggregate.objects.select_for_update().filter(
+                dimension__in={dimension for dimension, _ in keys},
+                key__in={key for _, key in keys}
+            ).order_by('dimension', 'key')
+        }
+        created = []
+        for dimension, key in keys:
+            aggregate = existing.get((dimension, key))
+            if aggregate is None:
+                created.append(PortfolioAggregate(
+                    dimension=dimension, key=key, data=pack(deltas[dimension, key])
+                ))
+            else:
+                aggregate.data = pack(unpack(aggregate.data) + deltas[dimension, key])
+                aggregate.save(update_fields=['data', 'updated_at'])
+        PortfolioAggregate.objects.bulk_create(created)
+
+
+def pack(vector):
+    return np.ascontiguousarray(vector, dtype='<i8').tobytes()
+
+
+def unpack(data):
+    vector = np.frombuffer(bytes(data), dtype='<i8')
+    if len(vector) < VECTOR_SIZE:
+        # Written before a histogram was added; the rebuild fills it in.
+        vector = np.concatenate([vector, np.zeros(VECTOR_SIZE - len(vector), dtype=np.int64)])
+    return vector
+
+
+def rebuild(chunk_size=5000, refresh=True, progress=None):
+    """
+    Recompute every slice from scratch.
+
+    With ``refresh`` the risk rows are first recomputed from the ledger, a
+    chunk of retailers at a time; otherwise the stored risk rows are streamed.
+    Only the per-slice totals are held in memory.
+    """
+    from . import risk
+
+    totals = defaultdict(lambda: np.zeros(VECTOR_SIZE, dtype=np.int64))
+    ids = RetailerProfile.objects.order_by('id').values_list('id', flat=True)
+    total = ids.count()
+    done = 0
+    last_id = 0
+    while True:
+        chunk = list(ids.filter(id__gt=last_id)[:chunk_size])
+        if not chunk:
+            break
+        if refresh:
+            rows = [row_fields(row) for row in risk.refresh(chunk, track=False)]
+        else:
+            rows = list(RetailerRisk.objects.filter(retailer_id__in=chunk).values(*FIELDS))
+        group(rows, totals=totals)
+        last_id = chunk[-1]
+        done += len(chunk)
+        if progress:
+            progress(done, total)
+
+    with transaction.atomic():
+        PortfolioAggregate.objects.all().delete()
+        PortfolioAggregate.objects.bulk_create(
+            PortfolioAggregate(dimension=dimension, key=key, data=pack(vector))
+            for (dimension, key), vector in sorted(totals.items())
+            if vector[0]
+        )
+    return done
+
+
+def row_fields(instance):
+    return {field: getattr(instance, field) for field in FIELDS}
+
+
+# Reading -------------------------------------------------------------------
+
+def _from_paise(value):
+    return round(int(value) / 100, 2)
+
+
+def summary(vector):
+    counts = dict(zip(COUNTERS, vector[:len(COUNTERS)].tolist()))
+    return {
+        'retailers': counts['retailers'],
+        'defaulted': counts['defaulted'],
+        'activeRetailers': counts['active'],
+        'defaultRate': round(counts['defaulted'] * 100 / counts['retailers'], 2) if counts['retailers'] else 0,
+        'exposure': _from_paise(counts['exposure']),
+        'outstanding': _from_paise(counts['outstanding']),
+        'overdue': _from_paise(counts['overdue']),
+        'approvedLimit': _from_paise(counts['approved']),
+        'averageCreditScore': round(counts['score_sum'] / counts['scored']) if counts['scored'] else 0,
+    }
+
+
+def histogram(vector, name):
+    edges = dict(HISTOGRAMS)[name]
+    offset = OFFSETS[name]
+    return vector[offset:offset + len(edges)]
+
+
+def percentile(vector, name, q):
+    """Approximate the ``q``-th percentile by interpolating within histogram bins."""
+    edges = dict(HISTOGRAMS)[name]
+    counts = histogram(vector, name)
+    total = counts.sum()
+    if not total:
+        return None
+    cumulative = np.cumsum(counts)
+    target = q / 100 * total
+    i = int(np.searchsorted(cumulative, target, side='left'))
+    if i >= len(edges) - 1:
+        return float(edges[-1])
+    before = cumulative[i - 1] if i else 0
+    fraction = (target - before) / counts[i] if counts[i] else 0.0
+    return float(edges[i] + fraction * (edges[i + 1] - edges[i]))
+
+
+def _labels(name):
+    if name == 'credit_limit':
+        return CREDIT_LIMIT_LABELS
+    edges = dict(HISTOGRAMS)[name]
+    labels = [f'{low:g}-{high:g}' for low, high in zip(edges[:-1], edges[1:])]
+    return labels + [f'{edges[-1]:g}+']
+
+
+def distribution(vector, name, percentiles=(50, 90, 99)):
+    return {
+        'histogram': [
+            {'range': label, 'count': int(count)}
+            for label, count in zip(_labels(name), histogram(vector, name).tolist())
+        ],
+        'percentiles': {f'p{q}': percentile(vector, name, q) for q in percentiles},
+    }
+
+
+def report():
+    """Portfolio analytics from the stored aggregates, in one query."""
+    aggregates = defaultdict(dict)
+    for aggregate in PortfolioAggregate.objects.all():
+        aggregates[aggregate.dimension][aggregate.key] = unpack(aggregate.data)
+
+    book = aggregates['total'].get('all', np.zeros(VECTOR_SIZE, dtype=np.int64))
+    cohorts = [
+        {'month': month, **summary(vector)}
+        for month, vector in sorted(aggregates['cohort'].items())
+        if vector[0]
+    ]
+    business_types = sorted(
+        (
+            {'businessType': business_type, **summary(vector)}
+            for business_type, vector in aggregates['business_type'].items()
+            if vector[0]
+        ),
+        key=lambda row: -row['exposure']
+    )
+    return {
+        'summary': summary(book),
+        'creditDistribution': distribution(book, 'credit_limit')['histogram'],
+        'defaultTrend': [{'month': row['month'], 'rate': row['defaultRate']} for row in cohorts],
+        'cohorts': cohorts,
+        'exposureByBusinessType': business_types,
+        'utilization': distribution(book, 'utilization'),
+        'creditScore': distribution(book, 'credit_score'),
+    }
@@ -0,0 +1,386 @@
+"""
+Bank statement analytics behind ``RetailerProfile.bank_statement_score``.
+
+A statement CSV is memory-mapped and streamed a line at a time into compact
+typed arrays (dates, credits, debits, running balances, bounce flags), so a
+large statement never exists as Python objects per row. The cash-flow
+features are then computed with numpy over those arrays:
+
+* daily closing balances, carried forward over days without activity,
+  give the average and minimum balance and the days spent overdrawn;
+* credits and debits summed per calendar month give the inflows and
+  outflows, and the spread of the monthly inflows their volatility; a
+  statement with a balance but no credit or amount column has them taken
+  from the changes in its balance;
+* narrations such as ``CHQ RETURN`` or ``INSUFFICIENT FUNDS`` count as
+  bounces.
+
+Features are cached in ``BankStatementFeatures`` by the file's content hash
+and ``FEATURE_VERSION``, so re-scoring, or the same file uploaded twice,
+never parses again. A retailer's score combines the features of its recent
+statements into a 0-100 scorecard. Scoring runs as a ``bankstatements.score``
+job after a statement is processed; ``manage.py score_bank_statements``
+re-scores in bulk, parsing new statements on a process pool.
+"""
+import csv
+import hashlib
+import logging
+import mmap
+import os
+import re
+import shutil
+import tempfile
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from decimal import InvalidOperation
+
+import numpy as np
+from django.conf import settings
+
+from . import jobs
+from .models import BankStatementFeatures, Document, RetailerProfile
+from .reconciliation import DateParser, StatementError, find_columns, to_paise
+
+logger = logging.getLogger(__name__)
+
+# Bump when the features or their extraction change; older cache rows are ignored.
+FEATURE_VERSION = 2
+
+BOUNCE = re.compile(
+    r'\b(?:RETURN(?:ED)?|RTN|BOUNCE[D]?|DISHONOU?RED|INSUFFICIENT|INSUFF|UNPAID)\b', re.IGNORECASE
+)
+
+# Scorecard weights, summing to 100.
+WEIGHTS = {
+    'stability': 30,
+    'cushion': 25,
+    'bounces': 20,
+    'net_flow': 15,
+    'overdraft': 10,
+}
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+# Parsing ------------------------------------------------------------------------
+
+def _lines(path):
+    """Decoded lines of the file at ``path``, read through a memory map."""
+    with open(path, 'rb') as handle:
+        if os.fstat(handle.fileno()).st_size == 0:
+            raise StatementError('The statement is empty')
+        with mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            first = True
+            for line in iter(mapped.readline, b''):
+                if first:
+                    line = line.removeprefix(b'\xef\xbb\xbf')
+                    first = False
+                yield line.decode('utf-8', errors='replace')
+
+
+def parse(path):
+    """
+    Read the statement CSV at ``path`` into arrays.
+
+    Returns a dict of numpy arrays of equal length: ``date`` (datetime64[D]),
+    ``credit``, ``debit`` and ``balance`` in paise, ``has_balance`` and
+    ``bounce``; plus ``skipped``, the number of rows that could not be read,
+    and ``amounts``, whether the statement has a credit or amount column.
+    """
+    reader = csv.reader(_lines(path))
+    header = next(reader, None)
+    if header is None:
+        raise StatementError('The statement is empty')
+    columns = find_columns(header, required=('date',))
+    if 'credit' not in columns and 'balance' not in columns:
+        raise StatementError('The statement needs a credit, amount or balance column')
+    width = max(columns.values()) + 1
+    parse_date = DateParser()
+
+    dates, credits, debits, balances = array('q'), array('q'), array('q'), array('q')
+    has_balance, bounces = array('b'), array('b')
+    skipped = 0
+    for row in reader:
+        if not any(value.strip() for value in row):
+            continue
+        row = row + [''] * (width - len(row))
+        cells = {key: row[index].strip() for key, index in columns.items()}
+        try:
+            day = parse_date(cells['date']).toordinal()
+            credit = to_paise(cells.get('credit', ''))
+            debit = abs(to_paise(cells.get('debit', '')))
+            balance = cells.get('balance', '')
+            balance = to_paise(balance) if balance else None
+        except (ValueError, InvalidOperation):
+            skipped += 1
+            continue
+        if credit < 0:
+            # A signed amount column: negative amounts are debits.
+            credit, debit = 0, debit - credit
+        dates.append(day)
+        credits.append(credit)
+        debits.append(debit)
+        balances.append(balance or 0)
+        has_balance.append(balance is not None)
+        bounces.append(bool(BOUNCE.search(cells.get('narration', ''))))
+
+    # Ordinals count from 0001-01-01; datetime64 counts from 1970-01-01.
+    epoch = 719163
+    return {
+        'date': (np.frombuffer(dates, dtype=np.int64) - epoch).astype('datetime64[D]'),
+        'credit': np.frombuffer(credits, dtype=np.int64),
+        'debit': np.frombuffer(debits, dtype=np.int64),
+        'balance': np.frombuffer(balances, dtype=np.int64),
+        'has_balance': np.frombuffer(has_balance, dtype=np.int8).astype(bool),
+        'bounce': np.frombuffer(bounces, dtype=np.int8).astype(bool),
+        'skipped': skipped,
+        'amounts': 'credit' in columns,
+    }
+
+
+def extract(columns):
+    """Cash-flow features of one statement's parsed ``columns``."""
+    dates = columns['date']
+    if not len(dates):
+        raise StatementError('The statement has no transactions')
+    if dates[0] > dates[-1]:
+        # Newest first: reverse so rows of a day stay in booking order.
+        columns = {key: value[::-1] if isinstance(value, np.ndarray) else value for key, value in columns.items()}
+        dates = columns['date']
+    order = np.argsort(dates, kind='stable')
+    dates = dates[order]
+    credit, debit = columns['credit'][order], columns['debit'][order]
+    if not columns['amounts']:
+        credit, debit = _flows_from_balances(columns['balance'][order], columns['has_balance'][order])
+
+    features = {
+        'transactions': int(len(dates)),
+        'skipped': columns['skipped'],
+        'first_date': str(dates[0]),
+        'last_date': str(dates[-1]),
+        'days': int((dates[-1] - dates[0]).astype(np.int64)) + 1,
+        'bounces': int(columns['bounce'][order].sum()),
+    }
+
+    months = dates.astype('datetime64[M]')
+    month_index = (months - months[0]).astype(np.int64)
+    inflow = np.bincount(month_index, weights=credit).astype(np.int64)
+    outflow = np.bincount(month_index, weights=debit).astype(np.int64)
+    labels = np.arange(months[0], months[-1] + 1).astype(str).tolist()
+    features['monthly'] = {
+        label: [int(inflow[i]), int(outflow[i])] for i, label in enumerate(labels)
+    }
+
+    with_balance = columns['has_balance'][order]
+    if with_balance.any():
+        day = dates[with_balance]
+        balance = columns['balance'][order][with_balance]
+        # The closing balance of a day is its last row; carry it over quiet days.
+        reversed_days = day[::-1]
+        closing_days, first_from_end = np.unique(reversed_days, return_index=True)
+        closing = balance[len(balance) - 1 - first_from_end]
+        calendar = np.arange(closing_days[0], closing_days[-1] + 1)
+        daily = closing[np.searchsorted(closing_days, calendar, side='right') - 1]
+        features.update({
+            'balance_days': int(len(daily)),
+            'balance_sum': int(daily.sum()),
+            'min_balance': int(daily.min()),
+            'negative_days': int((daily < 0).sum()),
+        })
+    return features
+
+
+def _flows_from_balances(balance, has_balance):
+    """Credits and debits of a statement with only a balance column, from its changes."""
+    if not has_balance.any():
+        raise StatementError('The statement has no amounts or balances')
+    known = balance[has_balance]
+    # The first row's own movement is unknown, so it counts as neither.
+    change = np.diff(known, prepend=known[:1])
+    credit = np.zeros(len(balance), dtype=np.int64)
+    debit = np.zeros(len(balance), dtype=np.int64)
+    credit[has_balance] = np.clip(change, 0, None)
+    debit[has_balance] = np.clip(-change, 0, None)
+    return credit, debit
+
+
+def extract_path(path):
+    """Parse and extract the statement at ``path``; safe to run on a process pool."""
+    try:
+        return extract(parse(path))
+    except (StatementError, ValueError, UnicodeError, csv.Error) as e:
+        return {'error': str(e)}
+
+
+# Caching -------------------------------------------------------------------------
+
+def content_hash(document):
+    if document.content_hash:
+        return document.content_hash
+    digest = hashlib.sha256()
+    with document.file.open('rb') as stored:
+        for block in stored.chunks():
+            digest.update(block)
+    document.content_hash = digest.hexdigest()
+    Document.objects.filter(id=document.id).update(content_hash=document.content_hash)
+    return document.content_hash
+
+
+def cached(hashes):
+    """Cached features by content hash, for those of ``hashes`` that have them."""
+    return dict(
+        BankStatementFeatures.objects.filter(content_hash__in=hashes, version=FEATURE_VERSION)
+        .values_list('content_hash', 'features')
+    )
+
+
+def _store(digest, features):
+    BankStatementFeatures.objects.bulk_create(
+        [BankStatementFeatures(content_hash=digest, version=FEATURE_VERSION, features=features)],
+        ignore_conflicts=True
+    )
+
+
+def _extract_document(document):
+    try:
+        return extract_path(document.file.path)
+    except NotImplementedError:
+        # Storage without local paths: copy to a temporary file to map it.
+        with tempfile.NamedTemporaryFile(suffix='.csv') as local:
+            with document.file.open('rb') as stored:
+                shutil.copyfileobj(stored, local)
+            local.flush()
+            return extract_path(local.name)
+
+
+def document_features(document):
+    """Features of ``document``, parsed only if its content is not cached yet."""
+    digest = content_hash(document)
+    features = cached([digest]).get(digest)
+    if features is None:
+        features = _extract_document(document)
+        _store(digest, features)
+    return features
+
+
+def extract_documents(documents, workers=None):
+    """
+    Parse and cache every document of ``documents`` whose content is not cached.
+
+    Statements are parsed on a process pool of ``workers`` processes.
+    Returns the number parsed.
+    """
+    workers = workers or _setting('BANK_STATEMENT_WORKERS', os.cpu_count() or 1)
+    pending = {}
+    for document in documents:
+        pending.setdefault(content_hash(document), document)
+    for digest in cached(list(pending)):
+        del pending[digest]
+    if not pending:
+        return 0
+
+    local = {}
+    for digest, document in pending.items():
+        try:
+            local[digest] = document.file.path
+        except NotImplementedError:
+            _store(digest, _extract_document(document))
+    if workers <= 1 or len(local) <= 1:
+        for digest, path in local.items():
+            _store(digest, extract_path(path))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            for digest, features in zip(local, executor.map(extract_path, local.values())):
+                _store(digest, features)
+    return len(pending)
+
+
+# Scoring -------------------------------------------------------------------------
+
+def combine(statements):
+    """Merge the features of several statements into the metrics the score uses."""
+    statements = [features for features in statements if 'error' not in features]
+    if not statements:
+        return None
+    monthly = {}
+    for features in statements:
+        for month, (inflow, outflow) in features['monthly'].items():
+            totals = monthly.setdefault(month, [0, 0])
+            totals[0] += inflow
+            totals[1] += outflow
+    flows = np.array(list(monthly.values()), dtype=np.float64).reshape(-1, 2)
+    inflow, outflow = flows[:, 0], flows[:, 1]
+    balance_days = sum(features.get('balance_days', 0) for features in statements)
+
+    mean_inflow = float(inflow.mean())
+    metrics = {
+        'months': len(monthly),
+        'transactions': sum(features['transactions'] for features in statements),
+        'avg_monthly_inflow': round(mean_inflow / 100, 2),
+        'avg_monthly_outflow': round(float(outflow.mean()) / 100, 2),
+        'inflow_volatility': round(float(inflow.std() / mean_inflow), 4) if mean_inflow else None,
+        'net_flow_ratio': round(float((inflow.sum() - outflow.sum()) / inflow.sum()), 4) if inflow.sum() else None,
+        'bounces': sum(features['bounces'] for features in statements),
+        'avg_balance': None,
+        'min_balance': None,
+        'negative_day_ratio': None,
+    }
+    if balance_days:
+        metrics.update({
+            'avg_balance': round(sum(f.get('balance_sum', 0) for f in statements) / balance_days / 100, 2),
+            'min_balance': min(f['min_balance'] for f in statements if 'min_balance' in f) / 100,
+            'negative_day_ratio': round(sum(f.get('negative_days', 0) for f in statements) / balance_days, 4),
+        })
+    return metrics
+
+
+def score(metrics):
+    """0-100 score from combined statement ``metrics``; higher is healthier."""
+    if metrics is None:
+        return None
+    volatility = metrics['inflow_volatility']
+    outflow = metrics['avg_monthly_outflow']
+    net_flow = metrics['net_flow_ratio']
+    parts = {
+        # A coefficient of variation of 1.5 or more scores nothing.
+        'stability': 1 - min(volatility / 1.5, 1) if volatility is not None else 0,
+        # A month of outflows held as the average balance scores in full.
+        'cushion': (
+            min(max(metrics['avg_balance'] / outflow, 0), 1) if outflow and metrics['avg_balance'] is not None
+            else 0.5
+        ),
+        'bounces': 1 - min(metrics['bounces'] / metrics['months'] / 2, 1),
+        'net_flow': min(max(net_flow + 0.5, 0), 1) if net_flow is not None else 0,
+        'overdraft': 1 - metrics['negative_day_ratio'] if metrics['negative_day_ratio'] is not None else 0.5,
+    }
+    return int(round(sum(WEIGHTS[name] * value for name, value in parts.items())))
+
+
+def statements(retailer_id):
+    """The retailer's most recent processed bank statements."""
+    return list(
+        Document.objects.filter(retailer_id=retailer_id, document_type='bank_statement', status='ready')
+        .order_by('-uploaded_at')[:_setting('BANK_STATEMENT_MAX_DOCUMENTS', 12)]
+    )
+
+
+def score_retailer(retailer_id):
+    """Recompute and save a retailer's ``bank_statement_score``."""
+    documents = statements(retailer_id)
+    features = []
+    seen = set()
+    for document in documents:
+        digest = content_hash(document)
+        if digest not in seen:
+            seen.add(digest)
+            features.append(document_features(document))
+    metrics = combine(features)
+    value = score(metrics)
+    RetailerProfile.objects.filter(id=retailer_id).update(bank_statement_score=value)
+    return {'retailer': retailer_id, 'statements': len(seen), 'score': value, 'metrics': metrics}
+
+
+def schedule_scoring(retailer_id):
+    return jobs.enqueue('bankstatements.score', {'retailer_id': retailer_id})
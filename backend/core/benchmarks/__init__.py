@@ -0,0 +1,164 @@
+"""
+Benchmarks for hot request paths, run with ``manage.py run_benchmarks``.
+
+Each benchmark module in this package registers functions with
+``@benchmark('name')``. A benchmark seeds the rows it needs and runs inside a
+transaction that is always rolled back, so it can be pointed at any
+database. It returns a flat dict of measurements. Throttle buckets are
+switched off while it runs, so views can be called in a loop.
+
+``measure`` times a function after warmup calls, over repeats, and
+``timings`` turns that into ``<label>_median_ms``, ``<label>_iqr_ms`` and
+``<label>_min_ms`` results. Results can be saved as a JSON baseline with
+``run_benchmarks --save`` and checked against it with
+``compare_benchmarks``. A ``_median_ms`` result regresses when it is more than
+the threshold slower than its baseline and the difference is larger than the
+baseline's interquartile range.
+"""
+import importlib
+import inspect
+import json
+import platform
+import pkgutil
+import statistics
+import time
+from collections import namedtuple
+
+import django
+from django.conf import settings
+from django.db import connection, reset_queries, transaction
+from django.test import override_settings
+from django.utils import timezone
+
+MEDIAN, IQR = '_median_ms', '_iqr_ms'
+
+Timing = namedtuple('Timing', ['median', 'iqr', 'best', 'repeat'])
+
+_registry = {}
+_discovered = False
+
+
+def benchmark(name):
+    """Register a benchmark function under ``name``."""
+    def decorator(func):
+        _registry[name] = func
+        return func
+    return decorator
+
+
+def get_benchmarks():
+    global _discovered
+    if not _discovered:
+        for module in pkgutil.iter_modules(__path__):
+            importlib.import_module(f'{__name__}.{module.name}')
+        _discovered = True
+    return dict(sorted(_registry.items()))
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def run(name, **options):
+    """
+    Run benchmark ``name`` with those ``options`` its function accepts, so
+    ``repeat`` and ``warmup`` can be given to every benchmark at once.
+    """
+    try:
+        func = get_benchmarks()[name]
+    except KeyError:
+        raise LookupError(f'No benchmark registered for {name!r}')
+    parameters = inspect.signature(func).parameters
+    options = {key: value for key, value in options.items() if key in parameters and value is not None}
+    # With DEBUG on, a query log left over from the previous benchmark would
+    # fill up and throw off CaptureQueriesContext counts.
+    reset_queries()
+    with override_settings(THROTTLE_BUCKETS={}), transaction.atomic():
+        try:
+            return func(**options)
+        finally:
+            transaction.set_rollback(True)
+
+
+def timed(func, repeat=5):
+    """Best wall-clock time of ``repeat`` calls to ``func``, in seconds."""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def measure(func, repeat=None, warmup=None):
+    """
+    Time ``repeat`` calls to ``func`` after ``warmup`` untimed ones.
+
+    Returns a ``Timing`` of the median, interquartile range and best time in
+    seconds. Defaults come from ``BENCHMARK_REPEAT`` and ``BENCHMARK_WARMUP``.
+    """
+    repeat = max(repeat or _setting('BENCHMARK_REPEAT', 15), 2)
+    warmup = _setting('BENCHMARK_WARMUP', 3) if warmup is None else warmup
+    for _ in range(warmup):
+        func()
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start)
+    lower, _, upper = statistics.quantiles(samples, n=4, method='inclusive')
+    return Timing(statistics.median(samples), upper - lower, min(samples), repeat)
+
+
+def timings(label, func, repeat=None, warmup=None):
+    """``measure`` ``func`` and return its result entries under ``label``."""
+    timing = measure(func, repeat, warmup)
+    return {
+        f'{label}{MEDIAN}': round(timing.median * 1000, 3),
+        f'{label}{IQR}': round(timing.iqr * 1000, 3),
+        f'{label}_min_ms': round(timing.best * 1000, 3),
+    }
+
+
+# Baselines -----------------------------------------------------------------------
+
+def save_results(path, results):
+    """Write ``{name: results}`` to ``path`` as a JSON baseline."""
+    document = {
+        'created_at': timezone.now().isoformat(),
+        'python': platform.python_version(),
+        'django': django.get_version(),
+        'database': connection.vendor,
+        'machine': platform.machine(),
+        'benchmarks': results,
+    }
+    with open(path, 'w') as handle:
+        json.dump(document, handle, indent=2, sort_keys=True)
+        handle.write('\n')
+
+
+def load_results(path):
+    with open(path) as handle:
+        return json.load(handle)['benchmarks']
+
+
+def compare(baseline, current, threshold):
+    """
+    Compare the ``_median_ms`` results of two ``{name: results}`` dicts.
+
+    Returns ``(name, key, baseline ms, current ms, change, regressed)`` rows
+    for the timings both have, where ``change`` is the relative difference.
+    """
+    rows = []
+    for name, results in current.items():
+        before = baseline.get(name, {})
+        for key, value in results.items():
+            if not key.endswith(MEDIAN) or key not in before:
+                continue
+            base = before[key]
+            noise = before.get(key[:-len(MEDIAN)] + IQR, 0)
+            change = (value - base) / base if base else 0.0
+            regressed = change > threshold and value - base > noise
+            rows.append((name, key[:-len(MEDIAN)], base, value, change, regressed))
+    return rows
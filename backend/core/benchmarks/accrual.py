@@ -0,0 +1,38 @@
+import time
+from datetime import timedelta
+
+from django.utils import timezone
+
+from core import accrual
+from core.models import Accrual
+
+from . import benchmark
+from .fixtures import make_dues, make_profile, make_retailers
+
+
+@benchmark('accrual')
+def accrual_run(rows=100000, suppliers=4):
+    """
+    One night's accrual over ``rows`` dues split across ``suppliers``.
+
+    ``first_day`` also charges late fees; ``second_day`` is interest only.
+    ``rerun`` repeats the second day, which finds every supplier done.
+    """
+    retailers = make_retailers(max(rows // (100 * suppliers), 1))
+    for i in range(suppliers):
+        make_dues(make_profile('supplier', f'bench-supplier-{i}'), retailers, 100, seed=i)
+    today = timezone.localdate()
+    overdue = accrual.overdue_dues(today).count()
+
+    results = {'dues': rows, 'overdue': overdue}
+    for label, day in (('first_day', today), ('second_day', today + timedelta(days=1)),
+                       ('rerun', today + timedelta(days=1))):
+        start = time.perf_counter()
+        summary = accrual.run(day)
+        elapsed = time.perf_counter() - start
+        results[f'{label}_accrued'] = summary['dues']
+        results[f'{label}_seconds'] = round(elapsed, 3)
+        if summary['dues']:
+            results[f'{label}_dues_per_sec'] = round(summary['dues'] / elapsed)
+    results['accrual_rows'] = Accrual.objects.count()
+    return results
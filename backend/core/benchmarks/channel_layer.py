@@ -0,0 +1,102 @@
+import asyncio
+import multiprocessing
+import os
+import tempfile
+import time
+
+from channels.layers import InMemoryChannelLayer
+
+from core.channel_layers import SQLiteChannelLayer
+
+from . import benchmark
+
+
+async def _round_trip(layer, messages, sender=None):
+    sender = sender or layer
+    channel = await layer.new_channel()
+    # Start the receiving side before timing, as a connected consumer would.
+    await sender.send(channel, {'type': 'bench.warmup'})
+    await layer.receive(channel)
+    start = time.perf_counter()
+    for i in range(messages):
+        await sender.send(channel, {'type': 'bench.message', 'n': i})
+    for _ in range(messages):
+        await layer.receive(channel)
+    return time.perf_counter() - start
+
+
+async def _fan_out(layer, messages, members):
+    channels = [await layer.new_channel() for _ in range(members)]
+    for channel in channels:
+        await layer.group_add('bench', channel)
+    start = time.perf_counter()
+    for i in range(messages):
+        await layer.group_send('bench', {'type': 'bench.message', 'n': i})
+    for channel in channels:
+        for _ in range(messages):
+            await layer.receive(channel)
+    return time.perf_counter() - start
+
+
+def _receiver(path, messages, ready, done):
+    async def receive():
+        layer = SQLiteChannelLayer(path, capacity=messages)
+        channel = await layer.new_channel()
+        await layer.group_add('bench_remote', channel)
+        ready.put(channel)
+        for _ in range(messages):
+            await layer.receive(channel)
+        done.put(time.time())
+    asyncio.run(receive())
+
+
+def _cross_process(path, messages):
+    context = multiprocessing.get_context('spawn')
+    ready, done = context.Queue(), context.Queue()
+    process = context.Process(target=_receiver, args=(path, messages, ready, done))
+    process.start()
+    try:
+        ready.get(timeout=60)
+
+        async def send():
+            layer = SQLiteChannelLayer(path, capacity=messages)
+            for i in range(messages):
+                await layer.group_send('bench_remote', {'type': 'bench.message', 'n': i})
+        start = time.time()
+        asyncio.run(send())
+        return done.get(timeout=120) - start
+    finally:
+        process.join(timeout=10)
+
+
+@benchmark('channel_layer')
+def channel_layer(messages=5000, members=20):
+    """
+    Send/receive throughput of the SQLite layer against the in-memory layer.
+
+    ``round_trip`` sends and receives on one channel of the same process
+    (for SQLite also from a second layer instance, through the database),
+    ``fan_out`` sends to a group of ``members`` channels, and
+    ``cross_process`` group-sends to a channel received by another process,
+    which only the SQLite layer can do.
+    """
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'channels.sqlite3')
+        layers = (
+            ('in_memory', lambda: InMemoryChannelLayer(capacity=messages)),
+            ('sqlite', lambda: SQLiteChannelLayer(path, capacity=messages)),
+        )
+        for label, make_layer in layers:
+            elapsed = asyncio.run(_round_trip(make_layer(), messages))
+            results[f'{label}_round_trip_per_sec'] = round(messages / elapsed)
+            if label == 'sqlite':
+                # A second layer stands in for another process: every
+                # message goes through the database.
+                elapsed = asyncio.run(_round_trip(make_layer(), messages, sender=make_layer()))
+                results['sqlite_remote_round_trip_per_sec'] = round(messages / elapsed)
+            elapsed = asyncio.run(_fan_out(make_layer(), messages // 10, members))
+            results[f'{label}_fan_out_deliveries_per_sec'] = round(messages // 10 * members / elapsed)
+        elapsed = _cross_process(path, messages)
+        results['sqlite_cross_process_per_sec'] = round(messages / elapsed)
+    return results
@@ -0,0 +1,73 @@
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from core import relationships, views
+from core.models import DueEntry, Transaction
+
+from . import benchmark, timings
+from .fixtures import make_dues, make_profile, make_retailers
+
+
+def _call(view, user, path, params=None):
+    factory = APIRequestFactory()
+
+    def call():
+        request = factory.get(path, params)
+        force_authenticate(request, user=user)
+        response = view(request)
+        # Rendering evaluates any lazy querysets in the response data.
+        response.render()
+        return response
+    return call
+
+
+def _seed(retailers, dues_per_retailer):
+    supplier = make_profile('supplier', 'bench-supplier')
+    profiles = make_retailers(retailers)
+    make_dues(supplier, profiles, dues_per_retailer)
+    Transaction.objects.bulk_create(
+        (
+            Transaction(supplier=supplier, retailer_id=due.retailer_id, amount=due.amount,
+                        description='Benchmark sale', due_date=due.created_at)
+            for due in DueEntry.objects.filter(supplier=supplier).order_by('id')
+        ),
+        batch_size=2000
+    )
+    # The fixtures skip signals, so the relationship rows are built here.
+    relationships.refresh((supplier.id, profile.id) for profile in profiles)
+    return supplier, profiles
+
+
+@benchmark('dashboard_stats')
+def dashboard_stats(retailers=200, dues_per_retailer=25, repeat=None, warmup=None):
+    """Each branch of ``get_dashboard_stats``: supplier, retailer and other user types."""
+    supplier, profiles = _seed(retailers, dues_per_retailer)
+    fintech = make_profile('fintech', 'bench-fintech')
+    results = {'dues': DueEntry.objects.filter(supplier=supplier).count()}
+    for label, profile in (('supplier', supplier), ('retailer', profiles[0]), ('other', fintech)):
+        call = _call(views.get_dashboard_stats, profile.user, '/api/dashboard/stats/')
+        results[f'{label}_status'] = call().status_code
+        results.update(timings(label, call, repeat, warmup))
+    return results
+
+
+@benchmark('dashboard_analytics')
+def dashboard_analytics(retailers=200, dues_per_retailer=25, repeat=None, warmup=None):
+    """``get_dashboard_analytics`` for a supplier, with its querysets rendered."""
+    supplier, _ = _seed(retailers, dues_per_retailer)
+    call = _call(views.get_dashboard_analytics, supplier.user, '/api/dashboard/analytics/')
+    results = {'dues': DueEntry.objects.filter(supplier=supplier).count(), 'status': call().status_code}
+    results.update(timings('supplier', call, repeat, warmup))
+    return results
+
+
+@benchmark('search_retailers')
+def search_retailers(retailers=5000, repeat=None, warmup=None):
+    """``search_retailers`` for a broad term, a single match and no match."""
+    make_retailers(retailers)
+    supplier = make_profile('supplier', 'bench-supplier')
+    results = {'retailers': retailers}
+    for label, query in (('broad', 'Retailer 1'), ('single', f'Retailer {retailers - 1}'), ('none', 'no such shop')):
+        call = _call(views.search_retailers, supplier.user, '/api/retailers/search/', {'q': query})
+        results[f'{label}_matches'] = len(call().data)
+        results.update(timings(label, call, repeat, warmup))
+    return results
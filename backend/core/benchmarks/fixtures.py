@@ -0,0 +1,52 @@
+"""Bulk-created rows for benchmarks; no signals fire."""
+import random
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.utils import timezone
+
+from core.models import DueEntry, RetailerProfile, UserProfile
+
+
+def make_profile(user_type, name):
+    user = User.objects.create(username=name)
+    return UserProfile.objects.create(user=user, user_type=user_type, business_name=name.title())
+
+
+def make_retailers(count, prefix='bench-retailer'):
+    users = User.objects.bulk_create(
+        User(username=f'{prefix}-{i}', email=f'{prefix}-{i}@example.com') for i in range(count)
+    )
+    profiles = UserProfile.objects.bulk_create(
+        UserProfile(user=user, user_type='retailer', business_name=f'Retailer {i}', phone='9000000000')
+        for i, user in enumerate(users)
+    )
+    RetailerProfile.objects.bulk_create(
+        RetailerProfile(user_profile=profile, credit_score=600 + i % 200, credit_limit=50000, available_credit=25000)
+        for i, profile in enumerate(profiles)
+    )
+    return profiles
+
+
+def make_dues(supplier, retailers, per_retailer, seed=0):
+    rng = random.Random(seed)
+    today = timezone.localdate()
+    statuses = ('pending', 'overdue', 'paid')
+    dues = []
+    for retailer in retailers:
+        for _ in range(per_retailer):
+            status = rng.choice(statuses)
+            amount = Decimal(rng.randint(100, 50000))
+            dues.append(DueEntry(
+                supplier=supplier,
+                retailer=retailer,
+                amount=amount,
+                amount_paid=amount if status == 'paid' else Decimal(0),
+                description='Benchmark purchase',
+                purchase_date=today - timedelta(days=rng.randint(0, 120)),
+                due_date=today + timedelta(days=rng.randint(-60, 60)),
+                status=status,
+                paid_at=timezone.now() if status == 'paid' else None
+            ))
+    return DueEntry.objects.bulk_create(dues, batch_size=2000)
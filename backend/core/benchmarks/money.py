@@ -0,0 +1,113 @@
+from django.db import connection, models
+from django.db.models import F
+from django.db.models.expressions import Col
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from core import views
+from core.models import DueEntry
+
+from . import benchmark, timed
+from .fixtures import make_dues, make_profile, make_retailers
+
+# Same dues in both representations, in tables of the same shape.
+TABLES = {
+    'integer': ('bench_integer_due', 'bigint', '{column}'),
+    'decimal': ('bench_decimal_due', 'numeric(12, 2)', '{column} / 100.0'),
+}
+
+
+def _group_sums(table, supplier_id, convert):
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'SELECT retailer_id, SUM(amount - amount_paid) FROM {table}'
+            ' WHERE supplier_id = %s GROUP BY retailer_id',
+            [supplier_id]
+        )
+        return {retailer_id: convert(total) for retailer_id, total in cursor.fetchall()}
+
+
+def _fetch(table, supplier_id, convert):
+    with connection.cursor() as cursor:
+        cursor.execute(f'SELECT amount, amount_paid FROM {table} WHERE supplier_id = %s', [supplier_id])
+        return [(convert(amount), convert(paid)) for amount, paid in cursor.fetchall()]
+
+
+def _decimal_converter():
+    # How a DecimalField column used to be read back on this backend.
+    expression = Col(TABLES['decimal'][0], models.DecimalField(max_digits=12, decimal_places=2))
+    converters = connection.ops.get_db_converters(expression)
+
+    def convert(value):
+        for converter in converters:
+            value = converter(value, expression, connection)
+        return value
+    return convert
+
+
+@benchmark('money')
+def money(rows=20000, repeat=5):
+    """
+    Integer paise columns against the decimal columns they replaced.
+
+    The dues are copied into two temporary tables of the same shape, one
+    with ``bigint`` paise read through ``MoneyField`` and one with
+    ``numeric(12, 2)`` read through the backend's decimal converter, as
+    ``DecimalField`` columns were. ``group_sum`` is the per-retailer balance aggregate behind
+    the risk rows and the aging report, ``fetch`` loads every amount, and
+    ``dashboard`` times the supplier dashboard endpoint on the live schema.
+    """
+    supplier = make_profile('supplier', 'bench-supplier')
+    retailers = make_retailers(max(rows // 100, 1))
+    make_dues(supplier, retailers, 100)
+    # Give the fixture amounts paise; the literal is in minor units.
+    DueEntry.objects.filter(supplier=supplier).update(amount=F('amount') + 29)
+
+    with connection.cursor() as cursor:
+        for table, column_type, select in TABLES.values():
+            cursor.execute(
+                f'CREATE TEMPORARY TABLE {table} (id integer PRIMARY KEY, supplier_id integer NOT NULL,'
+                f' retailer_id integer NOT NULL, amount {column_type} NOT NULL, amount_paid {column_type} NOT NULL)'
+            )
+            cursor.execute(
+                f'INSERT INTO {table} SELECT id, supplier_id, retailer_id,'
+                f' {select.format(column="amount")}, {select.format(column="amount_paid")}'
+                f' FROM {DueEntry._meta.db_table} WHERE supplier_id = %s',
+                [supplier.id]
+            )
+    try:
+        money_field = DueEntry._meta.get_field('amount')
+        converters = {
+            'integer': lambda value: money_field.from_db_value(value, None, connection),
+            'decimal': _decimal_converter(),
+        }
+
+        results = {'rows': DueEntry.objects.filter(supplier=supplier).count()}
+        cases = (
+            ('group_sum', _group_sums),
+            ('fetch', _fetch),
+        )
+        for label, query in cases:
+            outputs, seconds = {}, {}
+            for kind, (table, _, _) in TABLES.items():
+                def run(table=table, convert=converters[kind]):
+                    return query(table, supplier.id, convert)
+                seconds[kind] = timed(run, repeat)
+                outputs[kind] = run()
+            results[f'{label}_identical'] = outputs['integer'] == outputs['decimal']
+            results[f'{label}_integer_ms'] = round(seconds['integer'] * 1000, 2)
+            results[f'{label}_decimal_ms'] = round(seconds['decimal'] * 1000, 2)
+            results[f'{label}_speedup'] = round(seconds['decimal'] / seconds['integer'], 1)
+    finally:
+        with connection.cursor() as cursor:
+            for table, _, _ in TABLES.values():
+                cursor.execute(f'DROP TABLE {table}')
+
+    factory = APIRequestFactory()
+
+    def dashboard():
+        request = factory.get('/api/dashboard/stats/')
+        force_authenticate(request, user=supplier.user)
+        return views.get_dashboard_stats(request)
+
+    results['dashboard_ms'] = round(timed(dashboard, repeat) * 1000, 2)
+    return results
@@ -0,0 +1,74 @@
+import time
+
+from asgiref.sync import async_to_sync
+from channels.layers import InMemoryChannelLayer
+
+from core import outbox
+from core.models import OutboxEvent
+
+from . import benchmark
+from .fixtures import make_retailers
+
+
+@benchmark('outbox')
+def outbox_relay(events=20000, recipients=200, batch_size=None):
+    """
+    Relay throughput from the outbox table to an in-memory channel layer.
+
+    Every recipient has one subscribed channel, so each message is really
+    queued; the benchmark checks that every event arrived in order.
+    """
+    profiles = make_retailers(recipients, prefix='bench-outbox')
+    OutboxEvent.objects.bulk_create(
+        (
+            OutboxEvent(recipient=profiles[i % recipients].id, event_type='due_updated', payload={'id': i, 'status': 'pending'})
+            for i in range(events)
+        ),
+        batch_size=5000
+    )
+    layer = InMemoryChannelLayer(capacity=events)
+    channels = {}
+
+    async def subscribe():
+        for profile in profiles:
+            channel = await layer.new_channel()
+            await layer.group_add(f'user_{profile.user_id}', channel)
+            channels[profile.user_id] = channel
+
+    async def drain_all():
+        published = 0
+        while True:
+            count = await relay.drain()
+            if not count:
+                return published
+            published += count
+
+    async def receive_all(channel):
+        received = []
+        queue = layer.channels.get(channel)
+        while queue is not None and not queue.empty():
+            message = await layer.receive(channel)
+            received.extend(event['id'] for event in message['events'])
+        return received
+
+    async_to_sync(subscribe)()
+    relay = outbox.Relay(batch_size=batch_size, channel_layer=layer)
+    start = time.perf_counter()
+    published = async_to_sync(drain_all)()
+    elapsed = time.perf_counter() - start
+
+    in_order = True
+    delivered = 0
+    for channel in channels.values():
+        ids = async_to_sync(receive_all)(channel)
+        delivered += len(ids)
+        in_order = in_order and ids == sorted(ids)
+    return {
+        'events': events,
+        'recipients': recipients,
+        'published': published,
+        'delivered': delivered,
+        'in_order': in_order,
+        'remaining': OutboxEvent.objects.filter(recipient__in=[p.id for p in profiles]).count(),
+        'events_per_sec': round(published / elapsed),
+    }
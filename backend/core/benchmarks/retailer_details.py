@@ -0,0 +1,39 @@
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from core import views
+
+from . import benchmark, timed
+from .fixtures import make_dues, make_profile, make_retailers
+
+
+@benchmark('retailer_details')
+def retailer_details(retailers=50, dues_per_retailer=20, repeat=5):
+    """One /retailers/<id>/ call per retailer against one /retailers/details/ call."""
+    supplier = make_profile('supplier', 'bench-supplier')
+    profiles = make_retailers(retailers)
+    make_dues(supplier, profiles, dues_per_retailer)
+    ids = [profile.id for profile in profiles]
+    factory = APIRequestFactory()
+
+    def one_by_one():
+        for retailer_id in ids:
+            request = factory.get(f'/api/retailers/{retailer_id}/')
+            force_authenticate(request, user=supplier.user)
+            views.get_retailer_details(request, retailer_id=retailer_id)
+
+    def batched():
+        request = factory.get('/api/retailers/details/', {'ids': ','.join(map(str, ids))})
+        force_authenticate(request, user=supplier.user)
+        views.get_retailer_details_batch(request)
+
+    results = {'retailers': retailers, 'dues_per_retailer': dues_per_retailer}
+    for label, func in (('single', one_by_one), ('batch', batched)):
+        with CaptureQueriesContext(connection) as queries:
+            func()
+        results[f'{label}_requests'] = retailers if label == 'single' else 1
+        results[f'{label}_queries'] = len(queries)
+        results[f'{label}_ms'] = round(timed(func, repeat) * 1000, 2)
+    results['speedup'] = round(results['single_ms'] / results['batch_ms'], 1)
+    return results
@@ -0,0 +1,96 @@
+from rest_framework.renderers import JSONRenderer
+
+from core.models import DueEntry, RetailerProfile, Transaction, UserProfile
+from core.renderers import ORJSONRenderer
+from core.serializers import (
+    DueEntrySerializer, RetailerProfileSerializer, TransactionSerializer, UserProfileSerializer,
+    due_entry_rows, transaction_rows, user_profile_rows
+)
+
+from . import benchmark, timed, timings
+from .fixtures import make_dues, make_profile, make_retailers
+
+
+@benchmark('serialization')
+def serialization(rows=10000, repeat=5):
+    """
+    DRF ModelSerializer + JSONRenderer against the values() fast path + orjson.
+
+    The DRF side is given ``select_related`` so both sides run one query and
+    the comparison is of serialization cost alone; the list endpoints used to
+    run without it and paid a query per related row on top.
+    """
+    supplier = make_profile('supplier', 'bench-supplier')
+    retailers = make_retailers(max(rows // 100, 1))
+    make_dues(supplier, retailers, 100)
+    Transaction.objects.bulk_create(
+        Transaction(supplier=supplier, retailer=due.retailer, amount=due.amount,
+                    description='Benchmark sale', due_date=due.created_at)
+        for due in DueEntry.objects.filter(supplier=supplier)[:rows]
+    )
+
+    cases = (
+        ('dues', DueEntrySerializer, due_entry_rows,
+         DueEntry.objects.filter(supplier=supplier).select_related('supplier', 'retailer').order_by('id')),
+        ('transactions', TransactionSerializer, transaction_rows,
+         Transaction.objects.filter(supplier=supplier).select_related('supplier', 'retailer').order_by('id')),
+        ('user_profiles', UserProfileSerializer, user_profile_rows,
+         UserProfile.objects.select_related('user').order_by('id')),
+    )
+    results = {}
+    for label, serializer_class, fast, queryset in cases:
+        count = queryset.count()
+
+        def drf():
+            return JSONRenderer().render(serializer_class(queryset.all(), many=True).data)
+
+        def fast_path():
+            return ORJSONRenderer().render(fast.rows(queryset.all()))
+
+        slow_seconds = timed(drf, repeat)
+        fast_seconds = timed(fast_path, repeat)
+        results[f'{label}_rows'] = count
+        results[f'{label}_identical'] = drf() == fast_path()
+        results[f'{label}_drf_rows_per_sec'] = round(count / slow_seconds)
+        results[f'{label}_fast_rows_per_sec'] = round(count / fast_seconds)
+        results[f'{label}_speedup'] = round(slow_seconds / fast_seconds, 1)
+    return results
+
+
+@benchmark('serializers')
+def serializers(sizes=(1000, 10000), repeat=None, warmup=None):
+    """
+    ``DueEntrySerializer``, ``TransactionSerializer`` and
+    ``RetailerProfileSerializer`` over lists of each size.
+
+    The rows are loaded once with their related rows, so only serialization
+    is timed.
+    """
+    largest = max(sizes)
+    supplier = make_profile('supplier', 'bench-supplier')
+    retailers = make_retailers(largest)
+    make_dues(supplier, retailers[:max(largest // 100, 1)], 100)
+    Transaction.objects.bulk_create(
+        Transaction(supplier=supplier, retailer=due.retailer, amount=due.amount,
+                    description='Benchmark sale', due_date=due.created_at)
+        for due in DueEntry.objects.filter(supplier=supplier).order_by('id')[:largest]
+    )
+
+    cases = (
+        ('dues', DueEntrySerializer,
+         DueEntry.objects.filter(supplier=supplier).select_related('supplier', 'retailer').order_by('id')),
+        ('transactions', TransactionSerializer,
+         Transaction.objects.filter(supplier=supplier).select_related('supplier', 'retailer').order_by('id')),
+        ('retailer_profiles', RetailerProfileSerializer,
+         RetailerProfile.objects.filter(user_profile__in=retailers).select_related('user_profile').order_by('id')),
+    )
+    results = {}
+    for label, serializer_class, queryset in cases:
+        objects = list(queryset[:largest])
+        for size in sizes:
+            rows = objects[:size]
+            results[f'{label}_{size}_rows'] = len(rows)
+            results.update(timings(
+                f'{label}_{size}', lambda: serializer_class(rows, many=True).data, repeat, warmup
+            ))
+    return results
@@ -0,0 +1,105 @@
+"""
+Per-profile change feed for delta sync.
+
+Every write to a due, transaction or payment appends one ``ChangeLogEntry``
+per profile the object belongs to, in the same transaction as the write.
+A client keeps the id of the last entry it has seen as its sync token; a sync
+reads that profile's entries after the token through the
+``(recipient, id)`` index, so its cost depends on the number of changes and
+not on the size of the ledger. Deletes are kept as tombstones until the
+entries are pruned, after which clients with an older token are told to
+reload in full.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from .models import ChangeLogEntry, DueEntry, Payment, Transaction
+from .serializers import due_entry_rows, payment_rows, transaction_rows
+
+# kind -> (response key, queryset, fast serializer)
+KINDS = {
+    'due': ('dues', DueEntry.objects.all(), due_entry_rows),
+    'transaction': ('transactions', Transaction.objects.all(), transaction_rows),
+    'payment': ('payments', Payment.objects.all(), payment_rows),
+}
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def record(kind, object_id, recipients, deleted=False):
+    """Append a change of ``kind``/``object_id`` for every profile in ``recipients``."""
+    ChangeLogEntry.objects.bulk_create(
+        ChangeLogEntry(recipient=recipient, kind=kind, object_id=object_id, deleted=deleted)
+        for recipient in {recipient for recipient in recipients if recipient is not None}
+    )
+
+
+def record_many(changes):
+    """Append several ``(kind, object_id, recipients, deleted)`` changes at once."""
+    ChangeLogEntry.objects.bulk_create(
+        ChangeLogEntry(recipient=recipient, kind=kind, object_id=object_id, deleted=deleted)
+        for kind, object_id, recipients, deleted in changes
+        for recipient in {recipient for recipient in recipients if recipient is not None}
+    )
+
+
+def head():
+    """The current sync token: the id of the newest entry."""
+    return ChangeLogEntry.objects.order_by('-id').values_list('id', flat=True).first() or 0
+
+
+def changes_since(profile_id, since, limit=None):
+    """
+    Changes visible to ``profile_id`` after the token ``since``.
+
+    Several changes to one object collapse into its current state, or a
+    tombstone if it is gone. ``more`` is set when the page was cut short by
+    ``limit``.
+    """
+    limit = limit or _setting('SYNC_PAGE_SIZE', 1000)
+    oldest = ChangeLogEntry.objects.order_by('id').values_list('id', flat=True).first()
+    if oldest is not None and since < oldest - 1:
+        return {'reset': True, 'token': head(), 'more': False}
+
+    entries = ChangeLogEntry.objects.filter(recipient=profile_id, id__gt=since)
+    settle = _setting('SYNC_SETTLE_SECONDS', 0)
+    if settle:
+        entries = entries.filter(created_at__lte=timezone.now() - timedelta(seconds=settle))
+    entries = list(entries.order_by('id').values_list('id', 'kind', 'object_id', 'deleted')[:limit + 1])
+    more = len(entries) > limit
+    entries = entries[:limit]
+
+    latest = {}
+    for _, kind, object_id, deleted in entries:
+        latest[kind, object_id] = deleted
+
+    result = {'reset': False, 'token': entries[-1][0] if entries else since, 'more': more}
+    for kind, (key, queryset, fast) in KINDS.items():
+        changed = [object_id for (k, object_id), deleted in latest.items() if k == kind and not deleted]
+        rows = fast.rows(queryset.filter(id__in=changed).order_by('id')) if changed else []
+        found = {row['id'] for row in rows}
+        result[key] = rows
+        result[f'deleted_{key}'] = sorted(
+            object_id for (k, object_id), deleted in latest.items()
+            if k == kind and (deleted or object_id not in found)
+        )
+    return result
+
+
+def prune(older_than_days=None):
+    """
+    Drop entries past the retention period; returns the number removed.
+
+    The newest entry is always kept so tokens older than the retained entries
+    can still be recognised and answered with a reset.
+    """
+    days = older_than_days if older_than_days is not None else _setting('SYNC_RETENTION_DAYS', 30)
+    deleted, _ = ChangeLogEntry.objects.filter(
+        created_at__lt=timezone.now() - timedelta(days=days),
+        id__lt=head()
+    ).delete()
+    return deleted
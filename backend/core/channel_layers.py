@@ -0,0 +1,362 @@
+"""
+Channel layer shared by the processes of one host, without a broker.
+
+Messages and group memberships live in an SQLite database in WAL mode that
+every worker opens, so a ``group_send`` from one daphne worker reaches
+consumers connected to another. Each layer instance talks to SQLite from a
+single background thread, so the event loop never blocks on the database.
+
+Process-specific channels (``specific.<process>!<id>``) are read by one
+reader task per process, which claims every pending message for the
+process in one ``DELETE ... RETURNING`` and hands them to the local
+receivers. A message sent to a channel of the sending process skips the
+database. Ordinary named channels are claimed one message at a time, so
+several processes can share them. Idle readers back off from
+``poll_interval`` to ``max_poll_interval``.
+
+Messages expire after ``expiry`` seconds and group memberships after
+``group_expiry``. ``send`` raises ``ChannelFull`` once a channel holds
+``capacity`` messages (or the ``channel_capacity`` match for its name);
+``group_send`` skips full channels.
+
+Configure with::
+
+    CHANNEL_LAYERS = {
+        'default': {
+            'BACKEND': 'core.channel_layers.SQLiteChannelLayer',
+            'CONFIG': {'path': BASE_DIR / 'channels.sqlite3'},
+        },
+    }
+"""
+import asyncio
+import logging
+import random
+import sqlite3
+import string
+import threading
+import time
+import uuid
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import msgpack
+from channels.exceptions import ChannelFull
+from channels.layers import BaseChannelLayer
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = (
+    'CREATE TABLE IF NOT EXISTS channel_messages ('
+    ' id INTEGER PRIMARY KEY AUTOINCREMENT,'
+    ' channel TEXT NOT NULL,'
+    ' inbox TEXT NOT NULL,'
+    ' expires REAL NOT NULL,'
+    ' body BLOB NOT NULL)',
+    'CREATE INDEX IF NOT EXISTS channel_messages_inbox ON channel_messages (inbox, id)',
+    'CREATE INDEX IF NOT EXISTS channel_messages_channel ON channel_messages (channel, expires)',
+    'CREATE TABLE IF NOT EXISTS channel_groups ('
+    ' name TEXT NOT NULL,'
+    ' channel TEXT NOT NULL,'
+    ' expires REAL NOT NULL,'
+    ' PRIMARY KEY (name, channel))',
+)
+
+
+def _pack(message):
+    return msgpack.packb(message, use_bin_type=True)
+
+
+def _unpack(body):
+    return msgpack.unpackb(body, raw=False)
+
+
+class SQLiteChannelLayer(BaseChannelLayer):
+
+    extensions = ['groups', 'flush']
+
+    def __init__(self, path, expiry=60, group_expiry=86400, capacity=100, channel_capacity=None,
+                 poll_interval=0.001, max_poll_interval=0.05, read_batch=1000, clean_interval=30):
+        super().__init__(expiry=expiry, capacity=capacity, channel_capacity=channel_capacity)
+        self.channel_capacity = self.compile_capacities(self.channel_capacity)
+        self.path = str(path)
+        self.group_expiry = group_expiry
+        self.poll_interval = poll_interval
+        self.max_poll_interval = max_poll_interval
+        self.read_batch = read_batch
+        self.clean_interval = clean_interval
+        self.client_prefix = uuid.uuid4().hex[:12]
+
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='sqlite-channel-layer')
+        self._local = threading.local()
+        self._next_clean = 0.0
+        # Messages for this process's specific channels, and the receivers
+        # waiting on them.
+        self._pending = {}
+        self._waiters = {}
+        self._inboxes = set()
+        self._reader = None
+        self._reader_loop = None
+        self._reader_ready = False
+
+    # Database side, run on the layer's thread --------------------------------
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            for statement in SCHEMA:
+                connection.execute(statement)
+            self._local.connection = connection
+        return connection
+
+    async def _db(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+
+    def _insert(self, channels, body, expires):
+        """Store ``body`` on each of ``channels`` that has room; returns the full ones."""
+        connection = self._connection()
+        now = time.time()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            # Counting stops at the capacity, so a backlog does not make
+            # every send slower.
+            full = []
+            for channel in channels:
+                capacity = self.get_capacity(channel)
+                (count,) = connection.execute(
+                    'SELECT COUNT(*) FROM (SELECT 1 FROM channel_messages'
+                    ' WHERE channel = ? AND expires > ? LIMIT ?)',
+                    (channel, now, capacity)
+                ).fetchone()
+                if count >= capacity:
+                    full.append(channel)
+            connection.executemany(
+                'INSERT INTO channel_messages (channel, inbox, expires, body) VALUES (?, ?, ?, ?)',
+                [
+                    (channel, self.non_local_name(channel), expires, body)
+                    for channel in channels if channel not in full
+                ]
+            )
+            connection.execute('COMMIT')
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        self._clean(now)
+        return full
+
+    def _claim(self, channel):
+        """Take the oldest live message on an ordinary channel, if any."""
+        row = self._connection().execute(
+            'DELETE FROM channel_messages WHERE id = ('
+            ' SELECT id FROM channel_messages WHERE inbox = ? AND channel = ? AND expires > ?'
+            ' ORDER BY id LIMIT 1) RETURNING body',
+            (channel, channel, time.time())
+        ).fetchone()
+        return row[0] if row else None
+
+    def _claim_inbox(self, inboxes):
+        """Take every pending message for this process's specific channels, oldest first."""
+        connection = self._connection()
+        rows = []
+        for inbox in inboxes:
+            rows.extend(connection.execute(
+                'DELETE FROM channel_messages WHERE id IN ('
+                ' SELECT id FROM channel_messages WHERE inbox = ? ORDER BY id LIMIT ?)'
+                ' RETURNING id, channel, expires, body',
+                (inbox, self.read_batch)
+            ).fetchall())
+        rows.sort()
+        self._clean(time.time())
+        return rows
+
+    def _members(self, group):
+        return [
+            channel for (channel,) in self._connection().execute(
+                'SELECT channel FROM channel_groups WHERE name = ? AND expires > ?', (group, time.time())
+            )
+        ]
+
+    def _group_add(self, group, channel):
+        self._connection().execute(
+            'INSERT OR REPLACE INTO channel_groups (name, channel, expires) VALUES (?, ?, ?)',
+            (group, channel, time.time() + self.group_expiry)
+        )
+
+    def _group_discard(self, group, channel):
+        self._connection().execute(
+            'DELETE FROM channel_groups WHERE name = ? AND channel = ?', (group, channel)
+        )
+
+    def _clean(self, now):
+        if now < self._next_clean:
+            return
+        self._next_clean = now + self.clean_interval
+        connection = self._connection()
+        connection.execute('DELETE FROM channel_messages WHERE expires <= ?', (now,))
+        connection.execute('DELETE FROM channel_groups WHERE expires <= ?', (now,))
+
+    def _flush(self):
+        connection = self._connection()
+        connection.execute('DELETE FROM channel_messages')
+        connection.execute('DELETE FROM channel_groups')
+
+    # Local delivery -----------------------------------------------------------
+
+    def _is_local(self, channel):
+        return f'.{self.client_prefix}!' in channel
+
+    def _pending_for(self, channel):
+        pending = self._pending.get(channel)
+        if pending is None:
+            pending = self._pending[channel] = deque()
+            self._inboxes.add(self.non_local_name(channel))
+        return pending
+
+    def _put(self, channel, expires, body):
+        self._pending_for(channel).append((expires, body))
+        waiter = self._waiters.pop(channel, None)
+        if waiter is not None and not waiter.done():
+            waiter.set_result(None)
+
+    def _deliver_locally(self, channel):
+        """Whether a send to ``channel`` can go straight to its local queue."""
+        return (
+            self._reader_ready
+            and self._is_local(channel)
+            and self._reader_loop is asyncio.get_running_loop()
+        )
+
+    def _ensure_reader(self):
+        loop = asyncio.get_running_loop()
+        if self._reader is not None and not self._reader.done() and self._reader_loop is loop:
+            return
+        if self._reader is not None and not self._reader.done() and not self._reader_loop.is_closed():
+            self._reader_loop.call_soon_threadsafe(self._reader.cancel)
+        self._reader_ready = False
+        self._reader_loop = loop
+        self._reader = loop.create_task(self._read_inbox())
+
+    def _expire_local(self, now):
+        # Drop expired messages, and the queues of channels nobody is
+        # receiving from any more once they are empty.
+        for channel, pending in list(self._pending.items()):
+            while pending and pending[0][0] <= now:
+                pending.popleft()
+            if not pending and channel not in self._waiters:
+                del self._pending[channel]
+
+    async def _read_inbox(self):
+        delay = self.poll_interval
+        next_expire = 0.0
+        while True:
+            try:
+                rows = await self._db(self._claim_inbox, list(self._inboxes))
+            except Exception:
+                logger.exception('Channel layer inbox read failed')
+                rows = []
+            self._reader_ready = True
+            now = time.time()
+            for _, channel, expires, body in rows:
+                if expires > now:
+                    self._put(channel, expires, body)
+            if now >= next_expire:
+                self._expire_local(now)
+                next_expire = now + self.clean_interval
+            if rows:
+                delay = self.poll_interval
+            else:
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, self.max_poll_interval)
+
+    # Channel layer API --------------------------------------------------------
+
+    async def send(self, channel, message):
+        assert isinstance(message, dict), 'message is not a dict'
+        assert self.valid_channel_name(channel), 'Channel name not valid'
+        assert '__asgi_channel__' not in message
+
+        body = _pack(message)
+        expires = time.time() + self.expiry
+        if self._deliver_locally(channel):
+            if len(self._pending_for(channel)) >= self.get_capacity(channel):
+                raise ChannelFull(channel)
+            self._put(channel, expires, body)
+            return
+        if await self._db(self._insert, [channel], body, expires):
+            raise ChannelFull(channel)
+
+    async def receive(self, channel):
+        assert self.valid_channel_name(channel), 'Channel name not valid'
+        if self._is_local(channel):
+            self._ensure_reader()
+            while True:
+                pending = self._pending_for(channel)
+                while pending:
+                    expires, body = pending.popleft()
+                    if expires > time.time():
+                        return _unpack(body)
+                waiter = self._waiters.get(channel)
+                if waiter is None or waiter.done():
+                    waiter = self._waiters[channel] = asyncio.get_running_loop().create_future()
+                try:
+                    await waiter
+                finally:
+                    if self._waiters.get(channel) is waiter and waiter.done():
+                        del self._waiters[channel]
+
+        delay = self.poll_interval
+        while True:
+            body = await self._db(self._claim, channel)
+            if body is not None:
+                return _unpack(body)
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, self.max_poll_interval)
+
+    async def new_channel(self, prefix='specific'):
+        suffix = ''.join(random.choice(string.ascii_letters) for _ in range(12))
+        channel = f'{prefix}.{self.client_prefix}!{suffix}'
+        self._pending_for(channel)
+        return channel
+
+    # Groups extension
+
+    async def group_add(self, group, channel):
+        assert self.valid_group_name(group), 'Group name not valid'
+        assert self.valid_channel_name(channel), 'Channel name not valid'
+        await self._db(self._group_add, group, channel)
+
+    async def group_discard(self, group, channel):
+        assert self.valid_group_name(group), 'Group name not valid'
+        assert self.valid_channel_name(channel), 'Channel name not valid'
+        await self._db(self._group_discard, group, channel)
+
+    async def group_send(self, group, message):
+        assert isinstance(message, dict), 'message is not a dict'
+        assert self.valid_group_name(group), 'Group name not valid'
+        members = await self._db(self._members, group)
+        if not members:
+            return
+        body = _pack(message)
+        expires = time.time() + self.expiry
+        remote = []
+        for channel in members:
+            if self._deliver_locally(channel):
+                if len(self._pending_for(channel)) < self.get_capacity(channel):
+                    self._put(channel, expires, body)
+            else:
+                remote.append(channel)
+        if remote:
+            await self._db(self._insert, remote, body, expires)
+
+    # Flush extension
+
+    async def flush(self):
+        await self._db(self._flush)
+        self._pending.clear()
+
+    async def close(self):
+        if self._reader is not None and not self._reader.done():
+            self._reader.cancel()
+        self._reader = None
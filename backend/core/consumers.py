@@ -1,83 +1,193 @@
+"""
+Real-time updates over WebSocket.
+
+The consumer takes the user from the authenticated scope (session cookie or
+``?ticket=``, see ``core.ws_auth``) and joins only that user's groups;
+clients cannot choose what to subscribe to. Events reach clients from the
+server side, through the outbox relay and reminder dispatcher.
+
+Each connection has a bounded outbound queue drained by its own writer. A
+client that falls ``WS_SEND_QUEUE_SIZE`` messages behind, or that takes
+longer than ``WS_SEND_TIMEOUT`` to accept one, is disconnected; it reloads
+through delta sync when it reconnects. A user may hold
+``WS_MAX_CONNECTIONS_PER_USER`` sockets per worker; a newer one replaces the
+oldest. One sweeper per worker pings every connection each
+``WS_HEARTBEAT_INTERVAL`` and closes those silent for ``WS_IDLE_TIMEOUT``,
+which reclaims dead sockets without a timer per connection.
+"""
+import asyncio
 import json
-from channels.generic.websocket import AsyncWebsocketConsumer
+import logging
+import time
+from collections import OrderedDict, defaultdict
+
 from channels.db import database_sync_to_async
-from django.contrib.auth.models import User
+from channels.generic.websocket import AsyncWebsocketConsumer
+from django.conf import settings
+
+from .models import UserProfile
+
+logger = logging.getLogger(__name__)
+
+CLOSE_UNAUTHENTICATED = 4401
+CLOSE_SLOW_CONSUMER = 4408
+CLOSE_REPLACED = 4409
+CLOSE_IDLE = 4410
+CLOSE_OVERLOADED = 1013  # try again later
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+class ConnectionRegistry:
+    """The open connections of this worker, by user, plus the heartbeat sweeper."""
+
+    def __init__(self):
+        self.by_user = defaultdict(OrderedDict)  # user id -> consumers, oldest first
+        self.count = 0
+        self._sweeper = None
+
+    def add(self, consumer):
+        """Register ``consumer``; returns the connections it displaces."""
+        connections = self.by_user[consumer.user_id]
+        connections[consumer] = None
+        self.count += 1
+        self._ensure_sweeper()
+        limit = _setting('WS_MAX_CONNECTIONS_PER_USER', 5)
+        return list(connections)[:max(len(connections) - limit, 0)]
+
+    def remove(self, consumer):
+        connections = self.by_user.get(consumer.user_id)
+        if connections is not None and consumer in connections:
+            del connections[consumer]
+            self.count -= 1
+            if not connections:
+                del self.by_user[consumer.user_id]
+
+    def _ensure_sweeper(self):
+        if self._sweeper is None or self._sweeper.done():
+            self._sweeper = asyncio.get_running_loop().create_task(self._sweep())
+
+    async def _sweep(self):
+        while self.count:
+            await asyncio.sleep(_setting('WS_HEARTBEAT_INTERVAL', 30))
+            idle_timeout = _setting('WS_IDLE_TIMEOUT', 75)
+            now = time.monotonic()
+            for connections in list(self.by_user.values()):
+                for consumer in list(connections):
+                    if now - consumer.last_seen > idle_timeout:
+                        await consumer.evict(CLOSE_IDLE)
+                    else:
+                        consumer.push({'type': 'ping'})
+
+
+registry = ConnectionRegistry()
+
 
 class UpdatesConsumer(AsyncWebsocketConsumer):
+    user_id = None
+    closing = False
+
     async def connect(self):
-        user_id = self.scope['url_route']['kwargs']['user_id']
-        user_type = self.scope['url_route']['kwargs']['user_type']
-        
-        self.user_group = f"user_{user_id}"
-        self.user_type_group = f"type_{user_type}"
-
-        # Join user-specific group
-        await self.channel_layer.group_add(
-            self.user_group,
-            self.channel_name
-        )
-
-        # Join user-type group
-        await self.channel_layer.group_add(
-            self.user_type_group,
-            self.channel_name
-        )
+        user = self.scope.get('user')
+        if user is None or not user.is_authenticated:
+            await self.close(code=CLOSE_UNAUTHENTICATED)
+            return
+        if registry.count >= _setting('WS_MAX_CONNECTIONS', 20000):
+            await self.close(code=CLOSE_OVERLOADED)
+            return
+
+        user_type = await database_sync_to_async(
+            lambda: UserProfile.objects.filter(user=user).values_list('user_type', flat=True).first()
+        )()
+        if user_type is None:
+            await self.close(code=CLOSE_UNAUTHENTICATED)
+            return
 
+        self.user_id = user.pk
+        self.groups = [f'user_{user.pk}', f'type_{user_type}']
+        for group in self.groups:
+            await self.channel_layer.group_add(group, self.channel_name)
+
+        self.last_seen = time.monotonic()
+        self.outbound = asyncio.Queue(maxsize=_setting('WS_SEND_QUEUE_SIZE', 256))
         await self.accept()
+        self.writer = asyncio.get_running_loop().create_task(self._write())
+        for displaced in registry.add(self):
+            await displaced.evict(CLOSE_REPLACED)
 
     async def disconnect(self, close_code):
-        await self.channel_layer.group_discard(
-            self.user_group,
-            self.channel_name
-        )
-        await self.channel_layer.group_discard(
-            self.user_type_group,
-            self.channel_name
-        )
-
-    async def receive(self, text_data):
-        text_data_json = json.loads(text_data)
-        event_type = text_data_json['type']
-        data = text_data_json['data']
-
-        # Handle different event types
-        if event_type == 'due_created':
-            await self.channel_layer.group_send(
-                f"type_retailer",
-                {
-                    'type': 'due_created',
-                    'data': data
-                }
-            )
-        elif event_type == 'payment_made':
-            await self.channel_layer.group_send(
-                f"type_supplier",
-                {
-                    'type': 'payment_made',
-                    'data': data
-                }
-            )
+        # The base class leaves ``self.groups``.
+        if self.user_id is None:
+            return
+        registry.remove(self)
+        self.closing = True
+        self.writer.cancel()
+
+    async def receive(self, text_data=None, bytes_data=None):
+        # Any traffic proves the client is alive; clients only ever send
+        # heartbeats, events come from the server.
+        self.last_seen = time.monotonic()
+        try:
+            message = json.loads(text_data or '{}')
+        except ValueError:
+            return
+        if isinstance(message, dict) and message.get('type') == 'ping':
+            self.push({'type': 'pong'})
+
+    # Outbound -----------------------------------------------------------------
+
+    def push(self, payload):
+        """Queue ``payload`` for the client, evicting it if it has fallen too far behind."""
+        if self.closing:
+            return
+        try:
+            self.outbound.put_nowait(json.dumps(payload))
+        except asyncio.QueueFull:
+            logger.info('Evicting slow WebSocket consumer for user %s', self.user_id)
+            asyncio.get_running_loop().create_task(self.evict(CLOSE_SLOW_CONSUMER))
+
+    async def _write(self):
+        timeout = _setting('WS_SEND_TIMEOUT', 10)
+        while not self.closing:
+            text = await self.outbound.get()
+            if self.closing:
+                return
+            try:
+                await asyncio.wait_for(self.send(text_data=text), timeout)
+            except asyncio.TimeoutError:
+                await self.evict(CLOSE_SLOW_CONSUMER)
+                return
+
+    async def evict(self, code):
+        if self.closing:
+            return
+        self.closing = True
+        registry.remove(self)
+        if self.writer is not asyncio.current_task():
+            self.writer.cancel()
+        await self.close(code=code)
+
+    # Channel layer events -----------------------------------------------------
 
     async def due_created(self, event):
-        await self.send(text_data=json.dumps({
-            'type': 'due_created',
-            'data': event['data']
-        }))
+        self.push({'type': 'due_created', 'data': event['data']})
 
     async def due_updated(self, event):
-        await self.send(text_data=json.dumps({
-            'type': 'due_updated',
-            'data': event['data']
-        }))
+        self.push({'type': 'due_updated', 'data': event['data']})
 
     async def payment_made(self, event):
-        await self.send(text_data=json.dumps({
-            'type': 'payment_made',
-            'data': event['data']
-        }))
+        self.push({'type': 'payment_made', 'data': event['data']})
 
     async def credit_limit_updated(self, event):
-        await self.send(text_data=json.dumps({
-            'type': 'credit_limit_updated',
-            'data': event['data']
-        }))
\ No newline at end of file
+        self.push({'type': 'credit_limit_updated', 'data': event['data']})
+
+    async def payment_reminder(self, event):
+        self.push({'type': 'payment_reminder', 'data': event['data']})
+
+    async def outbox_events(self, event):
+        # Relayed from the outbox in order; ``id`` lets the client drop
+        # events it has already seen when a batch is delivered again.
+        for item in event['events']:
+            self.push(item)
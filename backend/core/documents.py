@@ -0,0 +1,256 @@
+"""
+Retailer document uploads and processing.
+
+Uploads are streamed to disk in fixed-size blocks, either as a single
+multipart request (Django's temporary-file upload handler) or as a resumable
+sequence of raw chunks against a ``DocumentUpload`` session. Once a file is
+complete, MIME sniffing, content hashing, image downscaling and thumbnailing
+run as a background job so the request thread never touches the content.
+"""
+import hashlib
+import logging
+import os
+from io import BytesIO
+
+import magic
+from PIL import Image
+from django.conf import settings
+from django.core.files import File
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+
+from . import bankstatements, jobs
+from .models import DOCUMENT_TYPE_CHOICES, Document, DocumentUpload
+
+logger = logging.getLogger(__name__)
+
+BLOCK_SIZE = 64 * 1024
+SNIFF_SIZE = 8 * 1024
+
+DOCUMENT_TYPES = {value for value, _ in DOCUMENT_TYPE_CHOICES}
+
+
+class UploadError(ValueError):
+    """Raised when an upload request cannot be accepted."""
+
+
+class UploadConflict(UploadError):
+    """Raised when a chunk does not start at the session's current offset."""
+
+
+def max_upload_size():
+    return getattr(settings, 'DOCUMENT_UPLOAD_MAX_SIZE', 100 * 1024 * 1024)
+
+
+def max_chunk_size():
+    return getattr(settings, 'DOCUMENT_UPLOAD_CHUNK_SIZE', 5 * 1024 * 1024)
+
+
+def allowed_mime_types():
+    return getattr(settings, 'DOCUMENT_ALLOWED_MIME_TYPES', ())
+
+
+def _temp_dir():
+    path = getattr(settings, 'DOCUMENT_UPLOAD_TEMP_DIR', None) or os.path.join(settings.MEDIA_ROOT, 'uploads')
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def part_path(upload):
+    return os.path.join(_temp_dir(), f'{upload.id}.part')
+
+
+# Uploads ------------------------------------------------------------------
+
+def start_upload(retailer, document_type, filename, total_size):
+    if document_type not in DOCUMENT_TYPES:
+        raise UploadError('Invalid document type')
+    try:
+        total_size = int(total_size)
+    except (TypeError, ValueError):
+        raise UploadError('Invalid file size')
+    if total_size <= 0 or total_size > max_upload_size():
+        raise UploadError('File size is outside the allowed range')
+
+    upload = DocumentUpload.objects.create(
+        retailer=retailer,
+        document_type=document_type,
+        filename=os.path.basename(filename or 'document'),
+        total_size=total_size
+    )
+    open(part_path(upload), 'wb').close()
+    return upload
+
+
+def write_chunk(upload, offset, length, stream):
+    """
+    Append ``length`` bytes read from ``stream`` at ``offset``.
+
+    Chunks must arrive in order; a client that lost track of its position
+    resumes from ``upload.received``. The body is copied in ``BLOCK_SIZE``
+    blocks so memory use does not depend on the chunk size.
+    """
+    if upload.status != 'uploading':
+        raise UploadError('Upload is no longer accepting data')
+    if offset != upload.received:
+        raise UploadConflict(f'Expected offset {upload.received}')
+    if length <= 0 or length > max_chunk_size():
+        raise UploadError('Chunk size is outside the allowed range')
+    if offset + length > upload.total_size:
+        raise UploadError('Chunk extends past the declared file size')
+
+    written = 0
+    with open(part_path(upload), 'r+b') as part:
+        part.seek(offset)
+        while written < length:
+            block = stream.read(min(BLOCK_SIZE, length - written))
+            if not block:
+                break
+            part.write(block)
+            written += len(block)
+        part.truncate(offset + written)
+
+    if written != length:
+        raise UploadError('Chunk body is shorter than declared')
+
+    # Compare-and-swap on the offset so concurrent writers cannot both win.
+    updated = DocumentUpload.objects.filter(
+        id=upload.id, received=offset, status='uploading'
+    ).update(received=offset + written)
+    if not updated:
+        raise UploadConflict('Upload was modified concurrently')
+    upload.received = offset + written
+
+    if upload.received == upload.total_size:
+        finish_upload(upload)
+    return upload
+
+
+class _PartFile(File):
+    """Lets FileSystemStorage move the part file into place instead of copying."""
+
+    def temporary_file_path(self):
+        return self.name
+
+
+def finish_upload(upload):
+    path = part_path(upload)
+    with transaction.atomic():
+        with open(path, 'rb') as part:
+            document = Document(
+                retailer=upload.retailer,
+                document_type=upload.document_type,
+                original_name=upload.filename,
+                size=upload.total_size,
+                status='processing'
+            )
+            document.file.save(upload.filename, _PartFile(part, name=path), save=False)
+            document.save()
+        upload.status = 'completed'
+        upload.document = document
+        upload.save(update_fields=['status', 'document', 'updated_at'])
+        schedule_processing(document.id)
+    if os.path.exists(path):
+        os.remove(path)
+    return document
+
+
+def create_document(retailer, document_type, uploaded_file):
+    """Store a file received through a regular multipart request."""
+    if document_type not in DOCUMENT_TYPES:
+        raise UploadError('Invalid document type')
+    if uploaded_file.size > max_upload_size():
+        raise UploadError('File size is outside the allowed range')
+
+    with transaction.atomic():
+        document = Document.objects.create(
+            retailer=retailer,
+            document_type=document_type,
+            file=uploaded_file,
+            original_name=os.path.basename(uploaded_file.name),
+            size=uploaded_file.size,
+            status='processing'
+        )
+        schedule_processing(document.id)
+    return document
+
+
+# Processing ---------------------------------------------------------------
+
+def schedule_processing(document_id):
+    """Queue a document for validation and processing by the job workers."""
+    return jobs.enqueue('documents.process', {'document_id': document_id}, priority=5)
+
+
+def process_document(document_id):
+    document = Document.objects.get(id=document_id)
+    try:
+        digest = hashlib.sha256()
+        size = 0
+        head = b''
+        with document.file.open('rb') as stored:
+            for block in stored.chunks(BLOCK_SIZE):
+                if len(head) < SNIFF_SIZE:
+                    head += block[:SNIFF_SIZE - len(head)]
+                digest.update(block)
+                size += len(block)
+
+        document.mime_type = magic.from_buffer(head, mime=True)
+        document.content_hash = digest.hexdigest()
+        document.size = size
+
+        if allowed_mime_types() and document.mime_type not in allowed_mime_types():
+            document.status = 'rejected'
+            document.processing_error = f'Unsupported file type: {document.mime_type}'
+        else:
+            if document.mime_type.startswith('image/'):
+                _process_image(document)
+            document.status = 'ready'
+            document.processing_error = ''
+    except Exception as e:
+        logger.exception('Failed to process document %s', document_id)
+        document.status = 'rejected'
+        document.processing_error = str(e)
+
+    document.save()
+    if document.document_type == 'bank_statement' and document.status == 'ready':
+        bankstatements.schedule_scoring(document.retailer_id)
+    return document
+
+
+def _process_image(document):
+    max_dimension = getattr(settings, 'DOCUMENT_IMAGE_MAX_DIMENSION', 2048)
+    thumbnail_size = getattr(settings, 'DOCUMENT_THUMBNAIL_SIZE', 256)
+
+    with document.file.open('rb') as stored:
+        image = Image.open(stored)
+        image_format = image.format or 'PNG'
+        # JPEG can decode straight to a reduced scale, which avoids
+        # materialising full-resolution scans just to shrink them.
+        image.draft('RGB', (max_dimension, max_dimension))
+        image.load()
+
+    if max(image.size) > max_dimension:
+        image.thumbnail((max_dimension, max_dimension))
+        original = document.file.name
+        document.file.save(
+            os.path.basename(original),
+            ContentFile(_encode(image, image_format)),
+            save=False
+        )
+        default_storage.delete(original)
+        document.size = document.file.size
+
+    thumbnail = image.copy()
+    thumbnail.thumbnail((thumbnail_size, thumbnail_size))
+    name = os.path.splitext(os.path.basename(document.file.name))[0]
+    document.thumbnail.save(f'{name}_thumb.jpg', ContentFile(_encode(thumbnail, 'JPEG')), save=False)
+
+
+def _encode(image, image_format):
+    if image_format == 'JPEG' and image.mode not in ('RGB', 'L'):
+        image = image.convert('RGB')
+    buffer = BytesIO()
+    image.save(buffer, format=image_format)
+    return buffer.getvalue()
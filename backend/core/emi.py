@@ -0,0 +1,240 @@
+"""
+EMI plan computation.
+
+Plans for every (principal, lender rate, tenure) combination are computed at
+once as NumPy arrays using the standard amortisation formula. Full
+month-by-month schedules are built on demand and memoised on
+``(principal, rate, tenure)``; activated schedules are stored as packed
+int64 paise arrays.
+"""
+from datetime import timedelta
+from decimal import Decimal
+from functools import lru_cache
+
+import numpy as np
+from django.conf import settings
+from django.utils import timezone
+
+from .allocation import BALANCE, OPEN_STATUSES
+from .models import DueEntry, EMIOffer, UserProfile
+
+PAISE = Decimal('0.01')
+OFFER_MAX_AGE = timedelta(days=1)
+
+
+def tenures():
+    return tuple(getattr(settings, 'EMI_TENURES', (3, 6, 9, 12, 18, 24)))
+
+
+def to_paise(amount):
+    return int((Decimal(str(amount)) / PAISE).to_integral_value())
+
+
+def from_paise(paise):
+    return (Decimal(int(paise)) * PAISE).quantize(PAISE)
+
+
+def compute_plans(principals, annual_rates, tenure_months):
+    """
+    Amortise every principal at every rate over every tenure.
+
+    ``principals`` are in paise, ``annual_rates`` in percent. Returns
+    ``(monthly, total)`` int64 paise arrays of shape
+    ``(len(principals), len(annual_rates), len(tenure_months))``. The last
+    instalment absorbs rounding, so ``total`` is what the borrower pays.
+    """
+    principal = np.asarray(principals, dtype=np.float64)[:, None, None]
+    rate = np.asarray(annual_rates, dtype=np.float64)[None, :, None] / 1200.0
+    n = np.asarray(tenure_months, dtype=np.float64)[None, None, :]
+
+    growth = (1.0 + rate) ** n
+    safe_rate = np.where(rate > 0, rate, 1.0)
+    monthly = np.where(
+        rate > 0,
+        principal * safe_rate * growth / np.where(rate > 0, growth - 1.0, 1.0),
+        principal / n
+    )
+    monthly = np.rint(monthly)
+
+    # Balance left before the final instalment, given the rounded payment.
+    growth_before_last = (1.0 + rate) ** (n - 1)
+    remaining = np.where(
+        rate > 0,
+        principal * growth_before_last - monthly * (growth_before_last - 1.0) / safe_rate,
+        principal - monthly * (n - 1)
+    )
+    last = np.rint(remaining * (1.0 + rate))
+    total = monthly * (n - 1) + last
+    return monthly.astype(np.int64), total.astype(np.int64)
+
+
+def plan_id(fintech_id, tenure):
+    return f'{fintech_id}-{tenure}'
+
+
+def parse_plan_id(value):
+    try:
+        fintech_id, tenure = value.split('-')
+        return int(fintech_id), int(tenure)
+    except (AttributeError, ValueError):
+        raise ValueError('Invalid plan id')
+
+
+def _plan_rows(principal_paise, lenders, months, monthly, total):
+    plans = []
+    for j, (fintech_id, rate) in enumerate(lenders):
+        for k, tenure in enumerate(months):
+            plans.append({
+                'id': plan_id(fintech_id, tenure),
+                'fintech': fintech_id,
+                'tenure_months': tenure,
+                'monthly_amount': str(from_paise(monthly[j, k])),
+                'interest_rate': str(Decimal(str(rate)).quantize(PAISE)),
+                'total_amount': str(from_paise(total[j, k])),
+                'total_interest': str(from_paise(total[j, k] - principal_paise)),
+            })
+    return plans
+
+
+def build_plans(principal_paise, lenders):
+    """Plans for one principal across ``lenders`` (``(fintech_id, rate)`` pairs)."""
+    if not lenders:
+        return []
+    months = tenures()
+    monthly, total = compute_plans([principal_paise], [float(rate) for _, rate in lenders], months)
+    return _plan_rows(principal_paise, lenders, months, monthly[0], total[0])
+
+
+@lru_cache(maxsize=4096)
+def amortization_schedule(principal_paise, annual_rate, tenure):
+    """
+    Month-by-month ``(principal, interest)`` paise pairs as a read-only array.
+
+    ``annual_rate`` should be a string so equal rates share a cache entry.
+    """
+    monthly, total = compute_plans([principal_paise], [float(annual_rate)], [tenure])
+    payment = int(monthly[0, 0, 0])
+    last = int(total[0, 0, 0]) - payment * (tenure - 1)
+    rate = float(annual_rate) / 1200.0
+
+    # Outstanding balance after each month, then rounded cumulative principal
+    # so the parts add up to the principal exactly.
+    months = np.arange(tenure + 1, dtype=np.float64)
+    if rate > 0:
+        growth = (1.0 + rate) ** months
+        balance = principal_paise * growth - payment * (growth - 1.0) / rate
+    else:
+        balance = principal_paise - payment * months
+    repaid = np.rint(principal_paise - balance).astype(np.int64)
+    repaid[-1] = principal_paise
+
+    payments = np.full(tenure, payment, dtype=np.int64)
+    payments[-1] = last
+    principal_parts = np.diff(repaid)
+    schedule = np.column_stack((principal_parts, payments - principal_parts))
+    schedule.setflags(write=False)
+    return schedule
+
+
+def pack_schedule(schedule):
+    return np.ascontiguousarray(schedule, dtype='<i8').tobytes()
+
+
+def unpack_schedule(data, tenure):
+    return np.frombuffer(bytes(data), dtype='<i8').reshape(tenure, 2)
+
+
+def schedule_rows(schedule):
+    balance = int(schedule[:, 0].sum())
+    rows = []
+    for month, (principal_part, interest) in enumerate(schedule.tolist(), start=1):
+        balance -= principal_part
+        rows.append({
+            'month': month,
+            'payment': str(from_paise(principal_part + interest)),
+            'principal': str(from_paise(principal_part)),
+            'interest': str(from_paise(interest)),
+            'balance': str(from_paise(balance)),
+        })
+    return rows
+
+
+# Precomputed offers --------------------------------------------------------
+
+def lenders_key(lenders):
+    return ','.join(f'{fintech_id}:{rate}' for fintech_id, rate in lenders)
+
+
+def cached_offers(due_id, balance_paise, lenders):
+    """Precomputed plans for a due, if still valid for its balance and lenders."""
+    offer = EMIOffer.objects.filter(
+        due_id=due_id, computed_at__gte=timezone.now() - OFFER_MAX_AGE
+    ).values('balance', 'lenders', 'plans').first()
+    if offer and offer['balance'] == balance_paise and offer['lenders'] == lenders_key(lenders):
+        return offer['plans']
+    return None
+
+
+def precompute_offers(dues, lenders, chunk_size=10000):
+    """
+    Compute and store plans for ``dues`` (``(due_id, balance_paise)`` pairs).
+
+    Dues are processed in chunks so the result array stays bounded. Offers
+    are rows rather than cache entries so every process sees them and none
+    are evicted before they expire.
+    """
+    if not lenders:
+        return 0
+    months = tenures()
+    rates = [float(rate) for _, rate in lenders]
+    key = lenders_key(lenders)
+    count = 0
+    for start in range(0, len(dues), chunk_size):
+        chunk = dues[start:start + chunk_size]
+        monthly, total = compute_plans([balance for _, balance in chunk], rates, months)
+        now = timezone.now()
+        EMIOffer.objects.bulk_create(
+            [
+                EMIOffer(
+                    due_id=due_id,
+                    balance=balance,
+                    lenders=key,
+                    plans=_plan_rows(balance, lenders, months, monthly[i], total[i]),
+                    computed_at=now
+                )
+                for i, (due_id, balance) in enumerate(chunk)
+            ],
+            batch_size=1000,
+            update_conflicts=True,
+            unique_fields=['due'],
+            update_fields=['balance', 'lenders', 'plans', 'computed_at']
+        )
+        count += len(chunk)
+    return count
+
+
+def active_lenders():
+    """``(fintech_id, rate)`` for every fintech that has set an interest rate."""
+    return [
+        (fintech_id, str(rate))
+        for fintech_id, rate in UserProfile.objects.filter(
+            user_type='fintech', interest_rate__isnull=False
+        ).order_by('id').values_list('id', 'interest_rate')
+    ]
+
+
+def precompute_open_dues(min_amount=None):
+    """Store offers for every open due whose balance is at least ``min_amount``."""
+    EMIOffer.objects.filter(computed_at__lt=timezone.now() - OFFER_MAX_AGE).delete()
+    if min_amount is None:
+        min_amount = getattr(settings, 'EMI_OFFER_MIN_AMOUNT', 5000)
+    dues = [
+        (due_id, to_paise(balance))
+        for due_id, balance in DueEntry.objects.filter(status__in=OPEN_STATUSES)
+        .annotate(balance=BALANCE)
+        .filter(balance__gte=min_amount)
+        .order_by('id')
+        .values_list('id', 'balance')
+        .iterator(chunk_size=10000)
+    ]
+    return precompute_offers(dues, active_lenders())
@@ -0,0 +1,182 @@
+"""
+Read-only fast path for list endpoints.
+
+``FastSerializer`` compiles a DRF ``ModelSerializer`` class once into a
+``values_list()`` projection and a converter per field, then maps rows
+straight from tuples. Model instances are never built and DRF's per-field
+machinery is not run; values are converted a column at a time. Each row has
+the same keys, order and representations as
+``serializer_class(instance).data``. Related attributes
+such as ``supplier.business_name`` become joins in the same query.
+
+Only the field types the repo's list serializers use are supported; anything
+else raises ``ImproperlyConfigured`` when the fast serializer is built, not
+when a request is served.
+"""
+import datetime
+import decimal
+from itertools import repeat
+
+from django.core.exceptions import ImproperlyConfigured
+from django.utils import timezone
+from rest_framework import fields as drf_fields
+from rest_framework import relations, serializers
+from rest_framework.settings import api_settings
+
+ISO_8601 = 'iso-8601'
+
+
+def _decimal_converter(field):
+    if not getattr(field, 'coerce_to_string', api_settings.COERCE_DECIMAL_TO_STRING) or field.localize:
+        raise ImproperlyConfigured(f'Unsupported decimal field {field.field_name!r}')
+    if field.decimal_places is None:
+        return lambda value: '{:f}'.format(value if isinstance(value, decimal.Decimal) else decimal.Decimal(str(value).strip()))
+
+    places = field.decimal_places
+    exponent = decimal.Decimal('.1') ** places
+    context = decimal.getcontext().copy()
+    if field.max_digits is not None:
+        context.prec = field.max_digits
+    rounding = field.rounding
+
+    def convert(value):
+        if value.__class__ is decimal.Decimal:
+            # Database values usually carry the field's scale already, in
+            # which case quantizing would not change them.
+            text = format(value, 'f')
+            point = text.rfind('.')
+            if (point == -1 and not places) or (point != -1 and len(text) - point - 1 == places):
+                return text
+        else:
+            value = decimal.Decimal(str(value).strip())
+        return '{:f}'.format(value.quantize(exponent, rounding=rounding, context=context))
+    return convert
+
+
+def _datetime_converter(field):
+    if getattr(field, 'format', api_settings.DATETIME_FORMAT) != ISO_8601 or hasattr(field, 'timezone'):
+        raise ImproperlyConfigured(f'Unsupported datetime field {field.field_name!r}')
+
+    def convert(value, tz):
+        # ``tz`` is None when the output timezone is UTC, which is what
+        # aware values read from the database are already in.
+        if tz is not None:
+            value = value.astimezone(tz)
+        value = value.isoformat()
+        if value.endswith('+00:00'):
+            value = value[:-6] + 'Z'
+        return value
+    return convert
+
+
+def _date_converter(field):
+    if getattr(field, 'format', api_settings.DATE_FORMAT) != ISO_8601:
+        raise ImproperlyConfigured(f'Unsupported date field {field.field_name!r}')
+    return datetime.date.isoformat
+
+
+def _none_safe(converter):
+    def convert(value, *args):
+        return None if value is None else converter(value, *args)
+    return convert
+
+
+# Field class -> converter factory. ``None`` means the database value is
+# already the representation.
+CONVERTERS = (
+    (drf_fields.DecimalField, _decimal_converter),
+    (drf_fields.DateTimeField, _datetime_converter),
+    (drf_fields.DateField, _date_converter),
+    (drf_fields.ChoiceField, None),
+    (drf_fields.CharField, lambda field: str),
+    (drf_fields.EmailField, lambda field: str),
+    (drf_fields.BooleanField, None),
+    (drf_fields.IntegerField, lambda field: int),
+    (drf_fields.FloatField, lambda field: float),
+    (drf_fields.JSONField, None),
+    (relations.PrimaryKeyRelatedField, None),
+)
+
+
+class FastSerializer:
+    """
+    Map ``values_list()`` rows to the output of ``serializer_class``.
+
+    ``annotations`` supplies expressions for fields whose source is not a
+    database column, such as a model property.
+    """
+
+    def __init__(self, serializer_class, annotations=None):
+        self.serializer_class = serializer_class
+        self.annotations = dict(annotations or {})
+        self.lookups = []
+        self.plan = self._compile(serializer_class(), '')
+
+    def _compile(self, serializer, prefix):
+        plan = []
+        for name, field in serializer.fields.items():
+            if field.write_only:
+                continue
+            if not field.source_attrs:
+                raise ImproperlyConfigured(f'Unsupported source for {name!r}')
+            lookup = prefix + '__'.join(field.source_attrs)
+            if isinstance(field, serializers.BaseSerializer):
+                if getattr(field, 'many', False):
+                    raise ImproperlyConfigured(f'Unsupported nested list {name!r}')
+                # The related row is absent when its primary key is null.
+                pk_index = self._add_lookup(lookup + '__pk')
+                plan.append((name, pk_index, 'nested', self._compile(field, lookup + '__')))
+                continue
+
+            plan.append((name, self._add_lookup(lookup), *self._converter(field)))
+        return plan
+
+    def _add_lookup(self, lookup):
+        self.lookups.append(lookup)
+        return len(self.lookups) - 1
+
+    def _converter(self, field):
+        for field_class, factory in CONVERTERS:
+            if isinstance(field, field_class):
+                if factory is None:
+                    return 'raw', None
+                converter = factory(field)
+                kind = 'datetime' if field_class is drf_fields.DateTimeField else 'value'
+                return kind, converter
+        raise ImproperlyConfigured(
+            f'{self.serializer_class.__name__}.{field.field_name} ({type(field).__name__}) '
+            'is not supported by the fast path'
+        )
+
+    def _convert(self, plan, columns, tz):
+        """Convert column by column, then zip the columns into row dicts."""
+        names = []
+        converted = []
+        for name, index, kind, converter in plan:
+            column = columns[index]
+            if kind == 'nested':
+                nested = self._convert(converter, columns, tz)
+                column = [None if pk is None else row for pk, row in zip(column, nested)]
+            elif kind != 'raw':
+                args = (column, repeat(tz)) if kind == 'datetime' else (column,)
+                if None in column:
+                    converter = _none_safe(converter)
+                column = list(map(converter, *args))
+            names.append(name)
+            converted.append(column)
+        return [dict(zip(names, values)) for values in zip(*converted)]
+
+    def queryset(self, queryset):
+        if self.annotations:
+            queryset = queryset.annotate(**self.annotations)
+        return queryset.values_list(*self.lookups)
+
+    def rows(self, queryset):
+        """Serialized rows for ``queryset``, as plain dicts."""
+        tz = timezone.get_current_timezone()
+        if tz.utcoffset(None) == datetime.timedelta(0) and tz.tzname(None) == 'UTC':
+            tz = None
+        rows = list(self.queryset(queryset))
+        if not rows:
+            return []
+        return self._convert(self.plan, list(zip(*rows)), tz)
@@ -0,0 +1,48 @@
+"""Custom model fields."""
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.db import models
+from django.utils.functional import cached_property
+
+
+class MoneyField(models.DecimalField):
+    """
+    An amount stored as a whole number of minor units (paise) in a ``bigint``.
+
+    Python code, forms, the admin and serializers see a ``Decimal`` with
+    ``decimal_places`` places, exactly as with ``DecimalField``; only the
+    column holds integers. Sums and comparisons run on exact integer
+    arithmetic in the database, and rows load without parsing decimals.
+
+    In query expressions the column is in minor units: arithmetic between
+    money columns needs ``output_field=MoneyField()`` (Django would infer a
+    plain ``DecimalField`` and return paise), and a literal combined with a
+    money column must be given in paise.
+    """
+
+    def __init__(self, *args, max_digits=12, decimal_places=2, **kwargs):
+        super().__init__(*args, max_digits=max_digits, decimal_places=decimal_places, **kwargs)
+
+    def get_internal_type(self):
+        return 'BigIntegerField'
+
+    @cached_property
+    def unit(self):
+        return Decimal(1).scaleb(-self.decimal_places)
+
+    def from_db_value(self, value, expression, connection):
+        if value is None:
+            return value
+        return Decimal(value) * self.unit
+
+    def get_db_prep_value(self, value, connection, prepared=False):
+        if hasattr(value, 'as_sql'):
+            return value
+        if not prepared:
+            value = self.get_prep_value(value)
+        if value is None:
+            return value
+        return int(value.scaleb(self.decimal_places).to_integral_value(ROUND_HALF_UP))
+
+    def get_db_prep_save(self, value, connection):
+        return self.get_db_prep_value(value, connection)
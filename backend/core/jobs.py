@@ -0,0 +1,241 @@
+"""
+Durable background jobs backed by the database.
+
+Jobs are rows in ``core.Job``. Workers claim due jobs in priority order and
+hold them under a lease that expires after a visibility timeout, so a job
+whose worker died is picked up again, or failed if that was its last
+attempt. On backends that support it, claiming
+uses ``SELECT ... FOR UPDATE SKIP LOCKED``; on SQLite a single
+``UPDATE ... WHERE id IN (SELECT ... LIMIT n)`` does the same, since SQLite
+serialises writers. Failed jobs are retried with exponential backoff.
+
+Handlers are registered with ``@task('name')`` in ``<app>/tasks.py`` modules
+and are called as ``handler(job, **payload)`` where ``job`` is a
+``JobContext``.
+"""
+import logging
+import os
+import random
+import socket
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, connections, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from django.utils.module_loading import autodiscover_modules
+
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+_registry = {}
+_discovered = False
+
+
+def task(name, max_attempts=None):
+    """Register a job handler under ``name``."""
+    def decorator(func):
+        _registry[name] = (func, max_attempts)
+        return func
+    return decorator
+
+
+def get_task(name):
+    global _discovered
+    if not _discovered:
+        autodiscover_modules('tasks')
+        _discovered = True
+    try:
+        return _registry[name]
+    except KeyError:
+        raise LookupError(f'No job handler registered for {name!r}')
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def enqueue(name, payload=None, priority=0, run_at=None, max_attempts=None, user=None):
+    """Queue a job; it becomes visible to workers when the transaction commits."""
+    _, default_attempts = get_task(name)
+    return Job.objects.create(
+        name=name,
+        payload=payload or {},
+        priority=priority,
+        run_at=run_at or timezone.now(),
+        max_attempts=max_attempts or default_attempts or _setting('JOB_MAX_ATTEMPTS', 5),
+        created_by=user
+    )
+
+
+def claim(worker_id, limit, visibility_timeout=None):
+    """Lease up to ``limit`` runnable jobs for ``worker_id``."""
+    if limit <= 0:
+        return []
+    visibility_timeout = visibility_timeout or _setting('JOB_VISIBILITY_TIMEOUT', 300)
+    now = timezone.now()
+    lease = uuid.uuid4().hex
+    expired = Q(status='running', locked_until__lt=now)
+    runnable = Job.objects.filter(
+        Q(status='queued', run_at__lte=now) |
+        (expired & Q(attempts__lt=F('max_attempts')))
+    ).order_by('-priority', 'run_at', 'id')
+    claimed = dict(
+        status='running',
+        locked_by=worker_id,
+        lease=lease,
+        locked_until=now + timedelta(seconds=visibility_timeout),
+        attempts=F('attempts') + 1,
+        started_at=now
+    )
+
+    with transaction.atomic():
+        # A job whose lease ran out on its last attempt most likely took its
+        # worker down with it (out of memory, a crashed process pool), so it
+        # fails rather than being run again.
+        Job.objects.filter(expired, attempts__gte=F('max_attempts')).update(
+            status='failed', lease='', locked_by='', locked_until=None,
+            error='The worker stopped before the job finished, on its last attempt',
+            finished_at=now, updated_at=now
+        )
+        if connection.features.has_select_for_update_skip_locked:
+            ids = list(
+                runnable.select_for_update(skip_locked=True).values_list('id', flat=True)[:limit]
+            )
+            Job.objects.filter(id__in=ids).update(**claimed)
+        else:
+            Job.objects.filter(id__in=runnable.values('id')[:limit]).update(**claimed)
+
+    return list(Job.objects.filter(lease=lease).order_by('-priority', 'run_at', 'id'))
+
+
+def backoff_delay(attempts):
+    base = _setting('JOB_RETRY_BACKOFF', 5)
+    cap = _setting('JOB_RETRY_BACKOFF_MAX', 3600)
+    delay = min(base * 2 ** max(attempts - 1, 0), cap)
+    return delay + random.uniform(0, delay / 10)
+
+
+class JobContext:
+    """Handle passed to job handlers for reporting progress."""
+
+    progress_interval = 0.5
+
+    def __init__(self, job):
+        self.job = job
+        self.id = job.id
+        self._last_progress = 0.0
+
+    def set_progress(self, progress, message='', force=False):
+        """
+        Record progress between 0 and 1 and extend the lease.
+
+        Writes are throttled so tight loops can report freely.
+        """
+        now = time.monotonic()
+        if not force and now - self._last_progress < self.progress_interval:
+            return
+        self._last_progress = now
+        visibility_timeout = _setting('JOB_VISIBILITY_TIMEOUT', 300)
+        Job.objects.filter(id=self.id, lease=self.job.lease).update(
+            progress=max(0.0, min(float(progress), 1.0)),
+            progress_message=message[:200],
+            locked_until=timezone.now() + timedelta(seconds=visibility_timeout),
+            updated_at=timezone.now()
+        )
+
+
+def execute(job_id, lease):
+    """Run one claimed job and record its outcome."""
+    try:
+        return _execute(job_id, lease)
+    finally:
+        connections.close_all()
+
+
+def _execute(job_id, lease):
+    try:
+        job = Job.objects.get(id=job_id, lease=lease)
+    except Job.DoesNotExist:
+        return None
+
+    released = dict(lease='', locked_by='', locked_until=None)
+    try:
+        handler, _ = get_task(job.name)
+        result = handler(JobContext(job), **job.payload)
+    except Exception:
+        logger.exception('Job %s (%s) failed on attempt %s', job.id, job.name, job.attempts)
+        now = timezone.now()
+        if job.attempts < job.max_attempts:
+            outcome = dict(status='queued', run_at=now + timedelta(seconds=backoff_delay(job.attempts)))
+        else:
+            outcome = dict(status='failed', finished_at=now)
+        Job.objects.filter(id=job.id, lease=lease).update(
+            error=traceback.format_exc(), updated_at=now, **released, **outcome
+        )
+        return outcome['status']
+
+    now = timezone.now()
+    Job.objects.filter(id=job.id, lease=lease).update(
+        status='succeeded', result=result, progress=1.0, error='',
+        finished_at=now, updated_at=now, **released
+    )
+    return 'succeeded'
+
+
+def _init_process():
+    import django
+    django.setup()
+    connections.close_all()
+
+
+class Worker:
+    """
+    Claim jobs and run them on a thread or process pool.
+
+    The worker only claims as many jobs as it has free slots, so leases are
+    never held by work that is merely waiting for a slot.
+    """
+
+    def __init__(self, concurrency=None, mode='thread', poll_interval=None,
+                 visibility_timeout=None, burst=False):
+        self.concurrency = concurrency or _setting('JOB_WORKER_CONCURRENCY', 4)
+        self.mode = mode
+        self.poll_interval = poll_interval or _setting('JOB_POLL_INTERVAL', 1.0)
+        self.visibility_timeout = visibility_timeout or _setting('JOB_VISIBILITY_TIMEOUT', 300)
+        self.burst = burst
+        self.worker_id = f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}'
+        self.stop_event = threading.Event()
+
+    def stop(self):
+        self.stop_event.set()
+
+    def _executor(self):
+        if self.mode == 'process':
+            connections.close_all()
+            return ProcessPoolExecutor(max_workers=self.concurrency, initializer=_init_process)
+        return ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix='jobs')
+
+    def run(self):
+        inflight = set()
+        with self._executor() as executor:
+            while not self.stop_event.is_set():
+                inflight = {future for future in inflight if not future.done()}
+                free = self.concurrency - len(inflight)
+                jobs = claim(self.worker_id, free, self.visibility_timeout) if free else []
+                for job in jobs:
+                    inflight.add(executor.submit(execute, job.id, job.lease))
+
+                if len(inflight) >= self.concurrency:
+                    wait(inflight, timeout=self.poll_interval, return_when=FIRST_COMPLETED)
+                elif not jobs:
+                    if self.burst and not inflight:
+                        break
+                    self.stop_event.wait(self.poll_interval)
+        connections.close_all()
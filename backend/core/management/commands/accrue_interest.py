@@ -0,0 +1,44 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from core import accrual, jobs
+
+
+class Command(BaseCommand):
+    help = 'Accrue a day of interest and late fees on overdue dues'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date', type=date.fromisoformat, default=None, help='Accrual date (YYYY-MM-DD); defaults to today')
+        parser.add_argument('--partitions', type=int, default=1, help='Number of parts the suppliers are split into')
+        parser.add_argument('--partition', type=int, default=0, help='Part accrued by this run')
+        parser.add_argument('--batch-size', type=int, default=None, help='Dues per batch; defaults to ACCRUAL_BATCH_SIZE')
+        parser.add_argument('--enqueue', action='store_true', help='Queue one job per partition for run_workers instead of accruing here')
+
+    def handle(self, *args, **options):
+        partitions = options['partitions']
+        if partitions < 1 or not 0 <= options['partition'] < partitions:
+            raise CommandError('--partition must be between 0 and --partitions - 1')
+        accrual_date = options['date'] or timezone.localdate()
+
+        if options['enqueue']:
+            for partition in range(partitions):
+                jobs.enqueue('accrual.run', {
+                    'accrual_date': accrual_date.isoformat(),
+                    'partition': partition,
+                    'partitions': partitions,
+                })
+            self.stdout.write(self.style.SUCCESS(f'Queued {partitions} accrual job(s) for {accrual_date}'))
+            return
+
+        result = accrual.run(
+            accrual_date=accrual_date,
+            partition=options['partition'],
+            partitions=partitions,
+            batch_size=options['batch_size']
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'Accrued {result["dues"]} due(s) of {result["suppliers"]} supplier(s) for {result["date"]}: '
+            f'interest {result["interest"]}, late fees {result["late_fees"]}'
+        ))
@@ -0,0 +1,55 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from core import benchmarks
+
+
+class Command(BaseCommand):
+    help = 'Run benchmarks and fail if any timing regressed past the threshold against a JSON baseline'
+
+    def add_arguments(self, parser):
+        parser.add_argument('names', nargs='*', help='Benchmarks to compare; all of those in the baseline by default')
+        parser.add_argument(
+            '--baseline', default=str(getattr(settings, 'BENCHMARK_BASELINE_PATH', 'benchmarks.json')),
+            help='Baseline written by run_benchmarks --save'
+        )
+        parser.add_argument('--current', metavar='PATH', help='Compare these saved results instead of running now')
+        parser.add_argument(
+            '--threshold', type=float, default=getattr(settings, 'BENCHMARK_REGRESSION_THRESHOLD', 0.2),
+            help='Allowed slowdown as a fraction of the baseline median'
+        )
+        parser.add_argument('--repeat', type=int, help='Timed calls per measurement')
+        parser.add_argument('--warmup', type=int, help='Untimed calls before each measurement')
+
+    def handle(self, *args, **options):
+        try:
+            baseline = benchmarks.load_results(options['baseline'])
+        except FileNotFoundError:
+            raise CommandError(f'No baseline at {options["baseline"]}; write one with run_benchmarks --save')
+
+        if options['current']:
+            current = benchmarks.load_results(options['current'])
+        else:
+            available = benchmarks.get_benchmarks()
+            names = options['names'] or [name for name in baseline if name in available]
+            unknown = [name for name in names if name not in available]
+            if unknown:
+                raise CommandError(f'Unknown benchmark(s): {", ".join(unknown)}')
+            current = {
+                name: benchmarks.run(name, repeat=options['repeat'], warmup=options['warmup'])
+                for name in names
+            }
+        if options['names']:
+            current = {name: results for name, results in current.items() if name in options['names']}
+
+        rows = benchmarks.compare(baseline, current, options['threshold'])
+        for name, label, before, after, change, regressed in rows:
+            line = f'{name}.{label}: {before:.3f} ms -> {after:.3f} ms ({change:+.1%})'
+            self.stdout.write(self.style.ERROR(line) if regressed else line)
+
+        regressions = [f'{name}.{label}' for name, label, _, _, _, regressed in rows if regressed]
+        if regressions:
+            raise CommandError(
+                f'{len(regressions)} timing(s) regressed more than {options["threshold"]:.0%}: {", ".join(regressions)}'
+            )
+        self.stdout.write(self.style.SUCCESS(f'{len(rows)} timing(s) within {options["threshold"]:.0%} of the baseline'))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from core import emi
+
+
+class Command(BaseCommand):
+    help = 'Precompute and store EMI offers for all open dues above a threshold'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--min-amount', type=float, default=None, help='Smallest outstanding balance to make offers for')
+
+    def handle(self, *args, **options):
+        count = emi.precompute_open_dues(options['min_amount'])
+        self.stdout.write(self.style.SUCCESS(f'Cached EMI offers for {count} due(s)'))
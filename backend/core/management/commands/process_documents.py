@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from core.documents import process_document
+from core.models import Document
+
+
+class Command(BaseCommand):
+    help = 'Process uploaded documents that are still waiting for validation, without the job workers'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=None, help='Maximum number of documents to process')
+
+    def handle(self, *args, **options):
+        pending = Document.objects.filter(status='processing').order_by('uploaded_at').values_list('id', flat=True)
+        if options['limit']:
+            pending = pending[:options['limit']]
+
+        processed = 0
+        for document_id in pending:
+            document = process_document(document_id)
+            processed += 1
+            self.stdout.write(f'Document {document.id}: {document.status}')
+
+        self.stdout.write(self.style.SUCCESS(f'Processed {processed} document(s)'))
@@ -0,0 +1,87 @@
+import pstats
+import re
+from collections import defaultdict
+
+from django.core.management.base import BaseCommand
+
+from core import profiling
+
+LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+IN_LISTS = re.compile(r'IN \((?:\?|%s)(?:, (?:\?|%s))*\)')
+
+
+def normalise(sql):
+    sql = LITERALS.sub('?', ' '.join(sql.split()))
+    return IN_LISTS.sub('IN (...)', sql)
+
+
+class Command(BaseCommand):
+    help = 'List captured request profiles and summarise the hotspots across them'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--route', help='Only captures whose route contains this text')
+        parser.add_argument('--min-ms', type=int, default=0, help='Only captures at least this slow')
+        parser.add_argument('--captures', type=int, help='Only the newest N matching captures')
+        parser.add_argument('--limit', type=int, default=20, help='Functions and queries shown')
+        parser.add_argument('--sort', choices=['cumulative', 'tottime'], default='cumulative')
+        parser.add_argument('--list', action='store_true', help='List the captures without summarising')
+
+    def handle(self, *args, **options):
+        selected = [
+            capture for capture in profiling.captures()
+            if capture['duration_ms'] >= options['min_ms']
+            and (not options['route'] or profiling.route_slug(options['route']) in capture['route'])
+        ]
+        if options['captures']:
+            selected = selected[:options['captures']]
+        if not selected:
+            self.stdout.write(f'No captures in {profiling.capture_dir()}')
+            return
+
+        summaries = [profiling.load_summary(capture['id']) for capture in selected]
+        self.list_captures(summaries)
+        if not options['list']:
+            self.functions(selected, options['sort'], options['limit'])
+            self.queries(summaries, options['limit'])
+
+    def list_captures(self, summaries):
+        self.stdout.write(self.style.MIGRATE_HEADING(f'{len(summaries)} capture(s)'))
+        for summary in summaries:
+            self.stdout.write(
+                f"{summary['duration_ms']:>10.1f} ms  {summary['sql_count']:>5} queries "
+                f"{summary['sql_ms']:>9.1f} ms  {summary['status']}  {summary['method']} {summary['path']}"
+                f"  {summary['id']}"
+            )
+
+    def functions(self, selected, sort, limit):
+        stats = pstats.Stats(profiling.profile_path(selected[0]['id']))
+        for capture in selected[1:]:
+            stats.add(profiling.profile_path(capture['id']))
+        column = 3 if sort == 'cumulative' else 2
+        rows = sorted(stats.stats.items(), key=lambda item: item[1][column], reverse=True)[:limit]
+
+        self.stdout.write(self.style.MIGRATE_HEADING(f'\nTop functions by {sort} time'))
+        self.stdout.write(f"{'calls':>10} {'tottime':>10} {'cumtime':>10}  function")
+        for func, (_, calls, tottime, cumtime, _) in rows:
+            self.stdout.write(
+                f'{calls:>10} {tottime * 1000:>8.1f}ms {cumtime * 1000:>8.1f}ms  {pstats.func_std_string(func)}'
+            )
+
+    def queries(self, summaries, limit):
+        totals = defaultdict(lambda: {'count': 0, 'ms': 0.0, 'max_ms': 0.0, 'captures': set()})
+        for summary in summaries:
+            for query in summary['queries']:
+                total = totals[(normalise(query['sql']), query['origin'])]
+                total['count'] += 1
+                total['ms'] += query['ms']
+                total['max_ms'] = max(total['max_ms'], query['ms'])
+                total['captures'].add(summary['id'])
+        rows = sorted(totals.items(), key=lambda item: item[1]['ms'], reverse=True)[:limit]
+
+        self.stdout.write(self.style.MIGRATE_HEADING('\nTop queries by total time'))
+        for (sql, origin), total in rows:
+            self.stdout.write(
+                f"{total['ms']:>9.1f} ms  {total['count']:>6} x  max {total['max_ms']:.1f} ms"
+                f"  in {len(total['captures'])} capture(s)  {origin or '(outside the project)'}"
+            )
+            self.stdout.write(f'    {sql[:300]}')
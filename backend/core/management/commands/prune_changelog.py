@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from core import changefeed
+
+
+class Command(BaseCommand):
+    help = 'Delete sync change log entries older than the retention period'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=None, help='Retention in days; defaults to SYNC_RETENTION_DAYS')
+
+    def handle(self, *args, **options):
+        count = changefeed.prune(options['days'])
+        self.stdout.write(self.style.SUCCESS(f'Deleted {count} change log entr{"y" if count == 1 else "ies"}'))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from core import mutations
+
+
+class Command(BaseCommand):
+    help = 'Forget stored outcomes of client mutations older than the retention period'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=None, help='Retention in days; defaults to MUTATION_RETENTION_DAYS')
+
+    def handle(self, *args, **options):
+        count = mutations.prune(options['days'])
+        self.stdout.write(self.style.SUCCESS(f'Deleted {count} client mutation{"" if count == 1 else "s"}'))
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from core import analytics, jobs
+
+
+class Command(BaseCommand):
+    help = 'Recompute the fintech portfolio analytics aggregates from the ledger'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=5000, help='Retailers processed per batch')
+        parser.add_argument('--no-refresh', action='store_true', help='Aggregate the stored risk rows without recomputing them')
+        parser.add_argument('--enqueue', action='store_true', help='Queue a job for run_workers instead of rebuilding here')
+
+    def handle(self, *args, **options):
+        if options['enqueue']:
+            jobs.enqueue('analytics.rebuild', {'refresh': not options['no_refresh']})
+            self.stdout.write(self.style.SUCCESS('Queued the analytics rebuild'))
+            return
+
+        def progress(done, total):
+            self.stdout.write(f'{done}/{total}')
+
+        count = analytics.rebuild(
+            options['chunk_size'],
+            refresh=not options['no_refresh'],
+            progress=progress
+        )
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt portfolio analytics over {count} retailer(s)'))
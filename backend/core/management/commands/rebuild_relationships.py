@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from core import relationships
+
+
+class Command(BaseCommand):
+    help = 'Recompute the supplier-retailer relationship rows from the dues'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=500, help='Suppliers recomputed per batch')
+
+    def handle(self, *args, **options):
+        def progress(done, total):
+            self.stdout.write(f'{done}/{total}')
+
+        count = relationships.rebuild(options['chunk_size'], progress=progress)
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt relationship rows for {count} supplier(s)'))
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from core import risk
+
+
+class Command(BaseCommand):
+    help = 'Recompute the fintech portfolio risk row for every retailer'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=2000, help='Retailers recomputed per batch')
+
+    def handle(self, *args, **options):
+        def progress(done, total):
+            self.stdout.write(f'{done}/{total}')
+
+        count = risk.rebuild(options['chunk_size'], progress=progress)
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt risk rows for {count} retailer(s)'))
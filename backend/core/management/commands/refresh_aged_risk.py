@@ -0,0 +1,26 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand
+
+from core import jobs, risk
+
+
+class Command(BaseCommand):
+    help = 'Refresh the risk rows whose overdue or default state changed with the date; run daily'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date', type=date.fromisoformat, default=None, help='Date to age to (YYYY-MM-DD); defaults to today')
+        parser.add_argument('--chunk-size', type=int, default=2000, help='Retailers recomputed per batch')
+        parser.add_argument('--enqueue', action='store_true', help='Queue a job for run_workers instead of refreshing here')
+
+    def handle(self, *args, **options):
+        if options['enqueue']:
+            jobs.enqueue('risk.refresh_aged', {'today': options['date'] and options['date'].isoformat()})
+            self.stdout.write(self.style.SUCCESS('Queued the aged risk refresh'))
+            return
+
+        def progress(done, total):
+            self.stdout.write(f'{done}/{total}')
+
+        count = risk.refresh_aged(options['date'], options['chunk_size'], progress=progress)
+        self.stdout.write(self.style.SUCCESS(f'Refreshed risk rows for {count} retailer(s)'))
@@ -0,0 +1,34 @@
+import asyncio
+import signal
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core import outbox
+
+
+class Command(BaseCommand):
+    help = 'Publish outbox events to the channel layer'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=None, help='Events per batch; defaults to OUTBOX_BATCH_SIZE')
+        parser.add_argument('--partitions', type=int, default=1, help='Number of relays sharing the outbox by recipient')
+        parser.add_argument('--partition', type=int, default=0, help='Partition served by this relay')
+
+    def handle(self, *args, **options):
+        if not 0 <= options['partition'] < options['partitions']:
+            raise CommandError('--partition must be between 0 and --partitions - 1')
+        relay = outbox.Relay(
+            batch_size=options['batch_size'],
+            partition=options['partition'],
+            partitions=options['partitions']
+        )
+        self.stdout.write(f'Outbox relay started (partition {options["partition"]}/{options["partitions"]})')
+        asyncio.run(self._run(relay))
+        self.stdout.write(self.style.SUCCESS('Outbox relay stopped'))
+
+    async def _run(self, relay):
+        stop_event = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(signum, stop_event.set)
+        await relay.run(stop_event)
@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from core import benchmarks
+
+
+class Command(BaseCommand):
+    help = 'Run hot-path benchmarks against rolled-back data in the configured database'
+
+    def add_arguments(self, parser):
+        parser.add_argument('names', nargs='*', help='Benchmarks to run; all of them by default')
+        parser.add_argument('--list', action='store_true', help='List the available benchmarks')
+        parser.add_argument('--repeat', type=int, help='Timed calls per measurement')
+        parser.add_argument('--warmup', type=int, help='Untimed calls before each measurement')
+        parser.add_argument('--save', metavar='PATH', help='Write the results to PATH as a JSON baseline')
+
+    def handle(self, *args, **options):
+        available = benchmarks.get_benchmarks()
+        if options['list']:
+            for name, func in available.items():
+                self.stdout.write(f'{name}: {(func.__doc__ or "").strip()}')
+            return
+
+        names = options['names'] or list(available)
+        unknown = [name for name in names if name not in available]
+        if unknown:
+            raise CommandError(f'Unknown benchmark(s): {", ".join(unknown)}')
+
+        results = {}
+        for name in names:
+            self.stdout.write(self.style.MIGRATE_HEADING(name))
+            results[name] = benchmarks.run(name, repeat=options['repeat'], warmup=options['warmup'])
+            for key, value in results[name].items():
+                self.stdout.write(f'  {key}: {value}')
+
+        if options['save']:
+            benchmarks.save_results(options['save'], results)
+            self.stdout.write(self.style.SUCCESS(f'Saved {len(results)} benchmark(s) to {options["save"]}'))
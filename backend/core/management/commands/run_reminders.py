@@ -0,0 +1,31 @@
+import signal
+import threading
+
+from django.core.management.base import BaseCommand
+
+from core import reminders
+
+
+class Command(BaseCommand):
+    help = 'Run the payment reminder dispatcher'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sync-interval', type=int, default=None, help='Seconds between incremental syncs of due changes')
+
+    def handle(self, *args, **options):
+        stop_event = threading.Event()
+
+        def shutdown(signum, frame):
+            stop_event.set()
+
+        signal.signal(signal.SIGINT, shutdown)
+        signal.signal(signal.SIGTERM, shutdown)
+
+        scheduler = reminders.ReminderScheduler()
+        reminders.start(scheduler)
+        self.stdout.write('Reminder dispatcher started')
+        try:
+            scheduler.run(stop_event, sync_interval=options['sync_interval'])
+        finally:
+            reminders.stop()
+        self.stdout.write(self.style.SUCCESS('Reminder dispatcher stopped'))
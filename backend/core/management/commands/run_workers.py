@@ -0,0 +1,36 @@
+import signal
+
+from django.core.management.base import BaseCommand
+
+from core.jobs import Worker
+
+
+class Command(BaseCommand):
+    help = 'Run background job workers'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=None, help='Number of jobs run at once')
+        parser.add_argument('--mode', choices=['thread', 'process'], default='thread', help='Run jobs on a thread or process pool')
+        parser.add_argument('--poll-interval', type=float, default=None, help='Seconds to wait when the queue is empty')
+        parser.add_argument('--visibility-timeout', type=int, default=None, help='Seconds a claimed job stays leased without progress')
+        parser.add_argument('--burst', action='store_true', help='Exit once the queue is empty')
+
+    def handle(self, *args, **options):
+        worker = Worker(
+            concurrency=options['concurrency'],
+            mode=options['mode'],
+            poll_interval=options['poll_interval'],
+            visibility_timeout=options['visibility_timeout'],
+            burst=options['burst']
+        )
+
+        def shutdown(signum, frame):
+            self.stdout.write('Finishing running jobs...')
+            worker.stop()
+
+        signal.signal(signal.SIGINT, shutdown)
+        signal.signal(signal.SIGTERM, shutdown)
+
+        self.stdout.write(f'Worker {worker.worker_id} started ({worker.mode} x {worker.concurrency})')
+        worker.run()
+        self.stdout.write(self.style.SUCCESS('Worker stopped'))
@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+
+from core import bankstatements
+from core.models import Document
+
+
+class Command(BaseCommand):
+    help = "Recompute retailers' bank statement scores, parsing uncached statements on a process pool"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--retailer', type=int, action='append', default=None, help='Retailer profile id; repeat for several (default: every retailer with statements)')
+        parser.add_argument('--workers', type=int, default=None, help='Parsing processes; defaults to BANK_STATEMENT_WORKERS')
+        parser.add_argument('--enqueue', action='store_true', help='Queue one job per retailer for run_workers instead of scoring here')
+
+    def handle(self, *args, **options):
+        statements = Document.objects.filter(document_type='bank_statement', status='ready')
+        if options['retailer']:
+            statements = statements.filter(retailer_id__in=options['retailer'])
+        retailer_ids = sorted(set(statements.values_list('retailer_id', flat=True)))
+
+        if options['enqueue']:
+            for retailer_id in retailer_ids:
+                bankstatements.schedule_scoring(retailer_id)
+            self.stdout.write(self.style.SUCCESS(f'Queued scoring of {len(retailer_ids)} retailer(s)'))
+            return
+
+        parsed = bankstatements.extract_documents(statements.iterator(), workers=options['workers'])
+        for retailer_id in retailer_ids:
+            result = bankstatements.score_retailer(retailer_id)
+            self.stdout.write(f'Retailer {retailer_id}: {result["score"]} from {result["statements"]} statement(s)')
+        self.stdout.write(self.style.SUCCESS(
+            f'Scored {len(retailer_ids)} retailer(s); parsed {parsed} new statement(s)'
+        ))
@@ -0,0 +1,15 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_jobs'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='dueentry',
+            index=models.Index(fields=['updated_at'], name='dueentry_updated_idx'),
+        ),
+    ]
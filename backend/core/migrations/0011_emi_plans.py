@@ -0,0 +1,35 @@
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_dueentry_updated_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EMIPlan',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('principal', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('interest_rate', models.DecimalField(decimal_places=2, max_digits=5)),
+                ('tenure_months', models.IntegerField()),
+                ('monthly_amount', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('total_amount', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('schedule', models.BinaryField()),
+                ('status', models.CharField(choices=[('active', 'Active'), ('completed', 'Completed'), ('cancelled', 'Cancelled')], default='active', max_length=10)),
+                ('activated_at', models.DateTimeField(auto_now_add=True)),
+                ('activated_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+                ('due', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='emi_plans', to='core.dueentry')),
+                ('fintech', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='emi_plans', to='core.userprofile')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='emiplan',
+            constraint=models.UniqueConstraint(condition=models.Q(('status', 'active')), fields=('due',), name='one_active_emi_plan_per_due'),
+        ),
+    ]
@@ -0,0 +1,42 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_emi_plans'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RetailerRisk',
+            fields=[
+                ('retailer', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='risk', serialize=False, to='core.retailerprofile')),
+                ('business_name', models.CharField(max_length=200)),
+                ('business_type', models.CharField(max_length=50)),
+                ('years_in_business', models.IntegerField(default=0)),
+                ('credit_score', models.IntegerField(default=0)),
+                ('assessment_status', models.CharField(default='none', max_length=20)),
+                ('assessment_date', models.DateTimeField(blank=True, null=True)),
+                ('approved_limit', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('credit_limit', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('available_credit', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('outstanding', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('overdue_amount', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('oldest_open_due_date', models.DateField(blank=True, null=True)),
+                ('utilization', models.FloatField(default=0)),
+                ('overdue_ratio', models.FloatField(default=0)),
+                ('due_count', models.IntegerField(default=0)),
+                ('paid_count', models.IntegerField(default=0)),
+                ('on_time_count', models.IntegerField(default=0)),
+                ('on_time_rate', models.FloatField(default=0)),
+                ('refreshed_at', models.DateTimeField(auto_now=True)),
+                ('assessment', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='core.creditassessment')),
+                ('profile', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='risk', to='core.userprofile')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['credit_score', 'retailer'], name='risk_score_idx'), models.Index(fields=['utilization', 'retailer'], name='risk_utilization_idx'), models.Index(fields=['outstanding', 'retailer'], name='risk_outstanding_idx'), models.Index(fields=['overdue_ratio', 'retailer'], name='risk_overdue_idx'), models.Index(fields=['on_time_rate', 'retailer'], name='risk_on_time_idx'), models.Index(fields=['business_name', 'retailer'], name='risk_name_idx'), models.Index(fields=['assessment_status', 'credit_score', 'retailer'], name='risk_status_score_idx'), models.Index(fields=['oldest_open_due_date'], name='risk_oldest_due_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,35 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_retailer_risk'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PortfolioAggregate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dimension', models.CharField(max_length=20)),
+                ('key', models.CharField(max_length=50)),
+                ('data', models.BinaryField()),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='retailerrisk',
+            name='cohort',
+            field=models.CharField(blank=True, max_length=7),
+        ),
+        migrations.AddField(
+            model_name='retailerrisk',
+            name='defaulted',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddConstraint(
+            model_name='portfolioaggregate',
+            constraint=models.UniqueConstraint(fields=('dimension', 'key'), name='unique_portfolio_aggregate'),
+        ),
+    ]
@@ -0,0 +1,25 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_portfolio_analytics'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChangeLogEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('recipient', models.BigIntegerField()),
+                ('kind', models.CharField(choices=[('due', 'Due'), ('transaction', 'Transaction'), ('payment', 'Payment')], max_length=20)),
+                ('object_id', models.BigIntegerField()),
+                ('deleted', models.BooleanField(default=False)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['recipient', 'id'], name='changelog_recipient_idx'), models.Index(fields=['created_at'], name='changelog_created_idx')],
+            },
+        ),
+    ]
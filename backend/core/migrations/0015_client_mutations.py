@@ -0,0 +1,32 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0014_change_log'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ClientMutation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('client_id', models.CharField(max_length=64)),
+                ('operation', models.CharField(max_length=20)),
+                ('object_id', models.BigIntegerField(blank=True, null=True)),
+                ('status_code', models.IntegerField()),
+                ('response', models.JSONField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('profile', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='client_mutations', to='core.userprofile')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['created_at'], name='clientmutation_created_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='clientmutation',
+            constraint=models.UniqueConstraint(fields=('profile', 'client_id'), name='unique_client_mutation'),
+        ),
+    ]
@@ -0,0 +1,80 @@
+"""
+Store ledger amounts as integer paise (``core.fields.MoneyField``).
+
+Each column is widened so it can hold its value times 100, scaled in place
+in primary-key chunks, then cast to ``bigint``, which is lossless once every
+value is whole. Rounding during the scale also removes the float drift
+SQLite's REAL storage left in the decimal columns.
+"""
+from django.db import migrations, models
+
+import core.fields
+
+CHUNK_SIZE = 10000
+
+# model -> (money columns, max_digits)
+COLUMNS = {
+    'dueentry': (('amount', 10), ('amount_paid', 10)),
+    'payment': (('amount', 10),),
+    'paymentallocation': (('amount', 10),),
+    'transaction': (('amount', 10),),
+    'retailerprofile': (('credit_limit', 12), ('available_credit', 12)),
+    'retailerrisk': (
+        ('approved_limit', 12), ('credit_limit', 12), ('available_credit', 12),
+        ('outstanding', 12), ('overdue_amount', 12),
+    ),
+}
+
+DEFAULT_ZERO = {'amount_paid', 'credit_limit', 'available_credit', 'approved_limit', 'outstanding', 'overdue_amount'}
+
+
+def _rescale(expression):
+    def rescale(apps, schema_editor):
+        connection = schema_editor.connection
+        quote = connection.ops.quote_name
+        for model_name, columns in COLUMNS.items():
+            model = apps.get_model('core', model_name)
+            table = quote(model._meta.db_table)
+            pk = quote(model._meta.pk.column)
+            assignments = ', '.join(
+                f'{quote(column)} = {expression.format(column=quote(column))}' for column, _ in columns
+            )
+            bounds = model.objects.aggregate(low=models.Min('pk'), high=models.Max('pk'))
+            if bounds['low'] is None:
+                continue
+            with connection.cursor() as cursor:
+                for start in range(bounds['low'], bounds['high'] + 1, CHUNK_SIZE):
+                    cursor.execute(
+                        f'UPDATE {table} SET {assignments} WHERE {pk} >= %s AND {pk} < %s',
+                        [start, start + CHUNK_SIZE]
+                    )
+    return rescale
+
+
+def _fields(field_class, widen):
+    operations = []
+    for model_name, columns in COLUMNS.items():
+        for column, max_digits in columns:
+            kwargs = {'max_digits': 20 if widen else max_digits, 'decimal_places': 2}
+            if column in DEFAULT_ZERO:
+                kwargs['default'] = 0
+            operations.append(migrations.AlterField(
+                model_name=model_name, name=column, field=field_class(**kwargs)
+            ))
+    return operations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0016_outbox'),
+    ]
+
+    operations = [
+        *_fields(models.DecimalField, widen=True),
+        migrations.RunPython(
+            _rescale('ROUND({column} * 100)'),
+            _rescale('{column} / 100.0'),
+        ),
+        *_fields(core.fields.MoneyField, widen=False),
+    ]
@@ -0,0 +1,46 @@
+import core.fields
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0017_money_minor_units'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AccrualRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('accrual_date', models.DateField()),
+                ('last_due_id', models.BigIntegerField(default=0)),
+                ('dues', models.IntegerField(default=0)),
+                ('completed_at', models.DateTimeField(blank=True, null=True)),
+                ('supplier', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='accrual_runs', to='core.userprofile')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Accrual',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('accrual_date', models.DateField()),
+                ('interest', core.fields.MoneyField(decimal_places=2, default=0, max_digits=12)),
+                ('late_fee', core.fields.MoneyField(decimal_places=2, default=0, max_digits=12)),
+                ('due', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='accruals', to='core.dueentry')),
+                ('supplier', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='accruals', to='core.userprofile')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['supplier', 'accrual_date'], name='accrual_supplier_date_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='accrual',
+            constraint=models.UniqueConstraint(fields=('due', 'accrual_date'), name='unique_due_accrual'),
+        ),
+        migrations.AddConstraint(
+            model_name='accrualrun',
+            constraint=models.UniqueConstraint(fields=('supplier', 'accrual_date'), name='unique_accrual_run'),
+        ),
+    ]
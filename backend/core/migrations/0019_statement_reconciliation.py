@@ -0,0 +1,31 @@
+import core.fields
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0018_accruals'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StatementReconciliation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('statement', models.FileField(upload_to='statements/')),
+                ('original_name', models.CharField(blank=True, max_length=255)),
+                ('unmatched_report', models.FileField(blank=True, null=True, upload_to='statements/unmatched/')),
+                ('lines', models.IntegerField(default=0)),
+                ('credits', models.IntegerField(default=0)),
+                ('matched', models.IntegerField(default=0)),
+                ('unmatched', models.IntegerField(default=0)),
+                ('settled_amount', core.fields.MoneyField(decimal_places=2, default=0, max_digits=14)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('completed_at', models.DateTimeField(blank=True, null=True)),
+                ('job', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='core.job')),
+                ('supplier', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reconciliations', to='core.userprofile')),
+            ],
+        ),
+    ]
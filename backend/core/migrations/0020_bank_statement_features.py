@@ -0,0 +1,25 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0019_statement_reconciliation'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BankStatementFeatures',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('content_hash', models.CharField(max_length=64)),
+                ('version', models.PositiveSmallIntegerField()),
+                ('features', models.JSONField(default=dict)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='bankstatementfeatures',
+            constraint=models.UniqueConstraint(fields=('content_hash', 'version'), name='unique_statement_features'),
+        ),
+    ]
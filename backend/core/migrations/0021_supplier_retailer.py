@@ -0,0 +1,64 @@
+"""
+Add the supplier-retailer relationship table and fill it from the existing dues.
+"""
+import django.db.models.deletion
+from django.db import migrations, models
+
+import core.fields
+
+CHUNK_SIZE = 500
+
+
+def backfill(apps, schema_editor):
+    DueEntry = apps.get_model('core', 'DueEntry')
+    SupplierRetailer = apps.get_model('core', 'SupplierRetailer')
+    open_dues = models.Q(status__in=('pending', 'overdue'))
+    balance = models.ExpressionWrapper(
+        models.F('amount') - models.F('amount_paid'), output_field=core.fields.MoneyField()
+    )
+    supplier_ids = list(DueEntry.objects.order_by('supplier_id').values_list('supplier_id', flat=True).distinct())
+    for start in range(0, len(supplier_ids), CHUNK_SIZE):
+        rows = DueEntry.objects.filter(
+            supplier_id__in=supplier_ids[start:start + CHUNK_SIZE]
+        ).values('supplier_id', 'retailer_id').annotate(
+            first_activity=models.Min('created_at'),
+            last_activity=models.Max('updated_at'),
+            open_balance=models.Sum(balance, filter=open_dues),
+            open_dues=models.Count('id', filter=open_dues),
+            due_count=models.Count('id'),
+        ).order_by()
+        SupplierRetailer.objects.bulk_create([
+            SupplierRetailer(**{**row, 'open_balance': row['open_balance'] or 0}) for row in rows
+        ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0020_bank_statement_features'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SupplierRetailer',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('first_activity', models.DateTimeField()),
+                ('last_activity', models.DateTimeField()),
+                ('open_balance', core.fields.MoneyField(decimal_places=2, default=0, max_digits=14)),
+                ('open_dues', models.IntegerField(default=0)),
+                ('due_count', models.IntegerField(default=0)),
+                ('refreshed_at', models.DateTimeField(auto_now=True)),
+                ('retailer', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='supplier_links', to='core.userprofile')),
+                ('supplier', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='retailer_links', to='core.userprofile')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['supplier', '-last_activity'], name='relationship_recent_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='supplierretailer',
+            constraint=models.UniqueConstraint(fields=('supplier', 'retailer'), name='unique_supplier_retailer'),
+        ),
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
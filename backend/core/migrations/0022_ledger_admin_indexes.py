@@ -0,0 +1,37 @@
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0021_supplier_retailer'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='dueentry',
+            index=models.Index(fields=['-created_at', '-id'], name='dueentry_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='dueentry',
+            index=models.Index(fields=['due_date'], name='dueentry_due_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='payment',
+            index=models.Index(fields=['-payment_date', '-id'], name='payment_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='payment',
+            index=models.Index(fields=['reference_id'], name='payment_reference_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['-created_at', '-id'], name='transaction_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='userprofile',
+            index=models.Index(fields=['business_name'], name='userprofile_name_idx'),
+        ),
+    ]
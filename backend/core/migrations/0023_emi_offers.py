@@ -0,0 +1,22 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0022_ledger_admin_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EMIOffer',
+            fields=[
+                ('due', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='emi_offer', serialize=False, to='core.dueentry')),
+                ('balance', models.BigIntegerField()),
+                ('lenders', models.TextField()),
+                ('plans', models.JSONField()),
+                ('computed_at', models.DateTimeField()),
+            ],
+        ),
+    ]
@@ -0,0 +1,26 @@
+import django.db.models.functions.comparison
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0023_emi_offers'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='retailerrisk',
+            index=models.Index(django.db.models.functions.comparison.Collate('business_name', 'NOCASE'), name='risk_name_nocase_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='userprofile',
+            index=models.Index(django.db.models.functions.comparison.Collate('business_name', 'NOCASE'), name='userprofile_name_nocase_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='userprofile',
+            index=models.Index(fields=['phone'], name='userprofile_phone_idx'),
+        ),
+    ]
@@ -0,0 +1,15 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0024_profile_search_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='retailerrisk',
+            index=models.Index(fields=['approved_limit', 'retailer'], name='risk_approved_limit_idx'),
+        ),
+    ]
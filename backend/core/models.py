@@ -1,5 +1,11 @@
+import uuid
+
 from django.db import models
+from django.db.models.functions import Collate
 from django.contrib.auth.models import User
+from django.utils import timezone
+
+from .fields import MoneyField
 
 class UserProfile(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE)
@@ -17,6 +23,16 @@ class UserProfile(models.Model):
     license_number = models.CharField(max_length=50, null=True, blank=True)
     credit_limit = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True)
     interest_rate = models.DecimalField(max_digits=5, decimal_places=2, null=True, blank=True)  
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['business_name'], name='userprofile_name_idx'),
+            # istartswith is a case-insensitive LIKE on SQLite, which only a
+            # NOCASE index can serve.
+            models.Index(Collate('business_name', 'NOCASE'), name='userprofile_name_nocase_idx'),
+            models.Index(fields=['phone'], name='userprofile_phone_idx'),
+        ]
+
     def __str__(self):
         return f"{self.business_name} ({self.user_type})"
 
@@ -34,8 +50,8 @@ class RetailerProfile(models.Model):
     employee_count = models.IntegerField(default=1)
     bank_statement_score = models.IntegerField(null=True, blank=True)
     credit_score = models.IntegerField(null=True, blank=True)
-    credit_limit = models.DecimalField(max_digits=12, decimal_places=2, default=0)
-    available_credit = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    credit_limit = MoneyField(max_digits=12, decimal_places=2, default=0)
+    available_credit = MoneyField(max_digits=12, decimal_places=2, default=0)
 
     def __str__(self):
         return f"Retailer Profile - {self.user_profile.business_name}"
@@ -60,21 +76,53 @@ class ExistingLoan(models.Model):
     def __str__(self):
         return f"Loan - {self.retailer.user_profile.business_name}"
 
+DOCUMENT_TYPE_CHOICES = [
+    ('gst_certificate', 'GST Certificate'),
+    ('bank_statement', 'Bank Statement'),
+    ('financial_statement', 'Financial Statement'),
+    ('shop_license', 'Shop License'),
+    ('ownership_docs', 'Ownership Documents')
+]
+
 class Document(models.Model):
     retailer = models.ForeignKey(RetailerProfile, on_delete=models.CASCADE)
-    document_type = models.CharField(max_length=50, choices=[
-        ('gst_certificate', 'GST Certificate'),
-        ('bank_statement', 'Bank Statement'),
-        ('financial_statement', 'Financial Statement'),
-        ('shop_license', 'Shop License'),
-        ('ownership_docs', 'Ownership Documents')
-    ])
+    document_type = models.CharField(max_length=50, choices=DOCUMENT_TYPE_CHOICES)
     file = models.FileField(upload_to='retailer_documents/')
+    original_name = models.CharField(max_length=255, blank=True)
+    size = models.BigIntegerField(default=0)
+    mime_type = models.CharField(max_length=100, blank=True)
+    content_hash = models.CharField(max_length=64, blank=True, db_index=True)
+    thumbnail = models.FileField(upload_to='retailer_documents/thumbnails/', null=True, blank=True)
+    status = models.CharField(max_length=20, choices=[
+        ('processing', 'Processing'),
+        ('ready', 'Ready'),
+        ('rejected', 'Rejected')
+    ], default='ready')
+    processing_error = models.TextField(blank=True)
     uploaded_at = models.DateTimeField(auto_now_add=True)
 
     def __str__(self):
         return f"{self.document_type} - {self.retailer.user_profile.business_name}"
 
+class DocumentUpload(models.Model):
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    retailer = models.ForeignKey(RetailerProfile, on_delete=models.CASCADE)
+    document_type = models.CharField(max_length=50, choices=DOCUMENT_TYPE_CHOICES)
+    filename = models.CharField(max_length=255)
+    total_size = models.BigIntegerField()
+    received = models.BigIntegerField(default=0)
+    status = models.CharField(max_length=20, choices=[
+        ('uploading', 'Uploading'),
+        ('completed', 'Completed'),
+        ('failed', 'Failed')
+    ], default='uploading')
+    document = models.OneToOneField(Document, on_delete=models.SET_NULL, null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Upload {self.id} - {self.filename}"
+
 class CreditAssessment(models.Model):
     retailer = models.ForeignKey(RetailerProfile, on_delete=models.CASCADE)
     credit_score = models.IntegerField(null=True, blank=True)
@@ -94,7 +142,7 @@ class CreditAssessment(models.Model):
 class Transaction(models.Model):
     supplier = models.ForeignKey(UserProfile, on_delete=models.CASCADE, related_name='supplied_transactions')
     retailer = models.ForeignKey(UserProfile, on_delete=models.CASCADE, related_name='received_transactions')
-    amount = models.DecimalField(max_digits=10, decimal_places=2)
+    amount = MoneyField(max_digits=10, decimal_places=2)
     description = models.CharField(max_length=200)
     status = models.CharField(max_length=10, choices=[
         ('pending', 'Pending'),
@@ -105,24 +153,38 @@ class Transaction(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
     due_date = models.DateTimeField()
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['-created_at', '-id'], name='transaction_created_idx'),
+        ]
+
     def __str__(self):
         return f"Transaction - {self.supplier.business_name} to {self.retailer.business_name}"
 
 class Payment(models.Model):
-    transaction = models.ForeignKey(Transaction, on_delete=models.CASCADE)
-    amount = models.DecimalField(max_digits=10, decimal_places=2)
+    transaction = models.ForeignKey(Transaction, on_delete=models.CASCADE, null=True, blank=True)
+    retailer = models.ForeignKey(UserProfile, on_delete=models.CASCADE, related_name='payments_made', null=True, blank=True)
+    supplier = models.ForeignKey(UserProfile, on_delete=models.CASCADE, related_name='payments_received', null=True, blank=True)
+    amount = MoneyField(max_digits=10, decimal_places=2)
     payment_date = models.DateTimeField(auto_now_add=True)
     payment_method = models.CharField(max_length=50)
     status = models.CharField(max_length=10)
     reference_id = models.CharField(max_length=100)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['-payment_date', '-id'], name='payment_date_idx'),
+            models.Index(fields=['reference_id'], name='payment_reference_idx'),
+        ]
+
     def __str__(self):
-        return f"Payment - {self.transaction.id}"
+        return f"Payment - {self.transaction_id or self.id}"
 
 class DueEntry(models.Model):
     supplier = models.ForeignKey(UserProfile, on_delete=models.CASCADE, related_name='given_dues')
     retailer = models.ForeignKey(UserProfile, on_delete=models.CASCADE, related_name='received_dues')
-    amount = models.DecimalField(max_digits=10, decimal_places=2)
+    amount = MoneyField(max_digits=10, decimal_places=2)
+    amount_paid = MoneyField(max_digits=10, decimal_places=2, default=0)
     description = models.TextField()
     purchase_date = models.DateField()
     due_date = models.DateField()
@@ -131,11 +193,309 @@ class DueEntry(models.Model):
         ('paid', 'Paid'),
         ('overdue', 'Overdue')
     ], default='pending')
+    paid_at = models.DateTimeField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['updated_at'], name='dueentry_updated_idx'),
+            models.Index(fields=['-created_at', '-id'], name='dueentry_created_idx'),
+            models.Index(fields=['due_date'], name='dueentry_due_date_idx'),
+        ]
+
+    @property
+    def balance(self):
+        return self.amount - self.amount_paid
+
+    def __str__(self):
+        return f"Due Entry - {self.supplier.business_name} to {self.retailer.business_name}"
+
+class PaymentAllocation(models.Model):
+    payment = models.ForeignKey(Payment, on_delete=models.CASCADE, related_name='allocations')
+    due = models.ForeignKey(DueEntry, on_delete=models.CASCADE, related_name='allocations')
+    amount = MoneyField(max_digits=10, decimal_places=2)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Allocation - Payment {self.payment_id} to Due {self.due_id}"
+
+class EMIPlan(models.Model):
+    due = models.ForeignKey(DueEntry, on_delete=models.CASCADE, related_name='emi_plans')
+    fintech = models.ForeignKey(UserProfile, on_delete=models.CASCADE, related_name='emi_plans')
+    principal = models.DecimalField(max_digits=12, decimal_places=2)
+    interest_rate = models.DecimalField(max_digits=5, decimal_places=2)
+    tenure_months = models.IntegerField()
+    monthly_amount = models.DecimalField(max_digits=12, decimal_places=2)
+    total_amount = models.DecimalField(max_digits=12, decimal_places=2)
+    # (principal, interest) paise per instalment as packed little-endian int64
+    schedule = models.BinaryField()
+    status = models.CharField(max_length=10, choices=[
+        ('active', 'Active'),
+        ('completed', 'Completed'),
+        ('cancelled', 'Cancelled')
+    ], default='active')
+    activated_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
+    activated_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['due'],
+                condition=models.Q(status='active'),
+                name='one_active_emi_plan_per_due'
+            ),
+        ]
+
+    def __str__(self):
+        return f"EMI Plan - Due {self.due_id} over {self.tenure_months} months"
+
+class EMIOffer(models.Model):
+    """Plans precomputed for a due, valid while its balance and the lenders' rates are unchanged."""
+    due = models.OneToOneField(DueEntry, on_delete=models.CASCADE, primary_key=True, related_name='emi_offer')
+    balance = models.BigIntegerField()  # paise the plans were computed for
+    lenders = models.TextField()  # "fintech:rate" pairs the plans were priced at
+    plans = models.JSONField()
+    computed_at = models.DateTimeField()
+
+    def __str__(self):
+        return f"EMI Offer - Due {self.due_id}"
+
+class RetailerRisk(models.Model):
+    """Denormalised per-retailer portfolio row, refreshed on every ledger write."""
+    retailer = models.OneToOneField(RetailerProfile, on_delete=models.CASCADE, primary_key=True, related_name='risk')
+    profile = models.OneToOneField(UserProfile, on_delete=models.CASCADE, related_name='risk')
+    business_name = models.CharField(max_length=200)
+    business_type = models.CharField(max_length=50)
+    years_in_business = models.IntegerField(default=0)
+    credit_score = models.IntegerField(default=0)
+    assessment = models.ForeignKey(CreditAssessment, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    assessment_status = models.CharField(max_length=20, default='none')
+    assessment_date = models.DateTimeField(null=True, blank=True)
+    approved_limit = MoneyField(max_digits=12, decimal_places=2, default=0)
+    credit_limit = MoneyField(max_digits=12, decimal_places=2, default=0)
+    available_credit = MoneyField(max_digits=12, decimal_places=2, default=0)
+    outstanding = MoneyField(max_digits=12, decimal_places=2, default=0)
+    overdue_amount = MoneyField(max_digits=12, decimal_places=2, default=0)
+    oldest_open_due_date = models.DateField(null=True, blank=True)
+    defaulted = models.BooleanField(default=False)
+    cohort = models.CharField(max_length=7, blank=True)  # YYYY-MM of the first approval
+    utilization = models.FloatField(default=0)
+    overdue_ratio = models.FloatField(default=0)
+    due_count = models.IntegerField(default=0)
+    paid_count = models.IntegerField(default=0)
+    on_time_count = models.IntegerField(default=0)
+    on_time_rate = models.FloatField(default=0)
+    refreshed_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['credit_score', 'retailer'], name='risk_score_idx'),
+            models.Index(fields=['utilization', 'retailer'], name='risk_utilization_idx'),
+            models.Index(fields=['outstanding', 'retailer'], name='risk_outstanding_idx'),
+            models.Index(fields=['approved_limit', 'retailer'], name='risk_approved_limit_idx'),
+            models.Index(fields=['overdue_ratio', 'retailer'], name='risk_overdue_idx'),
+            models.Index(fields=['on_time_rate', 'retailer'], name='risk_on_time_idx'),
+            models.Index(fields=['business_name', 'retailer'], name='risk_name_idx'),
+            models.Index(Collate('business_name', 'NOCASE'), name='risk_name_nocase_idx'),
+            models.Index(fields=['assessment_status', 'credit_score', 'retailer'], name='risk_status_score_idx'),
+            models.Index(fields=['oldest_open_due_date'], name='risk_oldest_due_idx'),
+        ]
+
+    def __str__(self):
+        return f"Risk - {self.business_name}"
+
+class SupplierRetailer(models.Model):
+    """A supplier's running relationship with one retailer, kept in step with their dues."""
+    supplier = models.ForeignKey(UserProfile, on_delete=models.CASCADE, related_name='retailer_links')
+    retailer = models.ForeignKey(UserProfile, on_delete=models.CASCADE, related_name='supplier_links')
+    first_activity = models.DateTimeField()  # first due created
+    last_activity = models.DateTimeField()  # last due created, changed or paid
+    open_balance = MoneyField(max_digits=14, decimal_places=2, default=0)
+    open_dues = models.IntegerField(default=0)
+    due_count = models.IntegerField(default=0)
+    refreshed_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['supplier', 'retailer'], name='unique_supplier_retailer'),
+        ]
+        indexes = [
+            models.Index(fields=['supplier', '-last_activity'], name='relationship_recent_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.supplier.business_name} - {self.retailer.business_name}"
+
+class PortfolioAggregate(models.Model):
+    """Running totals and histograms for one analytics slice, as a packed int64 vector."""
+    dimension = models.CharField(max_length=20)
+    key = models.CharField(max_length=50)
+    data = models.BinaryField()
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['dimension', 'key'], name='unique_portfolio_aggregate'),
+        ]
+
+    def __str__(self):
+        return f"Aggregate - {self.dimension}:{self.key}"
+
+class ChangeLogEntry(models.Model):
+    """One change to a synced object, as seen by one of the profiles it belongs to."""
+    recipient = models.BigIntegerField()  # UserProfile id; not a foreign key so tombstones outlive it
+    kind = models.CharField(max_length=20, choices=[
+        ('due', 'Due'),
+        ('transaction', 'Transaction'),
+        ('payment', 'Payment')
+    ])
+    object_id = models.BigIntegerField()
+    deleted = models.BooleanField(default=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['recipient', 'id'], name='changelog_recipient_idx'),
+            models.Index(fields=['created_at'], name='changelog_created_idx'),
+        ]
+
+    def __str__(self):
+        return f"Change {self.id} - {self.kind} {self.object_id}"
+
+class OutboxEvent(models.Model):
+    """A real-time event written with the change it announces, awaiting relay."""
+    recipient = models.BigIntegerField()  # UserProfile id
+    event_type = models.CharField(max_length=50)
+    payload = models.JSONField(default=dict)
+    attempts = models.IntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Outbox {self.id} - {self.event_type} for {self.recipient}"
+
+class ClientMutation(models.Model):
+    """Stored outcome of a client-identified mutation, so replaying it is a no-op."""
+    profile = models.ForeignKey(UserProfile, on_delete=models.CASCADE, related_name='client_mutations')
+    client_id = models.CharField(max_length=64)
+    operation = models.CharField(max_length=20)
+    object_id = models.BigIntegerField(null=True, blank=True)
+    status_code = models.IntegerField()
+    response = models.JSONField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['profile', 'client_id'], name='unique_client_mutation'),
+        ]
+        indexes = [
+            models.Index(fields=['created_at'], name='clientmutation_created_idx'),
+        ]
+
+    def __str__(self):
+        return f"Mutation {self.client_id} - {self.operation} ({self.status_code})"
+
+class Accrual(models.Model):
+    """One day's interest, and on the first day a late fee, on an overdue due."""
+    due = models.ForeignKey(DueEntry, on_delete=models.CASCADE, related_name='accruals')
+    supplier = models.ForeignKey(UserProfile, on_delete=models.CASCADE, related_name='accruals')
+    accrual_date = models.DateField()
+    interest = MoneyField(max_digits=12, decimal_places=2, default=0)
+    late_fee = MoneyField(max_digits=12, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['due', 'accrual_date'], name='unique_due_accrual'),
+        ]
+        indexes = [
+            models.Index(fields=['supplier', 'accrual_date'], name='accrual_supplier_date_idx'),
+        ]
+
+    def __str__(self):
+        return f"Accrual - Due {self.due_id} on {self.accrual_date}"
+
+class AccrualRun(models.Model):
+    """How far one supplier's accrual for one date has got, so a crashed run resumes."""
+    supplier = models.ForeignKey(UserProfile, on_delete=models.CASCADE, related_name='accrual_runs')
+    accrual_date = models.DateField()
+    last_due_id = models.BigIntegerField(default=0)
+    dues = models.IntegerField(default=0)
+    completed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['supplier', 'accrual_date'], name='unique_accrual_run'),
+        ]
+
+    def __str__(self):
+        return f"Accrual run - {self.supplier_id} on {self.accrual_date}"
+
+class StatementReconciliation(models.Model):
+    """A supplier's bank statement, matched against its open dues by a background job."""
+    supplier = models.ForeignKey(UserProfile, on_delete=models.CASCADE, related_name='reconciliations')
+    statement = models.FileField(upload_to='statements/')
+    original_name = models.CharField(max_length=255, blank=True)
+    job = models.ForeignKey('Job', on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    unmatched_report = models.FileField(upload_to='statements/unmatched/', null=True, blank=True)
+    lines = models.IntegerField(default=0)
+    credits = models.IntegerField(default=0)
+    matched = models.IntegerField(default=0)
+    unmatched = models.IntegerField(default=0)
+    settled_amount = MoneyField(max_digits=14, decimal_places=2, default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    completed_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"Reconciliation {self.id} - {self.supplier.business_name}"
+
+class BankStatementFeatures(models.Model):
+    """Cash-flow features parsed from a bank statement, cached by the file's content hash."""
+    content_hash = models.CharField(max_length=64)
+    version = models.PositiveSmallIntegerField()
+    features = models.JSONField(default=dict)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['content_hash', 'version'], name='unique_statement_features'),
+        ]
+
+    def __str__(self):
+        return f"Statement features {self.content_hash[:12]} v{self.version}"
+
+class Job(models.Model):
+    name = models.CharField(max_length=100)
+    payload = models.JSONField(default=dict, blank=True)
+    priority = models.IntegerField(default=0)
+    status = models.CharField(max_length=10, choices=[
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('succeeded', 'Succeeded'),
+        ('failed', 'Failed'),
+        ('cancelled', 'Cancelled')
+    ], default='queued')
+    attempts = models.IntegerField(default=0)
+    max_attempts = models.IntegerField(default=5)
+    run_at = models.DateTimeField(default=timezone.now)
+    locked_by = models.CharField(max_length=100, blank=True)
+    lease = models.CharField(max_length=32, blank=True, db_index=True)
+    locked_until = models.DateTimeField(null=True, blank=True)
+    progress = models.FloatField(default=0)
+    progress_message = models.CharField(max_length=200, blank=True)
+    result = models.JSONField(null=True, blank=True)
+    error = models.TextField(blank=True)
+    created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', '-priority', 'run_at'], name='job_claim_idx'),
+            models.Index(fields=['status', 'locked_until'], name='job_lease_idx'),
+        ]
 
     def __str__(self):
-        return f"Due Entry - {self.supplier.business_name} to {self.retailer.business_name}"
\ No newline at end of file
+        return f"Job {self.id} - {self.name} ({self.status})"
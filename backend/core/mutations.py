@@ -0,0 +1,276 @@
+"""
+Batched, idempotent mutations for clients that queue writes offline.
+
+A batch is an ordered list of operations, each with a client-generated id.
+The batch runs in one transaction with the caller's profile resolved once,
+and the dues, retailers and earlier outcomes it refers to are loaded up
+front with one query each. Every operation runs in its own savepoint, so a
+rejected operation is reported without undoing the ones around it.
+
+The outcome of every successful operation is stored against
+``(profile, client id)``. Replaying a batch, for example after the response
+was lost, returns the stored outcomes instead of applying the writes again.
+Rejected operations are not stored, so they can be corrected and retried
+under the same id. An operation may refer to a due created earlier by the
+same client as ``"@<client id>"``.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework import status
+
+from .allocation import AllocationError, apply_payment
+from .models import ClientMutation, DueEntry, UserProfile
+from .serializers import DueEntryMutationSerializer, PaymentSerializer
+
+REFERENCE_PREFIX = '@'
+
+
+class MutationError(Exception):
+    """An operation was rejected; ``error`` is returned to the client."""
+
+    def __init__(self, error, status_code=status.HTTP_400_BAD_REQUEST):
+        super().__init__(error)
+        self.error = error
+        self.status_code = status_code
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def _reference(value):
+    if isinstance(value, str) and value.startswith(REFERENCE_PREFIX):
+        return value[len(REFERENCE_PREFIX):]
+    return None
+
+
+class Batch:
+    """The state shared by the operations of one batch."""
+
+    def __init__(self, profile, operations):
+        self.profile = profile
+        self.operations = operations
+        client_ids = {op['id'] for op in operations}
+        references = {
+            _reference(op['data'].get('due')) for op in operations
+        } - {None}
+        self.outcomes = {
+            record.client_id: record
+            for record in ClientMutation.objects.filter(
+                profile=profile, client_id__in=client_ids | references
+            )
+        }
+
+        due_ids = set()
+        retailer_ids = set()
+        for op in operations:
+            due = op['data'].get('due')
+            if _reference(due) is None and due is not None:
+                due_ids.add(due)
+            if op['op'] == 'create_due' and op['data'].get('retailer') is not None:
+                retailer_ids.add(op['data']['retailer'])
+        for client_id in references & set(self.outcomes):
+            if self.outcomes[client_id].object_id is not None:
+                due_ids.add(self.outcomes[client_id].object_id)
+
+        self.dues = DueEntry.objects.select_related('supplier', 'retailer').in_bulk(_ints(due_ids))
+        self.retailers = UserProfile.objects.in_bulk(_ints(retailer_ids))
+
+    def due(self, value):
+        """The due ``value`` names, by id or by ``@client id`` reference."""
+        if value is None:
+            raise MutationError('Missing due')
+        client_id = _reference(value)
+        if client_id is not None:
+            outcome = self.outcomes.get(client_id)
+            if outcome is None or outcome.operation != 'create_due':
+                raise MutationError(f'Unknown due reference: {value}')
+            value = outcome.object_id
+        due = self.dues.get(_int(value))
+        if due is None:
+            raise MutationError('Due not found', status.HTTP_404_NOT_FOUND)
+        if self.profile.id not in (due.supplier_id, due.retailer_id):
+            raise MutationError('You do not have permission to access this due', status.HTTP_403_FORBIDDEN)
+        return due
+
+    def supplier_due(self, value, action):
+        due = self.due(value)
+        if due.supplier_id != self.profile.id:
+            raise MutationError(f'Only suppliers can {action} due entries', status.HTTP_403_FORBIDDEN)
+        return due
+
+
+def _int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _ints(values):
+    return [value for value in map(_int, values) if value is not None]
+
+
+# Operations ----------------------------------------------------------------
+# Each takes the batch and the operation data and returns
+# ``(status code, response, object id)``.
+
+def create_due(batch, data):
+    if batch.profile.user_type != 'supplier':
+        raise MutationError('Only suppliers can create due entries', status.HTTP_403_FORBIDDEN)
+    retailer = batch.retailers.get(_int(data.get('retailer')))
+    if retailer is None:
+        raise MutationError('Retailer not found', status.HTTP_404_NOT_FOUND)
+    if retailer.user_type != 'retailer':
+        raise MutationError('Selected user is not a retailer')
+
+    serializer = DueEntryMutationSerializer(data={
+        'amount': data.get('amount'),
+        'description': data.get('description'),
+        'purchase_date': data.get('purchase_date'),
+        'due_date': data.get('due_date'),
+    })
+    if not serializer.is_valid():
+        raise MutationError(serializer.errors)
+    due = serializer.save(supplier=batch.profile, retailer=retailer, status='pending')
+    batch.dues[due.id] = due
+    return status.HTTP_201_CREATED, serializer.data, due.id
+
+
+def update_due(batch, data):
+    due = batch.supplier_due(data.get('due'), 'update')
+    fields = {key: value for key, value in data.items() if key != 'due'}
+    serializer = DueEntryMutationSerializer(due, data=fields, partial=True)
+    if not serializer.is_valid():
+        raise MutationError(serializer.errors)
+    serializer.save()
+    return status.HTTP_200_OK, serializer.data, due.id
+
+
+def delete_due(batch, data):
+    due = batch.supplier_due(data.get('due'), 'delete')
+    due_id = due.id
+    due.delete()
+    del batch.dues[due_id]
+    return status.HTTP_204_NO_CONTENT, None, due_id
+
+
+def make_payment(batch, data):
+    due = batch.due(data.get('due'))
+    if due.retailer_id != batch.profile.id:
+        raise MutationError('Only retailers can make payments', status.HTTP_403_FORBIDDEN)
+    if due.status == 'paid':
+        raise MutationError('This due has already been paid')
+    try:
+        payment, _ = apply_payment(
+            retailer=batch.profile,
+            amount=data.get('amount', due.balance),
+            payment_method=data.get('payment_method', ''),
+            reference_id=data.get('reference_id', ''),
+            supplier=due.supplier,
+            due_ids=[due.id]
+        )
+    except AllocationError as e:
+        raise MutationError(str(e))
+
+    due.refresh_from_db(fields=['amount_paid', 'status', 'paid_at', 'updated_at'])
+    return status.HTTP_200_OK, {
+        'message': 'Payment successful',
+        'payment': PaymentSerializer(payment).data,
+        'due': DueEntryMutationSerializer(due).data
+    }, payment.id
+
+
+OPERATIONS = {
+    'create_due': create_due,
+    'update_due': update_due,
+    'delete_due': delete_due,
+    'make_payment': make_payment,
+}
+
+
+def parse(payload):
+    """Validate the shape of a batch; returns the operations or raises ``MutationError``."""
+    operations = payload.get('operations') if isinstance(payload, dict) else None
+    if not isinstance(operations, list) or not operations:
+        raise MutationError('operations must be a non-empty list')
+    limit = _setting('MUTATION_BATCH_SIZE', 100)
+    if len(operations) > limit:
+        raise MutationError(f'At most {limit} operations per batch')
+
+    parsed = []
+    for index, op in enumerate(operations):
+        if not isinstance(op, dict):
+            raise MutationError(f'Operation {index} must be an object')
+        client_id = op.get('id')
+        if not isinstance(client_id, str) or not 0 < len(client_id) <= 64:
+            raise MutationError(f'Operation {index} needs a client id of at most 64 characters')
+        if op.get('op') not in OPERATIONS:
+            raise MutationError(f'Operation {index} has an unknown op: {op.get("op")}')
+        data = op.get('data', {})
+        if not isinstance(data, dict):
+            raise MutationError(f'Operation {index} data must be an object')
+        parsed.append({'id': client_id, 'op': op['op'], 'data': data})
+    return parsed
+
+
+def _result(client_id, status_code, response, replayed=False):
+    result = {'id': client_id, 'status': status_code, 'replayed': replayed}
+    if status_code >= 400:
+        result['error'] = response
+    else:
+        result['data'] = response
+    return result
+
+
+def apply(profile, operations):
+    """Apply parsed ``operations`` in order and return one result per operation."""
+    results = []
+    with transaction.atomic():
+        batch = Batch(profile, operations)
+        for op in operations:
+            client_id = op['id']
+            outcome = batch.outcomes.get(client_id)
+            if outcome is not None:
+                if outcome.operation != op['op']:
+                    results.append(_result(
+                        client_id, status.HTTP_409_CONFLICT,
+                        f'Client id already used for {outcome.operation}'
+                    ))
+                else:
+                    results.append(_result(client_id, outcome.status_code, outcome.response, replayed=True))
+                continue
+
+            try:
+                with transaction.atomic():
+                    status_code, response, object_id = OPERATIONS[op['op']](batch, op['data'])
+                    outcome = ClientMutation.objects.create(
+                        profile=profile, client_id=client_id, operation=op['op'],
+                        object_id=object_id, status_code=status_code, response=response
+                    )
+            except MutationError as e:
+                results.append(_result(client_id, e.status_code, e.error))
+                continue
+            except IntegrityError:
+                # A concurrent replay of the same operation committed first.
+                outcome = ClientMutation.objects.filter(profile=profile, client_id=client_id).first()
+                if outcome is None:
+                    raise
+                batch.outcomes[client_id] = outcome
+                results.append(_result(client_id, outcome.status_code, outcome.response, replayed=True))
+                continue
+
+            batch.outcomes[client_id] = outcome
+            results.append(_result(client_id, status_code, response))
+    return results
+
+
+def prune(days=None):
+    """Forget outcomes older than ``MUTATION_RETENTION_DAYS``; returns the number deleted."""
+    days = _setting('MUTATION_RETENTION_DAYS', 30) if days is None else days
+    cutoff = timezone.now() - timedelta(days=days)
+    deleted, _ = ClientMutation.objects.filter(created_at__lt=cutoff).delete()
+    return deleted
@@ -0,0 +1,155 @@
+"""
+Transactional outbox for real-time events.
+
+Events are inserted into ``OutboxEvent`` by the same transaction as the
+ledger change they announce, so an event exists exactly when its change was
+committed. Request threads only pay for that insert; ``manage.py
+relay_outbox`` publishes the events to each recipient's ``user_<id>``
+channel group.
+
+The relay reads the oldest events in batches, groups them by recipient and
+sends each recipient's events as one ordered message, with recipients
+published concurrently. Events are deleted only after the channel layer has
+accepted them, so delivery is at least once. A recipient whose send fails is
+backed off and retried from its oldest event, which keeps its events in
+order. Every event carries its outbox id, which clients use to drop
+redeliveries. Relays can share the work by recipient with ``--partitions``,
+so one recipient's events are always published by one relay.
+"""
+import asyncio
+import logging
+import time
+from collections import defaultdict
+
+from asgiref.sync import sync_to_async
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.models import F
+from django.db.models.functions import Mod
+
+from .models import OutboxEvent, UserProfile
+
+logger = logging.getLogger(__name__)
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def emit(recipients, event_type, data):
+    """Queue ``event_type`` for every profile id in ``recipients`` in the current transaction."""
+    OutboxEvent.objects.bulk_create(
+        OutboxEvent(recipient=recipient, event_type=event_type, payload=data)
+        for recipient in {recipient for recipient in recipients if recipient is not None}
+    )
+
+
+def emit_many(events):
+    """Queue several ``(recipients, event_type, data)`` events at once."""
+    OutboxEvent.objects.bulk_create(
+        OutboxEvent(recipient=recipient, event_type=event_type, payload=data)
+        for recipients, event_type, data in events
+        for recipient in {recipient for recipient in recipients if recipient is not None}
+    )
+
+
+class Relay:
+    """Publish outbox events to the channel layer."""
+
+    def __init__(self, batch_size=None, partition=0, partitions=1, channel_layer=None):
+        self.batch_size = batch_size or _setting('OUTBOX_BATCH_SIZE', 500)
+        self.events_per_message = _setting('OUTBOX_EVENTS_PER_MESSAGE', 100)
+        self.retry_delay = _setting('OUTBOX_RETRY_DELAY', 5)
+        self.partition = partition
+        self.partitions = partitions
+        self.channel_layer = channel_layer or get_channel_layer()
+        self._users = {}  # profile id -> auth user id
+        self._backoff = {}  # recipient -> monotonic time it may be retried
+
+    # Database side, run in a worker thread -----------------------------------
+
+    def claim(self):
+        """The oldest unpublished events of recipients that are not backed off."""
+        now = time.monotonic()
+        self._backoff = {recipient: until for recipient, until in self._backoff.items() if until > now}
+        events = OutboxEvent.objects.all()
+        if self.partitions > 1:
+            events = events.alias(part=Mod('recipient', self.partitions)).filter(part=self.partition)
+        if self._backoff:
+            events = events.exclude(recipient__in=list(self._backoff))
+        rows = list(
+            events.order_by('id').values_list('id', 'recipient', 'event_type', 'payload')[:self.batch_size]
+        )
+
+        missing = {row[1] for row in rows} - set(self._users)
+        if missing:
+            self._users.update(UserProfile.objects.filter(id__in=missing).values_list('id', 'user_id'))
+        return rows
+
+    def ack(self, event_ids):
+        if event_ids:
+            OutboxEvent.objects.filter(id__in=event_ids).delete()
+
+    def nack(self, event_ids):
+        if event_ids:
+            OutboxEvent.objects.filter(id__in=event_ids).update(attempts=F('attempts') + 1)
+
+    # Publishing ---------------------------------------------------------------
+
+    async def _send(self, user_id, events):
+        group = f'user_{user_id}'
+        for start in range(0, len(events), self.events_per_message):
+            await self.channel_layer.group_send(group, {
+                'type': 'outbox.events',
+                'events': events[start:start + self.events_per_message],
+            })
+
+    async def drain(self):
+        """Publish one batch; returns the number of events published."""
+        rows = await sync_to_async(self.claim)()
+        if not rows:
+            return 0
+
+        by_recipient = defaultdict(list)
+        for event_id, recipient, event_type, payload in rows:
+            by_recipient[recipient].append({'id': event_id, 'type': event_type, 'data': payload})
+
+        # Events of profiles that no longer exist have nobody to go to.
+        recipients = [recipient for recipient in by_recipient if recipient in self._users]
+        results = dict(zip(recipients, await asyncio.gather(
+            *(self._send(self._users[recipient], by_recipient[recipient]) for recipient in recipients),
+            return_exceptions=True
+        )))
+
+        delivered = []
+        failed = []
+        for recipient, events in by_recipient.items():
+            ids = [event['id'] for event in events]
+            error = results.get(recipient)
+            if isinstance(error, Exception):
+                failed.extend(ids)
+                self._backoff[recipient] = time.monotonic() + self.retry_delay
+                logger.warning('Outbox delivery to profile %s failed: %r', recipient, error)
+            else:
+                delivered.extend(ids)
+        # A message that reached the layer but was not acknowledged here is
+        # sent again; clients drop it by id.
+        await sync_to_async(self.ack)(delivered)
+        await sync_to_async(self.nack)(failed)
+        return len(delivered)
+
+    async def run(self, stop_event, poll_interval=None):
+        poll_interval = poll_interval or _setting('OUTBOX_POLL_INTERVAL', 0.2)
+        while not stop_event.is_set():
+            try:
+                published = await self.drain()
+            except Exception:
+                logger.exception('Outbox relay batch failed')
+                await sync_to_async(close_old_connections)()
+                published = 0
+            if published < self.batch_size:
+                try:
+                    await asyncio.wait_for(stop_event.wait(), timeout=poll_interval)
+                except asyncio.TimeoutError:
+                    pass
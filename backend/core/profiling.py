@@ -0,0 +1,223 @@
+"""
+Opt-in request profiling with captures kept on disk.
+
+``ProfilingMiddleware`` profiles a request when a staff user sends
+``X-Profile: 1`` or when it falls in the ``PROFILING_SAMPLE_RATE`` sample.
+The view runs under ``cProfile``, and every SQL query on every database
+connection goes through an ``execute_wrapper`` that records its time and
+the first frame of project code that issued it.
+
+Each capture is two files in ``PROFILING_DIR``: the ``cProfile`` stats
+(``.prof``, readable by ``pstats``, snakeviz and friends) and a JSON summary
+with the route, status, duration and queries. File names begin with the
+route and duration, so captures can be picked out by listing the directory
+alone. Only the newest ``PROFILING_MAX_CAPTURES`` are kept. A header-
+triggered response names its capture in ``X-Profile-Id``.
+
+``manage.py profile_hotspots`` lists captures and merges them into the top
+functions and queries.
+"""
+import cProfile
+import json
+import logging
+import os
+import random
+import re
+import sys
+import tempfile
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+SUFFIXES = ('.prof', '.json')
+NAME = re.compile(r'^(?P<route>.+)--(?P<duration>\d+)ms--(?P<stamp>\d{8}T\d{6}\d{6})-(?P<pid>\d+)$')
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def capture_dir():
+    return str(_setting('PROFILING_DIR', os.path.join(settings.BASE_DIR, 'profiles')))
+
+
+def route_slug(route):
+    return re.sub(r'[^A-Za-z0-9]+', '_', route).strip('_') or 'root'
+
+
+class QueryRecorder:
+    """An ``execute_wrapper`` that times queries and notes where they came from."""
+
+    def __init__(self, alias, limit):
+        self.alias = alias
+        self.limit = limit
+        self.queries = []
+        self.count = 0
+        self.seconds = 0.0
+        self.root = str(settings.BASE_DIR)
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - start
+            self.count += 1
+            self.seconds += elapsed
+            if len(self.queries) < self.limit:
+                self.queries.append({
+                    'sql': sql,
+                    'ms': round(elapsed * 1000, 3),
+                    'many': many,
+                    'database': self.alias,
+                    'origin': self.origin(),
+                })
+
+    def origin(self):
+        frame = sys._getframe(2)
+        while frame is not None:
+            filename = frame.f_code.co_filename
+            if filename.startswith(self.root) and filename != __file__:
+                return f'{os.path.relpath(filename, self.root)}:{frame.f_lineno} in {frame.f_code.co_name}'
+            frame = frame.f_back
+        return ''
+
+
+class ProfilingMiddleware:
+    """Profile opted-in requests and write the capture to ``PROFILING_DIR``."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def wants_profile(self, request):
+        if not _setting('PROFILING_ENABLED', True):
+            return False
+        user = getattr(request, 'user', None)
+        if request.headers.get('X-Profile') == '1' and user is not None and user.is_staff:
+            return True
+        rate = _setting('PROFILING_SAMPLE_RATE', 0.0)
+        return rate > 0 and random.random() < rate
+
+    def __call__(self, request):
+        if not self.wants_profile(request):
+            return self.get_response(request)
+
+        limit = _setting('PROFILING_MAX_QUERIES', 1000)
+        recorders = [QueryRecorder(connection.alias, limit) for connection in connections.all()]
+        profile = cProfile.Profile()
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            for connection, recorder in zip(connections.all(), recorders):
+                stack.enter_context(connection.execute_wrapper(recorder))
+            profile.enable()
+            try:
+                response = self.get_response(request)
+            finally:
+                profile.disable()
+        duration = time.perf_counter() - started
+
+        try:
+            capture_id = save(request, response, profile, recorders, duration)
+        except OSError:
+            logger.exception('Could not save the profile of %s', request.path)
+            return response
+        if request.headers.get('X-Profile') == '1':
+            response['X-Profile-Id'] = capture_id
+        return response
+
+
+def save(request, response, profile, recorders, duration):
+    """Write a capture and prune old ones. Returns the capture id."""
+    match = getattr(request, 'resolver_match', None)
+    route = (match.route if match else '') or request.path_info
+    now = timezone.now()
+    capture_id = (
+        f'{route_slug(route)}--{int(duration * 1000)}ms--{now.strftime("%Y%m%dT%H%M%S%f")}-{os.getpid()}'
+    )
+    user = getattr(request, 'user', None)
+    summary = {
+        'id': capture_id,
+        'route': route,
+        'method': request.method,
+        'path': request.path_info,
+        'query_string': request.META.get('QUERY_STRING', ''),
+        'status': response.status_code,
+        'user': user.pk if user is not None and user.is_authenticated else None,
+        'duration_ms': round(duration * 1000, 3),
+        'captured_at': now.isoformat(),
+        'sql_count': sum(recorder.count for recorder in recorders),
+        'sql_ms': round(sum(recorder.seconds for recorder in recorders) * 1000, 3),
+        'queries': [query for recorder in recorders for query in recorder.queries],
+    }
+
+    directory = capture_dir()
+    os.makedirs(directory, exist_ok=True)
+    _write(directory, capture_id + '.prof', profile.dump_stats)
+    _write(directory, capture_id + '.json', lambda path: _dump_json(path, summary))
+    prune(directory)
+    return capture_id
+
+
+def _write(directory, name, writer):
+    # Written aside and renamed, so readers never see half a capture file.
+    fd, temp = tempfile.mkstemp(dir=directory, prefix='.capture-')
+    os.close(fd)
+    try:
+        writer(temp)
+        os.replace(temp, os.path.join(directory, name))
+    except BaseException:
+        if os.path.exists(temp):
+            os.remove(temp)
+        raise
+
+
+def _dump_json(path, data):
+    with open(path, 'w') as handle:
+        json.dump(data, handle)
+
+
+def captures(directory=None):
+    """Captures on disk, newest first, as dicts of id, route, duration and stamp."""
+    directory = directory or capture_dir()
+    found = []
+    try:
+        entries = list(os.scandir(directory))
+    except FileNotFoundError:
+        return []
+    for entry in entries:
+        if not entry.name.endswith('.json'):
+            continue
+        match = NAME.match(entry.name[:-len('.json')])
+        if match:
+            found.append({
+                'id': match.group(0),
+                'route': match.group('route'),
+                'duration_ms': int(match.group('duration')),
+                'stamp': match.group('stamp'),
+            })
+    found.sort(key=lambda capture: capture['stamp'], reverse=True)
+    return found
+
+
+def prune(directory, keep=None):
+    keep = keep or _setting('PROFILING_MAX_CAPTURES', 200)
+    for capture in captures(directory)[keep:]:
+        for suffix in SUFFIXES:
+            try:
+                os.remove(os.path.join(directory, capture['id'] + suffix))
+            except FileNotFoundError:
+                pass
+
+
+def load_summary(capture_id, directory=None):
+    with open(os.path.join(directory or capture_dir(), capture_id + '.json')) as handle:
+        return json.load(handle)
+
+
+def profile_path(capture_id, directory=None):
+    return os.path.join(directory or capture_dir(), capture_id + '.prof')
@@ -0,0 +1,212 @@
+"""
+Keep derived ledger state in step with writes.
+
+Per-instance saves and deletes arrive through ``post_save``/``post_delete``;
+bulk paths such as the allocation engine send ``payment_allocated`` instead,
+and statement reconciliation sends ``payments_allocated`` once per batch.
+"""
+import threading
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from . import aging, analytics, changefeed, outbox, relationships, reminders, risk
+from .models import (
+    CreditAssessment, DueEntry, Payment, RetailerProfile, RetailerRisk, Transaction,
+    UserProfile
+)
+from .signals import payment_allocated, payments_allocated
+
+
+@receiver(pre_save, sender=DueEntry)
+def due_saving(sender, instance, update_fields=None, **kwargs):
+    # A due moved to another supplier or retailer also changes the pair it left.
+    if instance.pk is None or (update_fields is not None and not {'supplier', 'retailer'} & set(update_fields)):
+        return
+    previous = DueEntry.objects.filter(pk=instance.pk).values_list('supplier_id', 'retailer_id').first()
+    if previous and previous != (instance.supplier_id, instance.retailer_id):
+        refresh_relationships([previous])
+
+
+@receiver(post_save, sender=DueEntry)
+def due_saved(sender, instance, created, **kwargs):
+    aging.invalidate(instance.supplier_id)
+    reminders.due_changed(instance.id, instance.due_date, instance.status)
+    refresh_risk(profile_ids=[instance.retailer_id])
+    refresh_relationships([(instance.supplier_id, instance.retailer_id)])
+    changefeed.record('due', instance.id, [instance.supplier_id, instance.retailer_id])
+    outbox.emit(
+        [instance.supplier_id, instance.retailer_id],
+        'due_created' if created else 'due_updated',
+        due_event(instance)
+    )
+
+
+@receiver(post_delete, sender=DueEntry)
+def due_removed(sender, instance, **kwargs):
+    aging.invalidate(instance.supplier_id)
+    reminders.due_deleted(instance.id)
+    refresh_risk(profile_ids=[instance.retailer_id])
+    refresh_relationships([(instance.supplier_id, instance.retailer_id)])
+    changefeed.record('due', instance.id, [instance.supplier_id, instance.retailer_id], deleted=True)
+    outbox.emit([instance.supplier_id, instance.retailer_id], 'due_deleted', {'id': instance.id})
+
+
+def due_event(due):
+    return {
+        'id': due.id,
+        'supplier': due.supplier_id,
+        'retailer': due.retailer_id,
+        'amount': str(due.amount),
+        'amount_paid': str(due.amount_paid),
+        'due_date': str(due.due_date),
+        'status': due.status,
+    }
+
+
+@receiver(payment_allocated, sender=Payment)
+def payment_written(sender, payment, allocations, **kwargs):
+    payments_written(sender, [(payment, allocations)])
+
+
+@receiver(payments_allocated, sender=Payment)
+def payments_written(sender, payments, **kwargs):
+    # One pass for the whole batch, so bulk settlement pays for one changefeed
+    # and one outbox write rather than one per payment.
+    suppliers = {allocation.supplier_id for _, allocations in payments for allocation in allocations}
+    for supplier_id in suppliers:
+        aging.invalidate(supplier_id)
+    for _, allocations in payments:
+        for allocation in allocations:
+            if allocation.status == 'paid':
+                reminders.due_deleted(allocation.due_id)
+    refresh_risk(profile_ids={payment.retailer_id for payment, _ in payments})
+    refresh_relationships(
+        (allocation.supplier_id, payment.retailer_id) for payment, allocations in payments for allocation in allocations
+    )
+    changes, events = [], []
+    for payment, allocations in payments:
+        payment_suppliers = {allocation.supplier_id for allocation in allocations}
+        changes.append(('payment', payment.id, [payment.retailer_id, *payment_suppliers], False))
+        changes.extend(
+            ('due', allocation.due_id, [payment.retailer_id, allocation.supplier_id], False) for allocation in allocations
+        )
+        # The retailer sees the whole payment, each supplier only its share.
+        events.append(([payment.retailer_id], 'payment_made', payment_event(payment, allocations)))
+        events.extend(
+            ([supplier_id], 'payment_made', payment_event(
+                payment, [allocation for allocation in allocations if allocation.supplier_id == supplier_id]
+            ))
+            for supplier_id in sorted(payment_suppliers)
+        )
+    changefeed.record_many(changes)
+    outbox.emit_many(events)
+
+
+def payment_event(payment, allocations):
+    return {
+        'payment': payment.id,
+        'amount': str(sum(allocation.amount for allocation in allocations)),
+        'payment_method': payment.payment_method,
+        'dues': [
+            {
+                'id': allocation.due_id,
+                'amount': str(allocation.amount),
+                'amount_paid': str(allocation.amount_paid),
+                'status': allocation.status,
+            }
+            for allocation in allocations
+        ],
+    }
+
+
+@receiver(post_save, sender=Transaction)
+def transaction_saved(sender, instance, **kwargs):
+    changefeed.record('transaction', instance.id, [instance.supplier_id, instance.retailer_id])
+
+
+@receiver(post_delete, sender=Transaction)
+def transaction_removed(sender, instance, **kwargs):
+    changefeed.record('transaction', instance.id, [instance.supplier_id, instance.retailer_id], deleted=True)
+
+
+@receiver(post_save, sender=Payment)
+def payment_saved(sender, instance, **kwargs):
+    changefeed.record('payment', instance.id, payment_parties(instance))
+
+
+@receiver(post_delete, sender=Payment)
+def payment_removed(sender, instance, **kwargs):
+    changefeed.record('payment', instance.id, payment_parties(instance), deleted=True)
+
+
+def payment_parties(payment):
+    parties = [payment.retailer_id, payment.supplier_id]
+    if payment.transaction_id:
+        parties += Transaction.objects.filter(id=payment.transaction_id).values_list('supplier_id', 'retailer_id').first() or []
+    return parties
+
+
+@receiver(post_save, sender=CreditAssessment)
+@receiver(post_delete, sender=CreditAssessment)
+def assessment_changed(sender, instance, **kwargs):
+    refresh_risk(retailer_ids=[instance.retailer_id])
+
+
+@receiver(post_save, sender=RetailerProfile)
+def retailer_profile_saved(sender, instance, **kwargs):
+    refresh_risk(retailer_ids=[instance.id])
+
+
+@receiver(post_save, sender=UserProfile)
+def user_profile_saved(sender, instance, created, **kwargs):
+    if instance.user_type == 'retailer' and not created:
+        refresh_risk(profile_ids=[instance.id])
+
+
+@receiver(post_delete, sender=RetailerRisk)
+def risk_removed(sender, instance, **kwargs):
+    analytics.apply_changes([analytics.row_fields(instance)], [])
+
+
+_pending_risk = threading.local()
+
+
+def refresh_risk(retailer_ids=(), profile_ids=()):
+    # Deferred to commit so the rows see the finished write, and so cascading
+    # deletes do not recreate rows for a retailer that is going away. Ids are
+    # pooled until then, so a transaction with many writes for one retailer
+    # refreshes its row once.
+    if not hasattr(_pending_risk, 'retailer_ids'):
+        _pending_risk.retailer_ids = set()
+        _pending_risk.profile_ids = set()
+    _pending_risk.retailer_ids.update(retailer_ids)
+    _pending_risk.profile_ids.update(profile_ids)
+    transaction.on_commit(_flush_risk)
+
+
+def _flush_risk():
+    retailer_ids, _pending_risk.retailer_ids = _pending_risk.retailer_ids, set()
+    profile_ids, _pending_risk.profile_ids = _pending_risk.profile_ids, set()
+    if retailer_ids:
+        risk.refresh(retailer_ids)
+    if profile_ids:
+        risk.refresh_for_profiles(profile_ids)
+
+
+_pending_relationships = threading.local()
+
+
+def refresh_relationships(pairs):
+    # Pooled and deferred to commit like the risk rows.
+    if not hasattr(_pending_relationships, 'pairs'):
+        _pending_relationships.pairs = set()
+    _pending_relationships.pairs.update(pairs)
+    transaction.on_commit(_flush_relationships)
+
+
+def _flush_relationships():
+    pairs, _pending_relationships.pairs = _pending_relationships.pairs, set()
+    if pairs:
+        relationships.refresh(pairs)
@@ -0,0 +1,473 @@
+"""
+Bank statement reconciliation.
+
+A supplier uploads a bank statement CSV and credits on it are matched to the
+supplier's open dues. The statement is streamed a line at a time, so memory
+grows with the number of open dues, not with the size of the file:
+
+* ``DueIndex`` holds the open dues in a hash index keyed on
+  ``(retailer, balance in paise)``, plus an index by id for statement lines
+  that quote a due (``DUE-123``).
+* ``RetailerIndex`` finds the paying retailer in a line's narration by phone
+  number, GSTIN or business name, with hash lookups per word.
+* A credit matches the open due of that retailer with exactly its balance
+  whose window, from ``RECONCILE_EARLY_DAYS`` before the purchase date to
+  ``RECONCILE_LATE_DAYS`` after the due date, holds the credit's date; the
+  earliest due date wins. A quoted due may also be paid in part.
+
+Matches are settled in batches of ``RECONCILE_SETTLE_BATCH_SIZE``: one
+transaction re-reads the dues under lock, then bulk-creates the payments and
+allocations and bulk-updates the dues, as the allocation engine does. Every
+payment carries the line's bank reference (or a hash of the line), and a line
+whose reference was already settled is skipped, so uploading a statement
+twice settles nothing twice. Lines that cannot be settled are streamed to a
+CSV report with the reason. Lines are checked for earlier settlement in
+chunks of ``RECONCILE_CHUNK_SIZE``, against the payments on file and the
+references already matched in the run; ``settle`` checks again under a lock
+on the supplier, so concurrent runs cannot both settle a reference.
+"""
+import codecs
+import csv
+import hashlib
+import logging
+import re
+import tempfile
+from bisect import insort
+from collections import defaultdict, namedtuple
+from datetime import datetime, timedelta
+from decimal import Decimal, InvalidOperation
+
+from django.conf import settings
+from django.core.files import File
+from django.db import transaction
+from django.utils import timezone
+
+from .allocation import BALANCE_PAISE, OPEN_STATUSES, Allocation
+from .models import DueEntry, Payment, PaymentAllocation, StatementReconciliation, UserProfile
+from .signals import payments_allocated
+
+logger = logging.getLogger(__name__)
+
+Line = namedtuple('Line', 'number date amount reference narration')
+Match = namedtuple('Match', 'line due_id retailer_id amount reference')
+
+COLUMNS = {
+    'date': ('date', 'txn date', 'transaction date', 'value date', 'posting date', 'tran date'),
+    'credit': ('credit', 'credit amount', 'deposit', 'deposits', 'deposit amt', 'cr', 'amount'),
+    'debit': ('debit', 'debit amount', 'withdrawal', 'withdrawals', 'withdrawal amt', 'dr'),
+    'reference': ('reference', 'ref', 'ref no', 'reference no', 'utr', 'chq/ref no', 'cheque no', 'transaction id'),
+    'narration': ('narration', 'description', 'particulars', 'remarks', 'details'),
+    'balance': ('balance', 'closing balance', 'balance amt', 'running balance'),
+}
+DATE_FORMATS = ('%Y-%m-%d', '%d/%m/%Y', '%d-%m-%Y', '%d-%b-%Y', '%d %b %Y', '%d/%m/%y', '%d-%m-%y', '%d.%m.%Y')
+
+DUE_REFERENCE = re.compile(r'\bDUE[\s#:/-]*(\d+)\b')
+WORD = re.compile(r'[A-Z0-9]+')
+
+REPORT_HEADER = ('line', 'date', 'amount', 'reference', 'narration', 'reason', 'retailer')
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+class StatementError(ValueError):
+    """Raised when a statement file cannot be read at all."""
+
+
+# Statement parsing ------------------------------------------------------------
+
+def find_columns(header, required=('date', 'credit')):
+    """Map the known ``COLUMNS`` to their positions in a statement's header row."""
+    normalized = [' '.join(name.strip().lower().replace('.', '').split()) for name in header]
+    found = {}
+    for key, names in COLUMNS.items():
+        for name in names:
+            if name in normalized:
+                found[key] = normalized.index(name)
+                break
+    missing = [key for key in required if key not in found]
+    if missing:
+        raise StatementError(f'The statement has no {" or ".join(missing)} column')
+    return found
+
+
+def to_paise(text):
+    """A statement amount such as ``1,250.00 Cr`` in paise; ``Dr`` amounts are negative."""
+    text = text.strip().replace(',', '').replace('₹', '').upper()
+    sign = 1
+    if text.endswith(('CR', 'DR')):
+        sign = -1 if text.endswith('DR') else 1
+        text = text[:-2].strip()
+    if not text or text == '-':
+        return 0
+    return sign * int((Decimal(text) * 100).to_integral_value())
+
+
+class DateParser:
+    """Parse statement dates, trying the format that worked last time first."""
+
+    def __init__(self):
+        self.formats = list(DATE_FORMATS)
+
+    def __call__(self, text):
+        text = text.strip()
+        for i, fmt in enumerate(self.formats):
+            try:
+                value = datetime.strptime(text, fmt).date()
+            except ValueError:
+                continue
+            if i:
+                self.formats.insert(0, self.formats.pop(i))
+            return value
+        raise ValueError(f'Unrecognised date: {text!r}')
+
+
+def read_statement(stream):
+    """
+    Yield ``(Line, error)`` for each row of a statement CSV read from ``stream`` (bytes).
+
+    ``error`` is set, and the line's fields are raw text, when a row cannot
+    be parsed. Debits and zero-value rows are yielded with a zero amount.
+    """
+    reader = csv.reader(codecs.iterdecode(stream, 'utf-8-sig', errors='replace'))
+    header = next(reader, None)
+    if header is None:
+        raise StatementError('The statement is empty')
+    columns = find_columns(header)
+    parse_date = DateParser()
+    width = max(columns.values()) + 1
+
+    def cell(row, key):
+        index = columns.get(key)
+        return row[index].strip() if index is not None else ''
+
+    for number, row in enumerate(reader, start=2):
+        if not any(value.strip() for value in row):
+            continue
+        row = row + [''] * (width - len(row))
+        reference, narration = cell(row, 'reference'), cell(row, 'narration')
+        try:
+            if cell(row, 'debit') and to_paise(cell(row, 'debit')):
+                amount = 0
+            else:
+                amount = max(to_paise(cell(row, 'credit')), 0)
+            yield Line(number, parse_date(cell(row, 'date')), amount, reference, narration), None
+        except (ValueError, InvalidOperation):
+            yield Line(number, cell(row, 'date'), cell(row, 'credit'), reference, narration), 'unparseable'
+
+
+def line_reference(line):
+    """The payment reference a line is settled under."""
+    if line.reference:
+        return line.reference[:100]
+    digest = hashlib.sha1(f'{line.date}|{line.amount}|{line.narration}'.encode()).hexdigest()
+    return f'stmt-{digest[:20]}'
+
+
+# Indexes ------------------------------------------------------------------------
+
+def _words(text):
+    return WORD.findall(text.upper())
+
+
+class RetailerIndex:
+    """Find one of a set of retailers in free narration text."""
+
+    def __init__(self, retailer_ids):
+        self.tokens = {}
+        self.names = defaultdict(list)  # first word -> [(words, retailer id)], longest first
+        ambiguous = set()
+        profiles = UserProfile.objects.filter(id__in=retailer_ids).values_list(
+            'id', 'phone', 'gst_number', 'business_name'
+        )
+        for retailer_id, phone, gst_number, business_name in profiles:
+            tokens = []
+            digits = re.sub(r'\D', '', phone or '')
+            if len(digits) >= 10:
+                tokens.append(digits[-10:])
+            if gst_number:
+                tokens.append(gst_number.strip().upper())
+            for token in tokens:
+                if self.tokens.setdefault(token, retailer_id) != retailer_id:
+                    ambiguous.add(token)
+            words = tuple(_words(business_name or ''))
+            if words:
+                self.names[words[0]].append((words, retailer_id))
+        for token in ambiguous:
+            del self.tokens[token]
+        for candidates in self.names.values():
+            candidates.sort(key=lambda candidate: -len(candidate[0]))
+
+    def find(self, text):
+        words = _words(text)
+        for word in words:
+            token = word[-10:] if word.isdigit() and len(word) >= 10 else word
+            if token in self.tokens:
+                return self.tokens[token]
+        for i, word in enumerate(words):
+            for name, retailer_id in self.names.get(word, ()):
+                if tuple(words[i:i + len(name)]) == name:
+                    return retailer_id
+        return None
+
+
+class DueIndex:
+    """A supplier's open dues by ``(retailer, balance)`` and by id."""
+
+    def __init__(self, supplier_id):
+        self.by_key = defaultdict(list)  # (retailer id, balance paise) -> [(due_date, id)]
+        self.dues = {}
+        early = timedelta(days=_setting('RECONCILE_EARLY_DAYS', 3))
+        late = timedelta(days=_setting('RECONCILE_LATE_DAYS', 30))
+        rows = DueEntry.objects.filter(
+            supplier_id=supplier_id, status__in=OPEN_STATUSES
+        ).annotate(balance_paise=BALANCE_PAISE).filter(balance_paise__gt=0).values_list(
+            'id', 'retailer_id', 'balance_paise', 'purchase_date', 'due_date'
+        )
+        for due_id, retailer_id, balance, purchase_date, due_date in rows:
+            # [retailer, balance, earliest date, latest date, due date]
+            self.dues[due_id] = [retailer_id, balance, purchase_date - early, due_date + late, due_date]
+            insort(self.by_key[retailer_id, balance], (due_date, due_id))
+
+    def retailer_ids(self):
+        return {due[0] for due in self.dues.values()}
+
+    def _take(self, due_id, amount):
+        due = self.dues[due_id]
+        key = (due[0], due[1])
+        self.by_key[key].remove((due[4], due_id))
+        if not self.by_key[key]:
+            del self.by_key[key]
+        due[1] -= amount
+        if due[1] > 0:
+            insort(self.by_key[due[0], due[1]], (due[4], due_id))
+        else:
+            del self.dues[due_id]
+
+    def match_quoted(self, due_id, retailer_id, amount):
+        """Pay ``amount`` towards a due the line quotes, if it fits."""
+        due = self.dues.get(due_id)
+        if due is None or amount > due[1] or (retailer_id is not None and retailer_id != due[0]):
+            return None
+        retailer_id = due[0]
+        self._take(due_id, amount)
+        return due_id, retailer_id
+
+    def match(self, retailer_id, amount, date):
+        """Settle the retailer's due with exactly ``amount`` outstanding whose window holds ``date``."""
+        for _, due_id in self.by_key.get((retailer_id, amount), ()):
+            due = self.dues[due_id]
+            if due[2] <= date <= due[3]:
+                self._take(due_id, amount)
+                return due_id, retailer_id
+        return None
+
+
+# Settlement ------------------------------------------------------------------------
+
+def _already_settled(supplier_id, references):
+    return set(
+        Payment.objects.filter(supplier_id=supplier_id, reference_id__in=references)
+        .values_list('reference_id', flat=True)
+    )
+
+
+def settle(supplier_id, matches):
+    """
+    Record ``matches`` as payments against their dues.
+
+    Returns the matches that were settled, those whose due changed since the
+    index was built and those whose reference was settled meanwhile.
+    """
+    settled, changed = [], []
+    now = timezone.now()
+    with transaction.atomic():
+        # The supplier's row lock serialises concurrent reconciliations, so
+        # the reference check below sees every payment committed before it.
+        UserProfile.objects.select_for_update().filter(id=supplier_id).exists()
+        seen = _already_settled(supplier_id, {match.reference for match in matches})
+        duplicates = [match for match in matches if match.reference in seen]
+        matches = [match for match in matches if match.reference not in seen]
+        dues = {
+            row['id']: row for row in DueEntry.objects.select_for_update().filter(
+                id__in={match.due_id for match in matches}, supplier_id=supplier_id, status__in=OPEN_STATUSES
+            ).values('id', 'supplier_id', 'amount', 'amount_paid', 'status')
+        }
+        allocations = []
+        for match in matches:
+            due = dues.get(match.due_id)
+            if due is None or match.amount > due['amount'] - due['amount_paid']:
+                changed.append(match)
+                continue
+            due['amount_paid'] += match.amount
+            if due['amount_paid'] == due['amount']:
+                due['status'] = 'paid'
+            settled.append(match)
+            allocations.append(Allocation(
+                due_id=match.due_id, supplier_id=supplier_id, amount=match.amount,
+                amount_paid=due['amount_paid'], status=due['status']
+            ))
+        if not settled:
+            return settled, changed, duplicates
+
+        payments = Payment.objects.bulk_create([
+            Payment(
+                retailer_id=match.retailer_id,
+                supplier_id=supplier_id,
+                amount=match.amount,
+                payment_method='bank_transfer',
+                status='completed',
+                reference_id=match.reference
+            )
+            for match in settled
+        ])
+        PaymentAllocation.objects.bulk_create([
+            PaymentAllocation(payment=payment, due_id=allocation.due_id, amount=allocation.amount)
+            for payment, allocation in zip(payments, allocations)
+        ])
+        touched = {allocation.due_id for allocation in allocations}
+        DueEntry.objects.bulk_update([
+            DueEntry(
+                id=due_id,
+                amount_paid=dues[due_id]['amount_paid'],
+                status=dues[due_id]['status'],
+                paid_at=now if dues[due_id]['status'] == 'paid' else None,
+                updated_at=now
+            )
+            for due_id in touched
+        ], ['amount_paid', 'status', 'paid_at', 'updated_at'])
+
+        payments_allocated.send(
+            sender=Payment,
+            payments=[(payment, [allocation]) for payment, allocation in zip(payments, allocations)]
+        )
+    return settled, changed, duplicates
+
+
+# Driver -------------------------------------------------------------------------
+
+class _Report:
+    """Unmatched lines, written to a temporary CSV as they are found."""
+
+    def __init__(self):
+        self.file = tempfile.TemporaryFile(mode='w+', newline='', encoding='utf-8')
+        self.writer = csv.writer(self.file)
+        self.writer.writerow(REPORT_HEADER)
+        self.count = 0
+
+    def add(self, line, reason, retailer_id=None):
+        amount = line.amount
+        if isinstance(amount, int):
+            amount = Decimal(amount).scaleb(-2)
+        self.writer.writerow((line.number, line.date, amount, line.reference, line.narration, reason, retailer_id or ''))
+        self.count += 1
+
+
+def reconcile(supplier_id, stream, progress=None):
+    """
+    Match and settle the credits of the statement in ``stream`` (bytes).
+
+    Returns the summary counts and the open report file, positioned at its
+    start, of lines that were not settled.
+    """
+    chunk_size = _setting('RECONCILE_CHUNK_SIZE', 1000)
+    batch_size = _setting('RECONCILE_SETTLE_BATCH_SIZE', 1000)
+    dues = DueIndex(supplier_id)
+    retailers = RetailerIndex(dues.retailer_ids())
+    report = _Report()
+    summary = {'lines': 0, 'credits': 0, 'matched': 0, 'settled_paise': 0}
+    pending = []  # (line, reference) awaiting the duplicate check
+    matches = []
+    seen = set()  # references settled before or matched during this run
+
+    def flush_matches():
+        settled, changed, duplicates = settle(supplier_id, list(matches))
+        for match in settled:
+            summary['matched'] += 1
+            summary['settled_paise'] += int(match.amount.scaleb(2))
+        for match in changed:
+            report.add(match.line, 'due_changed', match.retailer_id)
+        for match in duplicates:
+            report.add(match.line, 'already_settled', match.retailer_id)
+        matches.clear()
+
+    def flush_pending():
+        seen.update(_already_settled(supplier_id, {reference for _, reference in pending} - seen))
+        for line, reference in pending:
+            if reference in seen:
+                report.add(line, 'already_settled')
+                continue
+            seen.add(reference)
+            text = f'{line.reference} {line.narration}'
+            retailer_id = retailers.find(text)
+            found = None
+            quoted = DUE_REFERENCE.search(text.upper())
+            if quoted:
+                found = dues.match_quoted(int(quoted.group(1)), retailer_id, line.amount)
+            if found is None and retailer_id is not None:
+                found = dues.match(retailer_id, line.amount, line.date)
+            if found is None:
+                report.add(line, 'no_matching_due' if retailer_id else 'unknown_retailer', retailer_id)
+                continue
+            due_id, retailer_id = found
+            matches.append(Match(line, due_id, retailer_id, Decimal(line.amount).scaleb(-2), reference))
+        pending.clear()
+        if len(matches) >= batch_size:
+            flush_matches()
+
+    for line, error in read_statement(stream):
+        summary['lines'] = line.number - 1
+        if error:
+            report.add(line, error)
+            continue
+        if not line.amount:
+            continue
+        summary['credits'] += 1
+        pending.append((line, line_reference(line)))
+        if len(pending) >= chunk_size:
+            flush_pending()
+            if progress:
+                progress(summary['lines'])
+    if pending:
+        flush_pending()
+    if matches:
+        flush_matches()
+
+    summary['unmatched'] = report.count
+    report.file.seek(0)
+    return summary, report.file
+
+
+def run(reconciliation_id, progress=None):
+    """Reconcile a stored ``StatementReconciliation`` and save its summary and report."""
+    reconciliation = StatementReconciliation.objects.get(id=reconciliation_id)
+    size = reconciliation.statement.size or 1
+    with reconciliation.statement.open('rb') as stream:
+        summary, report = reconcile(
+            reconciliation.supplier_id, stream,
+            progress=progress and (lambda lines: progress(min(stream.tell() / size, 1.0)))
+        )
+    with report:
+        reconciliation.unmatched_report.save(
+            f'unmatched-{reconciliation.id}.csv', File(report), save=False
+        )
+    reconciliation.lines = summary['lines']
+    reconciliation.credits = summary['credits']
+    reconciliation.matched = summary['matched']
+    reconciliation.unmatched = summary['unmatched']
+    reconciliation.settled_amount = Decimal(summary['settled_paise']).scaleb(-2)
+    reconciliation.completed_at = timezone.now()
+    reconciliation.save()
+    logger.info(
+        'Reconciled statement %s: %d of %d credit(s) settled',
+        reconciliation.id, summary['matched'], summary['credits']
+    )
+    return {
+        'reconciliation': reconciliation.id,
+        'lines': summary['lines'],
+        'credits': summary['credits'],
+        'matched': summary['matched'],
+        'unmatched': summary['unmatched'],
+        'settled_amount': str(reconciliation.settled_amount),
+    }
@@ -0,0 +1,132 @@
+"""
+Supplier-retailer relationship rows.
+
+``SupplierRetailer`` holds, for every supplier and retailer with dues between
+them, the first and last activity on those dues, the open balance and the
+number of open and total dues. Rows are recomputed for just the pairs touched
+by a write, with a grouped query per ``PAIRS_PER_QUERY`` pairs, and upserted
+in bulk; a pair whose last due was deleted loses its row. A supplier's recent retailers, active retailer
+count and per-retailer balances then read ``k`` rows through the
+``(supplier, last_activity)`` index instead of scanning the supplier's dues.
+"""
+from collections import defaultdict
+from functools import reduce
+from operator import or_
+
+from django.db import transaction
+from django.db.models import Count, Max, Min, Q, Sum
+
+from .allocation import BALANCE, OPEN_STATUSES
+from .models import DueEntry, SupplierRetailer, UserProfile
+
+PAIRS_PER_QUERY = 500
+UPDATE_FIELDS = ['first_activity', 'last_activity', 'open_balance', 'open_dues', 'due_count', 'refreshed_at']
+
+
+def _pairs_filters(pairs, size=PAIRS_PER_QUERY):
+    """
+    Filters matching ``pairs``, at most ``size`` pairs each, with one
+    ``retailer_id IN (...)`` clause per supplier. One clause per pair would
+    outgrow SQLite's expression depth limit on large writes.
+    """
+    retailers = defaultdict(list)
+    for supplier_id, retailer_id in sorted(pairs):
+        retailers[supplier_id].append(retailer_id)
+    clauses, count = [], 0
+    for supplier_id, retailer_ids in retailers.items():
+        for start in range(0, len(retailer_ids), size):
+            chunk = retailer_ids[start:start + size]
+            if clauses and count + len(chunk) > size:
+                yield reduce(or_, clauses)
+                clauses, count = [], 0
+            clauses.append(Q(supplier_id=supplier_id, retailer_id__in=chunk))
+            count += len(chunk)
+    if clauses:
+        yield reduce(or_, clauses)
+
+
+def build_rows(dues):
+    """Compute fresh ``SupplierRetailer`` instances from the ``dues`` queryset."""
+    open_dues = Q(status__in=OPEN_STATUSES)
+    return [
+        SupplierRetailer(
+            supplier_id=row['supplier_id'],
+            retailer_id=row['retailer_id'],
+            first_activity=row['first_activity'],
+            last_activity=row['last_activity'],
+            open_balance=row['open_balance'] or 0,
+            open_dues=row['open_dues'],
+            due_count=row['due_count'],
+        )
+        for row in dues.values('supplier_id', 'retailer_id').annotate(
+            first_activity=Min('created_at'),
+            last_activity=Max('updated_at'),
+            open_balance=Sum(BALANCE, filter=open_dues),
+            open_dues=Count('id', filter=open_dues),
+            due_count=Count('id'),
+        ).order_by()
+    ]
+
+
+def _save(rows):
+    if rows:
+        SupplierRetailer.objects.bulk_create(
+            rows,
+            update_conflicts=True,
+            unique_fields=['supplier', 'retailer'],
+            update_fields=UPDATE_FIELDS
+        )
+
+
+def refresh(pairs):
+    """Recompute and upsert the rows for ``(supplier id, retailer id)`` ``pairs``."""
+    pairs = set(pairs)
+    if not pairs:
+        return []
+    with transaction.atomic():
+        rows = [
+            row for pairs_filter in _pairs_filters(pairs)
+            for row in build_rows(DueEntry.objects.filter(pairs_filter))
+        ]
+        _save(rows)
+        gone = pairs - {(row.supplier_id, row.retailer_id) for row in rows}
+        for pairs_filter in _pairs_filters(gone):
+            SupplierRetailer.objects.filter(pairs_filter).delete()
+    return rows
+
+
+def rebuild(chunk_size=500, progress=None):
+    """Recompute every row, a chunk of suppliers at a time."""
+    ids = UserProfile.objects.filter(user_type='supplier').order_by('id').values_list('id', flat=True)
+    total = ids.count()
+    done = 0
+    last_id = 0
+    while True:
+        chunk = list(ids.filter(id__gt=last_id)[:chunk_size])
+        if not chunk:
+            break
+        with transaction.atomic():
+            rows = build_rows(DueEntry.objects.filter(supplier_id__in=chunk))
+            _save(rows)
+            current = {(row.supplier_id, row.retailer_id) for row in rows}
+            stale = [
+                pk for pk, supplier_id, retailer_id in SupplierRetailer.objects.filter(
+                    supplier_id__in=chunk
+                ).values_list('id', 'supplier_id', 'retailer_id')
+                if (supplier_id, retailer_id) not in current
+            ]
+            SupplierRetailer.objects.filter(id__in=stale).delete()
+        last_id = chunk[-1]
+        done += len(chunk)
+        if progress:
+            progress(done, total)
+    return done
+
+
+def recent_retailer_ids(supplier, limit=5):
+    """Ids of the retailers ``supplier`` dealt with most recently, newest first."""
+    return list(
+        SupplierRetailer.objects.filter(supplier=supplier)
+        .order_by('-last_activity')
+        .values_list('retailer_id', flat=True)[:limit]
+    )
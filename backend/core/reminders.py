@@ -0,0 +1,275 @@
+"""
+Payment reminder scheduling.
+
+Open dues are loaded once into a min-heap keyed on the next reminder time.
+Writes made in this process update the heap directly through signals; writes
+made elsewhere are picked up incrementally from the ``updated_at`` index, so
+there is no periodic full scan of ``DueEntry``. Superseded heap entries are
+skipped lazily when they reach the top, which keeps every change O(log n).
+
+Ready reminders are re-checked against the database in one query per batch,
+grouped by recipient and handed to the configured sinks.
+"""
+import heapq
+import itertools
+import logging
+import threading
+from collections import defaultdict
+from datetime import datetime, time as dt_time, timedelta
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.db import connections
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .allocation import OPEN_STATUSES
+from .models import DueEntry
+
+logger = logging.getLogger(__name__)
+
+DUE_FIELDS = ('id', 'due_date', 'status', 'updated_at')
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+class ChannelLayerSink:
+    """Send each recipient's reminders to its ``user_<id>`` channel group."""
+
+    def __init__(self):
+        self.channel_layer = get_channel_layer()
+
+    def deliver(self, reminders_by_user):
+        for user_id, reminders in reminders_by_user.items():
+            async_to_sync(self.channel_layer.group_send)(f'user_{user_id}', {
+                'type': 'payment_reminder',
+                'data': {'reminders': reminders}
+            })
+
+
+class LoggingSink:
+    """Local notification sink that writes reminders to the log."""
+
+    def deliver(self, reminders_by_user):
+        for user_id, reminders in reminders_by_user.items():
+            logger.info('Payment reminders for user %s: %s', user_id, [r['due'] for r in reminders])
+
+
+def load_sinks():
+    paths = _setting('REMINDER_SINKS', ['core.reminders.ChannelLayerSink'])
+    return [import_string(path)() for path in paths]
+
+
+class ReminderScheduler:
+    """
+    Min-heap of ``(fire_at, seq, due_id)``.
+
+    ``_entries`` maps a due to the ``(fire_at, seq)`` of its live heap entry;
+    anything else in the heap for that due is stale.
+    """
+
+    def __init__(self, offsets=None, hour=None, sinks=None, batch_size=None):
+        # Days before the due date to send a reminder; negative means after.
+        self.offsets = sorted(offsets if offsets is not None else _setting('REMINDER_OFFSETS_DAYS', (3, 1, 0, -1, -7)), reverse=True)
+        self.hour = hour if hour is not None else _setting('REMINDER_HOUR', 9)
+        self.sinks = sinks if sinks is not None else load_sinks()
+        self.batch_size = batch_size or _setting('REMINDER_BATCH_SIZE', 500)
+        self._heap = []
+        self._entries = {}
+        self._seq = itertools.count()
+        self._watermark = None
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+
+    def __len__(self):
+        return len(self._entries)
+
+    # Scheduling ---------------------------------------------------------------
+
+    def fire_times(self, due_date):
+        tz = timezone.get_current_timezone()
+        for offset in self.offsets:
+            day = due_date - timedelta(days=offset)
+            yield timezone.make_aware(datetime.combine(day, dt_time(self.hour)), tz)
+
+    def next_fire_time(self, due_date, after):
+        for fire_at in self.fire_times(due_date):
+            if fire_at > after:
+                return fire_at
+        return None
+
+    def schedule(self, due_id, due_date, status, now=None):
+        """Insert, move or drop the reminder for one due."""
+        fire_at = None
+        if status in OPEN_STATUSES:
+            fire_at = self.next_fire_time(due_date, now or timezone.now())
+        with self._changed:
+            if fire_at is None:
+                self._entries.pop(due_id, None)
+                return
+            current = self._entries.get(due_id)
+            if current and current[0] == fire_at:
+                return
+            seq = next(self._seq)
+            self._entries[due_id] = (fire_at, seq)
+            heapq.heappush(self._heap, (fire_at, seq, due_id))
+            if len(self._heap) > 2 * len(self._entries) + 1024:
+                self._compact()
+            if self._heap[0][2] == due_id:
+                self._changed.notify()
+
+    def _compact(self):
+        # Drop superseded entries once they outnumber the live ones.
+        self._heap = [(fire_at, seq, due_id) for due_id, (fire_at, seq) in self._entries.items()]
+        heapq.heapify(self._heap)
+
+    def cancel(self, due_id):
+        with self._changed:
+            self._entries.pop(due_id, None)
+
+    def load(self):
+        """Read upcoming open dues once and seed the heap."""
+        now = timezone.now()
+        earliest = timezone.localdate() + timedelta(days=min(self.offsets, default=0))
+        rows = DueEntry.objects.filter(
+            status__in=OPEN_STATUSES, due_date__gte=earliest
+        ).order_by().values_list(*DUE_FIELDS)
+
+        latest = None
+        with self._changed:
+            for due_id, due_date, status, updated_at in rows.iterator(chunk_size=5000):
+                fire_at = self.next_fire_time(due_date, now)
+                if fire_at is not None:
+                    seq = next(self._seq)
+                    self._entries[due_id] = (fire_at, seq)
+                    self._heap.append((fire_at, seq, due_id))
+                if latest is None or updated_at > latest:
+                    latest = updated_at
+            heapq.heapify(self._heap)
+            self._changed.notify()
+        self._watermark = latest or now
+        return len(self._entries)
+
+    def sync(self):
+        """
+        Apply dues written since the last sync, using the ``updated_at`` index.
+
+        A transaction can commit after a later one with an earlier
+        ``updated_at``, so ``REMINDER_SYNC_SETTLE_SECONDS`` behind the
+        watermark are read again; rescheduling a due that has not changed is
+        a no-op.
+        """
+        if self._watermark is None:
+            return self.load()
+        settle = timedelta(seconds=_setting('REMINDER_SYNC_SETTLE_SECONDS', 60))
+        rows = DueEntry.objects.filter(
+            updated_at__gte=self._watermark - settle
+        ).order_by('updated_at').values_list(*DUE_FIELDS)
+        count = 0
+        for due_id, due_date, status, updated_at in rows.iterator(chunk_size=1000):
+            self.schedule(due_id, due_date, status)
+            self._watermark = max(self._watermark, updated_at)
+            count += 1
+        return count
+
+    # Dispatch -----------------------------------------------------------------
+
+    def pop_ready(self, now, limit):
+        ready = []
+        with self._changed:
+            while self._heap and len(ready) < limit and self._heap[0][0] <= now:
+                fire_at, seq, due_id = heapq.heappop(self._heap)
+                if self._entries.get(due_id) == (fire_at, seq):
+                    del self._entries[due_id]
+                    ready.append(due_id)
+        return ready
+
+    def seconds_until_next(self, now):
+        with self._changed:
+            while self._heap and self._entries.get(self._heap[0][2]) != self._heap[0][:2]:
+                heapq.heappop(self._heap)
+            if not self._heap:
+                return None
+            return max((self._heap[0][0] - now).total_seconds(), 0.0)
+
+    def dispatch(self, due_ids, now=None):
+        """Deliver reminders for ``due_ids`` and schedule each due's next one."""
+        now = now or timezone.now()
+        dues = DueEntry.objects.filter(
+            id__in=due_ids, status__in=OPEN_STATUSES
+        ).order_by().values(
+            'id', 'amount', 'amount_paid', 'due_date', 'status',
+            'retailer__user_id', 'supplier__business_name'
+        )
+
+        today = timezone.localdate()
+        reminders_by_user = defaultdict(list)
+        for due in dues:
+            reminders_by_user[due['retailer__user_id']].append({
+                'due': due['id'],
+                'supplier_name': due['supplier__business_name'],
+                'balance': str(due['amount'] - due['amount_paid']),
+                'due_date': due['due_date'].isoformat(),
+                'days_until_due': (due['due_date'] - today).days,
+            })
+            self.schedule(due['id'], due['due_date'], due['status'], now=now)
+
+        for sink in self.sinks:
+            try:
+                sink.deliver(reminders_by_user)
+            except Exception:
+                logger.exception('Reminder sink %s failed', type(sink).__name__)
+        return sum(len(reminders) for reminders in reminders_by_user.values())
+
+    def run(self, stop_event, sync_interval=None):
+        sync_interval = sync_interval or _setting('REMINDER_SYNC_INTERVAL', 30)
+        self.load()
+        next_sync = timezone.now() + timedelta(seconds=sync_interval)
+        try:
+            while not stop_event.is_set():
+                now = timezone.now()
+                if now >= next_sync:
+                    self.sync()
+                    next_sync = now + timedelta(seconds=sync_interval)
+
+                ready = self.pop_ready(now, self.batch_size)
+                if ready:
+                    self.dispatch(ready, now)
+                    continue
+
+                wait = (next_sync - now).total_seconds()
+                until_next = self.seconds_until_next(now)
+                if until_next is not None:
+                    wait = min(wait, until_next)
+                with self._changed:
+                    self._changed.wait(timeout=max(wait, 0.05))
+        finally:
+            connections.close_all()
+
+
+# The scheduler running in this process, if any; signal receivers update it
+# directly so same-process writes take effect without waiting for a sync.
+_active = None
+
+
+def start(scheduler):
+    global _active
+    _active = scheduler
+
+
+def stop():
+    global _active
+    _active = None
+
+
+def due_changed(due_id, due_date, status):
+    if _active is not None:
+        _active.schedule(due_id, due_date, status)
+
+
+def due_deleted(due_id):
+    if _active is not None:
+        _active.cancel(due_id)
@@ -0,0 +1,39 @@
+"""
+orjson-backed JSON renderer.
+
+Produces the same bytes as DRF's compact ``JSONRenderer``: values orjson does
+not serialise natively (datetimes, decimals, lazy strings, querysets) go
+through DRF's ``JSONEncoder.default``, and U+2028/U+2029 are escaped the same
+way. Anything orjson rejects, and indented output, falls back to the
+standard renderer.
+
+Floats are the one exception: orjson writes ``1e-05`` as ``0.00001`` and
+``1e+16`` as ``1e16``. Use it on endpoints whose payloads carry decimals as
+strings, as DRF serializers do, rather than as the global default.
+"""
+import orjson
+from rest_framework.renderers import BrowsableAPIRenderer, JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+OPTIONS = orjson.OPT_PASSTHROUGH_DATETIME
+
+
+class ORJSONRenderer(JSONRenderer):
+    _encoder = JSONEncoder()
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        if (
+            not self.compact or self.ensure_ascii or not self.strict
+            or self.get_indent(accepted_media_type, renderer_context or {}) is not None
+        ):
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            ret = orjson.dumps(data, default=self._encoder.default, option=OPTIONS)
+        except (orjson.JSONEncodeError, TypeError):
+            return super().render(data, accepted_media_type, renderer_context)
+        return ret.replace('\u2028'.encode(), b'\\u2028').replace('\u2029'.encode(), b'\\u2029')
+
+
+FAST_RENDERERS = [ORJSONRenderer, BrowsableAPIRenderer]
@@ -0,0 +1,297 @@
+"""
+Per-retailer portfolio risk rows.
+
+``RetailerRisk`` holds, for every retailer, the latest credit assessment,
+credit utilisation, outstanding and overdue balances and payment punctuality.
+Rows are recomputed for just the retailers touched by a write, with a few
+set-based queries, and upserted in bulk. The fintech portfolio endpoints sort,
+filter and page over this table through its indexes instead of joining the
+ledger per request.
+
+The overdue and default columns also change with the calendar: a due that
+passes its due date, or a retailer whose oldest open due passes the default
+horizon, changes them without any write. ``refresh_aged`` recomputes just
+those retailers and is run daily with ``manage.py refresh_aged_risk``.
+"""
+import base64
+import json
+from datetime import date
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F, Min, Q, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from . import analytics
+from .allocation import BALANCE, OPEN_STATUSES
+from .models import CreditAssessment, DueEntry, RetailerProfile, RetailerRisk
+
+ZERO = Decimal('0.00')
+
+SORT_FIELDS = (
+    'credit_score', 'utilization', 'outstanding', 'overdue_ratio',
+    'on_time_rate', 'approved_limit', 'business_name'
+)
+
+UPDATE_FIELDS = [
+    'profile', 'business_name', 'business_type', 'years_in_business',
+    'credit_score', 'assessment', 'assessment_status', 'assessment_date',
+    'approved_limit', 'credit_limit', 'available_credit', 'outstanding',
+    'overdue_amount', 'oldest_open_due_date', 'defaulted', 'cohort',
+    'utilization', 'overdue_ratio', 'due_count', 'paid_count',
+    'on_time_count', 'on_time_rate', 'refreshed_at'
+]
+
+
+def default_days():
+    return getattr(settings, 'RISK_DEFAULT_DAYS', 90)
+
+
+def default_cutoff(today=None):
+    today = today or timezone.localdate()
+    return date.fromordinal(today.toordinal() - default_days())
+
+
+def build_rows(retailer_ids, today=None):
+    """Compute fresh ``RetailerRisk`` instances for ``retailer_ids`` as of ``today``."""
+    profiles = list(
+        RetailerProfile.objects.filter(id__in=retailer_ids).values(
+            'id', 'user_profile_id', 'user_profile__business_name', 'business_type',
+            'years_in_business', 'credit_score', 'credit_limit', 'available_credit'
+        )
+    )
+    if not profiles:
+        return []
+    profile_ids = [p['user_profile_id'] for p in profiles]
+
+    today = today or timezone.localdate()
+    open_dues = Q(status__in=OPEN_STATUSES)
+    overdue = open_dues & (Q(status='overdue') | Q(due_date__lt=today))
+    ledger = {
+        row['retailer_id']: row
+        for row in DueEntry.objects.filter(retailer_id__in=profile_ids)
+        .values('retailer_id')
+        .annotate(
+            outstanding=Sum(BALANCE, filter=open_dues),
+            overdue_amount=Sum(BALANCE, filter=overdue),
+            oldest_open_due_date=Min('due_date', filter=open_dues),
+            due_count=Count('id'),
+            paid_count=Count('id', filter=Q(status='paid')),
+            on_time_count=Count('id', filter=Q(status='paid', paid_at__date__lte=F('due_date'))),
+        )
+        .order_by()
+    }
+
+    latest = {}
+    first_approved = {}
+    for assessment in CreditAssessment.objects.filter(retailer_id__in=retailer_ids).order_by(
+        'retailer_id', '-assessment_date', '-id'
+    ).values('id', 'retailer_id', 'status', 'approved_limit', 'assessment_date', 'credit_score'):
+        latest.setdefault(assessment['retailer_id'], assessment)
+        if assessment['status'] == 'approved':
+            # Ordered newest first, so the last one seen is the earliest.
+            first_approved[assessment['retailer_id']] = assessment['assessment_date']
+
+    cutoff = default_cutoff(today)
+
+    now = timezone.now()
+    rows = []
+    for p in profiles:
+        dues = ledger.get(p['user_profile_id'], {})
+        assessment = latest.get(p['id'])
+        outstanding = _money(dues.get('outstanding'))
+        overdue_amount = _money(dues.get('overdue_amount'))
+        credit_limit = p['credit_limit'] or ZERO
+        paid_count = dues.get('paid_count', 0)
+        on_time_count = dues.get('on_time_count', 0)
+        credit_score = p['credit_score']
+        if credit_score is None and assessment:
+            credit_score = assessment['credit_score']
+        oldest_open_due_date = dues.get('oldest_open_due_date')
+        approved_at = first_approved.get(p['id'])
+
+        rows.append(RetailerRisk(
+            retailer_id=p['id'],
+            profile_id=p['user_profile_id'],
+            business_name=p['user_profile__business_name'],
+            business_type=p['business_type'],
+            years_in_business=p['years_in_business'],
+            credit_score=credit_score or 0,
+            assessment_id=assessment['id'] if assessment else None,
+            assessment_status=assessment['status'] if assessment else 'none',
+            assessment_date=assessment['assessment_date'] if assessment else None,
+            approved_limit=(assessment and assessment['approved_limit']) or ZERO,
+            credit_limit=credit_limit,
+            available_credit=p['available_credit'] or ZERO,
+            outstanding=outstanding,
+            overdue_amount=overdue_amount,
+            oldest_open_due_date=oldest_open_due_date,
+            defaulted=oldest_open_due_date is not None and oldest_open_due_date < cutoff,
+            cohort=timezone.localtime(approved_at).strftime('%Y-%m') if approved_at else '',
+            utilization=float(outstanding / credit_limit) if credit_limit else 0.0,
+            overdue_ratio=float(overdue_amount / outstanding) if outstanding else 0.0,
+            due_count=dues.get('due_count', 0),
+            paid_count=paid_count,
+            on_time_count=on_time_count,
+            on_time_rate=on_time_count / paid_count if paid_count else 0.0,
+            refreshed_at=now,
+        ))
+    return rows
+
+
+def _money(value):
+    if value is None:
+        return ZERO
+    return Decimal(str(value)).quantize(ZERO)
+
+
+def refresh(retailer_ids, track=True, today=None):
+    """
+    Recompute and upsert the risk rows for ``retailer_ids``.
+
+    With ``track`` the portfolio analytics are moved from the old rows to the
+    new ones in the same transaction.
+    """
+    retailer_ids = list(retailer_ids)
+    with transaction.atomic():
+        if track:
+            old_rows = list(
+                RetailerRisk.objects.select_for_update()
+                .filter(retailer_id__in=retailer_ids)
+                .values(*analytics.FIELDS)
+            )
+        rows = build_rows(retailer_ids, today)
+        if rows:
+            RetailerRisk.objects.bulk_create(
+                rows,
+                update_conflicts=True,
+                unique_fields=['retailer'],
+                update_fields=UPDATE_FIELDS
+            )
+        if track:
+            analytics.apply_changes(old_rows, [analytics.row_fields(row) for row in rows])
+    return rows
+
+
+def refresh_for_profiles(profile_ids):
+    """Refresh the rows of retailers given by their ``UserProfile`` ids."""
+    retailer_ids = list(
+        RetailerProfile.objects.filter(user_profile_id__in=profile_ids).values_list('id', flat=True)
+    )
+    return refresh(retailer_ids)
+
+
+def rebuild(chunk_size=2000, progress=None):
+    """Recompute every row, a chunk of retailers at a time."""
+    ids = RetailerProfile.objects.order_by('id').values_list('id', flat=True)
+    total = ids.count()
+    done = 0
+    last_id = 0
+    while True:
+        chunk = list(ids.filter(id__gt=last_id)[:chunk_size])
+        if not chunk:
+            break
+        refresh(chunk)
+        last_id = chunk[-1]
+        done += len(chunk)
+        if progress:
+            progress(done, total)
+    return done
+
+
+def aged_retailer_ids(today=None):
+    """
+    Retailers whose row went stale with the calendar alone: an open due
+    passed its due date after the row was refreshed, or the oldest open due
+    passed the default horizon while the row is not marked defaulted.
+    """
+    today = today or timezone.localdate()
+    crossed_due = DueEntry.objects.filter(
+        status__in=OPEN_STATUSES,
+        due_date__lt=today,
+        due_date__gte=TruncDate('retailer__risk__refreshed_at'),
+    ).values_list('retailer__risk__retailer_id', flat=True).distinct()
+    crossed_default = RetailerRisk.objects.filter(
+        defaulted=False,
+        oldest_open_due_date__lt=default_cutoff(today),
+    ).values_list('retailer_id', flat=True)
+    return sorted(set(crossed_due) | set(crossed_default))
+
+
+def refresh_aged(today=None, chunk_size=2000, progress=None):
+    """Refresh the rows ``aged_retailer_ids`` finds, a chunk at a time."""
+    today = today or timezone.localdate()
+    ids = aged_retailer_ids(today)
+    for start in range(0, len(ids), chunk_size):
+        refresh(ids[start:start + chunk_size], today=today)
+        if progress:
+            progress(min(start + chunk_size, len(ids)), len(ids))
+    return len(ids)
+
+
+# Listing -------------------------------------------------------------------
+
+def encode_cursor(value, pk):
+    if isinstance(value, Decimal):
+        value = str(value)
+    raw = json.dumps([value, pk]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        value, pk = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return value, int(pk)
+    except (ValueError, TypeError):
+        raise ValueError('Invalid cursor')
+
+
+def filter_queryset(queryset, params):
+    if params.get('status'):
+        queryset = queryset.filter(assessment_status=params['status'])
+    if params.get('business_type'):
+        queryset = queryset.filter(business_type=params['business_type'])
+    if params.get('q'):
+        queryset = queryset.filter(business_name__istartswith=params['q'])
+    if params.get('min_score'):
+        queryset = queryset.filter(credit_score__gte=int(params['min_score']))
+    if params.get('max_score'):
+        queryset = queryset.filter(credit_score__lte=int(params['max_score']))
+    if params.get('min_utilization'):
+        queryset = queryset.filter(utilization__gte=float(params['min_utilization']))
+    if params.get('overdue') in ('1', 'true'):
+        queryset = queryset.filter(overdue_amount__gt=0)
+    if params.get('defaulted') in ('1', 'true'):
+        queryset = queryset.filter(oldest_open_due_date__lt=default_cutoff())
+    return queryset
+
+
+def page(queryset, sort, cursor=None, limit=50):
+    """
+    Keyset-paginate ``queryset`` by ``sort`` (``-`` prefix for descending).
+
+    Returns the page of rows and the cursor for the next page, if any.
+    """
+    descending = sort.startswith('-')
+    field = sort.lstrip('-')
+    if field not in SORT_FIELDS:
+        raise ValueError(f'Invalid sort field: {field}')
+
+    if cursor:
+        value, pk = decode_cursor(cursor)
+        if descending:
+            queryset = queryset.filter(Q(**{f'{field}__lt': value}) | Q(**{field: value, 'retailer__lt': pk}))
+        else:
+            queryset = queryset.filter(Q(**{f'{field}__gt': value}) | Q(**{field: value, 'retailer__gt': pk}))
+
+    prefix = '-' if descending else ''
+    rows = list(queryset.order_by(f'{prefix}{field}', f'{prefix}retailer')[:limit + 1])
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor(getattr(last, field), last.retailer_id)
+    return rows, next_cursor
@@ -1,8 +1,11 @@
 from rest_framework import serializers
 from django.contrib.auth.models import User
+from .allocation import BALANCE
+from .fastpath import FastSerializer
 from .models import (
     UserProfile, RetailerProfile, BankDetails, Document, CreditAssessment,
-    Transaction, Payment, DueEntry, ExistingLoan
+    Transaction, Payment, DueEntry, ExistingLoan, PaymentAllocation,
+    DocumentUpload, Job, RetailerRisk, StatementReconciliation, Accrual
 )
 
 class UserSerializer(serializers.ModelSerializer):
@@ -39,6 +42,15 @@ class DocumentSerializer(serializers.ModelSerializer):
         model = Document
         fields = '__all__'
 
+class DocumentUploadSerializer(serializers.ModelSerializer):
+    """Serializer for DocumentUpload model."""
+    class Meta:
+        model = DocumentUpload
+        fields = (
+            'id', 'document_type', 'filename', 'total_size', 'received',
+            'status', 'document', 'created_at', 'updated_at'
+        )
+
 class CreditAssessmentSerializer(serializers.ModelSerializer):
     retailer_name = serializers.CharField(source='retailer.user_profile.business_name', read_only=True)
     
@@ -71,6 +83,12 @@ class PaymentSerializer(serializers.ModelSerializer):
         model = Payment
         fields = '__all__'
 
+class PaymentAllocationSerializer(serializers.ModelSerializer):
+    """Serializer for PaymentAllocation model."""
+    class Meta:
+        model = PaymentAllocation
+        fields = ('id', 'payment', 'due', 'amount', 'created_at')
+
 class DueEntrySerializer(serializers.ModelSerializer):
     """Serializer for DueEntry model."""
     supplier_name = serializers.CharField(
@@ -85,18 +103,109 @@ class DueEntrySerializer(serializers.ModelSerializer):
         source='retailer.phone', 
         read_only=True
     )
+    balance = serializers.DecimalField(
+        max_digits=10,
+        decimal_places=2,
+        read_only=True
+    )
 
     class Meta:
         model = DueEntry
         fields = (
-            'id', 'supplier', 'retailer', 'amount', 'description',
-            'purchase_date', 'due_date', 'status', 'created_at',
-            'updated_at', 'supplier_name', 'retailer_name', 'retailer_phone'
+            'id', 'supplier', 'retailer', 'amount', 'amount_paid', 'balance',
+            'description', 'purchase_date', 'due_date', 'status', 'paid_at',
+            'created_at', 'updated_at', 'supplier_name', 'retailer_name',
+            'retailer_phone'
         )
-        read_only_fields = ('supplier_name', 'retailer_name', 'retailer_phone')
+        read_only_fields = (
+            'amount_paid', 'paid_at', 'supplier_name', 'retailer_name',
+            'retailer_phone'
+        )
+
+    def validate_amount(self, value):
+        if self.instance is not None and value < self.instance.amount_paid:
+            raise serializers.ValidationError(
+                'Amount cannot be less than the amount already paid'
+            )
+        return value
+
+class DueEntryMutationSerializer(DueEntrySerializer):
+    """DueEntrySerializer whose parties are set by the caller, not the payload."""
+
+    class Meta(DueEntrySerializer.Meta):
+        read_only_fields = DueEntrySerializer.Meta.read_only_fields + ('supplier', 'retailer')
 
 class ExistingLoanSerializer(serializers.ModelSerializer):
     """Serializer for ExistingLoan model."""
     class Meta:
         model = ExistingLoan
         fields = '__all__'
+
+
+class JobSerializer(serializers.ModelSerializer):
+    """Serializer for Job model."""
+    class Meta:
+        model = Job
+        fields = (
+            'id', 'name', 'status', 'priority', 'progress', 'progress_message',
+            'attempts', 'max_attempts', 'result', 'error', 'created_at',
+            'started_at', 'finished_at'
+        )
+
+
+class RetailerRiskSerializer(serializers.ModelSerializer):
+    """Serializer for the fintech portfolio rows."""
+    id = serializers.IntegerField(source='profile_id', read_only=True)
+    retailer_profile = serializers.IntegerField(source='retailer_id', read_only=True)
+    status = serializers.SerializerMethodField()
+    payment_history = serializers.SerializerMethodField()
+
+    class Meta:
+        model = RetailerRisk
+        fields = (
+            'id', 'retailer_profile', 'business_name', 'business_type',
+            'years_in_business', 'credit_score', 'credit_limit',
+            'available_credit', 'approved_limit', 'status', 'assessment_date',
+            'outstanding', 'overdue_amount', 'utilization', 'overdue_ratio',
+            'on_time_rate', 'payment_history', 'oldest_open_due_date',
+            'refreshed_at'
+        )
+
+    def get_status(self, obj):
+        return 'pending' if obj.assessment_status == 'none' else obj.assessment_status
+
+    def get_payment_history(self, obj):
+        if not obj.paid_count:
+            return 'No payments yet'
+        return f'{obj.on_time_count}/{obj.paid_count} paid on time'
+
+
+class StatementReconciliationSerializer(serializers.ModelSerializer):
+    """Serializer for an uploaded bank statement and its reconciliation."""
+    job = JobSerializer(read_only=True)
+    has_unmatched_report = serializers.SerializerMethodField()
+
+    class Meta:
+        model = StatementReconciliation
+        fields = (
+            'id', 'original_name', 'job', 'lines', 'credits', 'matched',
+            'unmatched', 'settled_amount', 'has_unmatched_report',
+            'created_at', 'completed_at'
+        )
+
+    def get_has_unmatched_report(self, obj):
+        return bool(obj.unmatched_report)
+
+
+class AccrualSerializer(serializers.ModelSerializer):
+    """Serializer for one day's interest and late fee on an overdue due."""
+    class Meta:
+        model = Accrual
+        fields = ('id', 'due', 'accrual_date', 'interest', 'late_fee')
+
+
+# Read-only fast paths for list endpoints; output matches the serializers above.
+due_entry_rows = FastSerializer(DueEntrySerializer, annotations={'balance': BALANCE})
+transaction_rows = FastSerializer(TransactionSerializer)
+payment_rows = FastSerializer(PaymentSerializer)
+user_profile_rows = FastSerializer(UserProfileSerializer)
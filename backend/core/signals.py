@@ -0,0 +1,11 @@
+from django.dispatch import Signal
+
+# Sent by the allocation engine after a payment has been spread across dues.
+# Bulk updates bypass ``post_save``, so listeners that track dues hook in here.
+# Arguments: ``payment`` and ``allocations`` (list of ``allocation.Allocation``).
+payment_allocated = Signal()
+
+# Sent once for a batch of payments written together, such as a settled
+# statement reconciliation batch. Arguments: ``payments``, a list of
+# ``(payment, allocations)`` pairs.
+payments_allocated = Signal()
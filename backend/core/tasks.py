@@ -0,0 +1,72 @@
+"""
+Background job handlers for the core app.
+
+Each handler is called by a worker as ``handler(job, **payload)``; see
+``core.jobs``.
+"""
+from datetime import date
+
+from . import accrual, analytics, bankstatements, documents, emi, reconciliation, risk, stress
+from .jobs import task
+
+
+@task('documents.process', max_attempts=3)
+def process_document(job, document_id):
+    document = documents.process_document(document_id)
+    return {'status': document.status, 'mime_type': document.mime_type}
+
+
+@task('emi.precompute_offers')
+def precompute_emi_offers(job, min_amount=None):
+    return {'dues': emi.precompute_open_dues(min_amount)}
+
+
+@task('stress.run', max_attempts=1)
+def run_stress_test(job, **params):
+    job.set_progress(0.0, 'Loading portfolio', force=True)
+    return stress.run(
+        progress=lambda done: job.set_progress(done, 'Simulating scenarios'),
+        **params
+    )
+
+
+@task('accrual.run', max_attempts=3)
+def run_accrual(job, accrual_date=None, partition=0, partitions=1):
+    # A retried job resumes from the suppliers' checkpoints.
+    return accrual.run(
+        accrual_date=date.fromisoformat(accrual_date) if accrual_date else None,
+        partition=partition,
+        partitions=partitions,
+        progress=lambda done: job.set_progress(done, 'Accruing suppliers')
+    )
+
+
+@task('reconciliation.run', max_attempts=3)
+def run_reconciliation(job, reconciliation_id):
+    # A retried job skips the lines it already settled, by their references.
+    job.set_progress(0.0, 'Indexing open dues', force=True)
+    return reconciliation.run(
+        reconciliation_id,
+        progress=lambda done: job.set_progress(done, 'Matching statement lines')
+    )
+
+
+@task('bankstatements.score', max_attempts=3)
+def score_bank_statements(job, retailer_id):
+    return bankstatements.score_retailer(retailer_id)
+
+
+@task('analytics.rebuild', max_attempts=3)
+def rebuild_analytics(job, refresh=True):
+    return {'retailers': analytics.rebuild(
+        refresh=refresh,
+        progress=lambda done, total: job.set_progress(done / total, 'Aggregating retailers')
+    )}
+
+
+@task('risk.refresh_aged', max_attempts=3)
+def refresh_aged_risk(job, today=None):
+    return {'retailers': risk.refresh_aged(
+        date.fromisoformat(today) if today else None,
+        progress=lambda done, total: job.set_progress(done / total, 'Refreshing risk rows')
+    )}
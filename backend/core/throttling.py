@@ -0,0 +1,282 @@
+"""
+Token-bucket throttles and load shedding shared by the processes of one host.
+
+State lives in a small memory-mapped file (``THROTTLE_STORE_PATH``) that every
+worker maps, so limits hold across processes without a cache server:
+
+* Token buckets sit in a fixed hash table of ``THROTTLE_STORE_BUCKETS`` sets
+  of ``WAYS`` slots. A key hashes to one set, which is locked with a POSIX
+  byte-range lock on just that set while the bucket is refilled and drawn
+  from. When a set is full the slot idle longest is reused; its client
+  simply starts again with a full bucket.
+* Each process owns a row of in-flight request counters. Readers add up
+  the rows, and rows of processes that died are reclaimed, so a crashed
+  worker does not leave load behind.
+
+``TokenBucketThrottle`` subclasses are DRF throttles: a bucket of ``burst``
+tokens refilled at ``rate`` per second per scope and client, from
+``THROTTLE_BUCKETS``. A denied request gets DRF's 429 with ``Retry-After``.
+DRF draws from every throttle of a view even when one of them refuses, so
+the expensive endpoints and the payment writes each use only their own
+bucket. Requests refused on the dashboard then cannot drain the shared
+``user`` bucket that would starve a client's payments.
+``LoadSheddingMiddleware`` answers 503 with ``Retry-After`` before any view
+runs once too many requests are in flight, so the expensive read endpoints
+cannot starve payment writes, which are never shed.
+"""
+import fcntl
+import hashlib
+import logging
+import mmap
+import os
+import re
+import struct
+import threading
+import time
+
+from django.conf import settings
+from django.http import JsonResponse
+from rest_framework.throttling import BaseThrottle
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'CGTHRT01'
+WAYS = 8
+SLOT = struct.Struct('<Qdd')  # key hash, tokens, last refill
+PROCESS_ROWS = 256
+ROW = struct.Struct('<qqq')  # pid, requests in flight, expensive requests in flight
+HEADER_SIZE = 64
+REAP_INTERVAL = 5.0
+
+TOTAL, EXPENSIVE = 1, 2  # fields of ROW
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+class ThrottleStore:
+    """The memory-mapped bucket table and in-flight counters."""
+
+    def __init__(self, path, buckets):
+        self.buckets = buckets
+        self.rows_offset = HEADER_SIZE
+        self.table_offset = HEADER_SIZE + PROCESS_ROWS * ROW.size
+        size = self.table_offset + buckets * WAYS * SLOT.size
+        self.fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        self._locked(0, HEADER_SIZE, self._initialise, size)
+        self.map = mmap.mmap(self.fd, size)
+        self.local = threading.Lock()
+        self.pid = None
+        self.row = None
+        self.reaped = 0.0
+
+    def _initialise(self, size):
+        header = os.pread(self.fd, len(MAGIC), 0)
+        if header != MAGIC or os.fstat(self.fd).st_size != size:
+            os.ftruncate(self.fd, 0)
+            os.ftruncate(self.fd, size)
+            os.pwrite(self.fd, MAGIC, 0)
+
+    def _locked(self, start, length, func, *args):
+        fcntl.lockf(self.fd, fcntl.LOCK_EX, length, start)
+        try:
+            return func(*args)
+        finally:
+            fcntl.lockf(self.fd, fcntl.LOCK_UN, length, start)
+
+    # Token buckets
+
+    def take(self, key, burst, rate, now=None):
+        """
+        Draw a token from ``key``'s bucket.
+
+        Returns ``(allowed, wait)``, where ``wait`` is the number of seconds
+        until a token is available when it is not.
+        """
+        now = time.time() if now is None else now
+        digest = int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), 'little') | 1
+        start = self.table_offset + (digest % self.buckets) * WAYS * SLOT.size
+        with self.local:
+            return self._locked(start, WAYS * SLOT.size, self._take, start, digest, burst, rate, now)
+
+    def _take(self, start, digest, burst, rate, now):
+        slots = [SLOT.unpack_from(self.map, start + way * SLOT.size) for way in range(WAYS)]
+        way = next((way for way, slot in enumerate(slots) if slot[0] == digest), None)
+        if way is None:
+            way = min(range(WAYS), key=lambda way: slots[way][2])
+            tokens = float(burst)
+        else:
+            _, tokens, stamp = slots[way]
+            tokens = min(float(burst), tokens + max(now - stamp, 0.0) * rate)
+        allowed = tokens >= 1.0
+        if allowed:
+            tokens -= 1.0
+        SLOT.pack_into(self.map, start + way * SLOT.size, digest, tokens, now)
+        return allowed, 0.0 if allowed else (1.0 - tokens) / rate
+
+    # In-flight counters
+
+    def _own_row(self):
+        pid = os.getpid()
+        if self.pid != pid:
+            # First use, or a forked child: claim a row of our own.
+            self.pid = pid
+            self.row = self._locked(self.rows_offset, PROCESS_ROWS * ROW.size, self._claim_row, pid)
+        return self.row
+
+    def _claim_row(self, pid):
+        free = None
+        for index in range(PROCESS_ROWS):
+            offset = self.rows_offset + index * ROW.size
+            owner = ROW.unpack_from(self.map, offset)[0]
+            if owner == pid:
+                ROW.pack_into(self.map, offset, pid, 0, 0)
+                return offset
+            if free is None and (owner == 0 or not _alive(owner)):
+                free = offset
+        if free is None:
+            raise RuntimeError('No free in-flight counter rows')
+        ROW.pack_into(self.map, free, pid, 0, 0)
+        return free
+
+    def _reap(self):
+        for index in range(PROCESS_ROWS):
+            offset = self.rows_offset + index * ROW.size
+            owner = ROW.unpack_from(self.map, offset)[0]
+            if owner and owner != self.pid and not _alive(owner):
+                ROW.pack_into(self.map, offset, 0, 0, 0)
+
+    def add(self, expensive, delta):
+        with self.local:
+            offset = self._own_row()
+            pid, total, heavy = ROW.unpack_from(self.map, offset)
+            ROW.pack_into(self.map, offset, pid, total + delta, heavy + (delta if expensive else 0))
+
+    def in_flight(self):
+        """``(requests, expensive requests)`` in flight on this host."""
+        now = time.monotonic()
+        if now - self.reaped > REAP_INTERVAL:
+            self.reaped = now
+            self._locked(self.rows_offset, PROCESS_ROWS * ROW.size, self._reap)
+        total = heavy = 0
+        for index in range(PROCESS_ROWS):
+            pid, requests, expensive = ROW.unpack_from(self.map, self.rows_offset + index * ROW.size)
+            if pid:
+                total += requests
+                heavy += expensive
+        return total, heavy
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = ThrottleStore(
+                    str(_setting('THROTTLE_STORE_PATH', os.path.join(settings.BASE_DIR, 'throttle.bin'))),
+                    _setting('THROTTLE_STORE_BUCKETS', 4096)
+                )
+    return _store
+
+
+# Throttles ----------------------------------------------------------------------
+
+class TokenBucketThrottle(BaseThrottle):
+    """A token bucket per client for ``scope``, configured in ``THROTTLE_BUCKETS``."""
+    scope = None
+
+    def allow_request(self, request, view):
+        spec = _setting('THROTTLE_BUCKETS', {}).get(self.scope)
+        if spec is None:
+            return True
+        burst, rate = spec
+        if request.user and request.user.is_authenticated:
+            client = f'user:{request.user.pk}'
+        else:
+            client = f'ip:{self.get_ident(request)}'
+        allowed, self.retry_after = get_store().take(f'{self.scope}:{client}', burst, rate)
+        return allowed
+
+    def wait(self):
+        return self.retry_after
+
+
+class UserThrottle(TokenBucketThrottle):
+    """Every API request of a client, whatever the endpoint."""
+    scope = 'user'
+
+
+class DashboardThrottle(TokenBucketThrottle):
+    scope = 'dashboard'
+
+
+class SearchThrottle(TokenBucketThrottle):
+    scope = 'search'
+
+
+class AnalyticsThrottle(TokenBucketThrottle):
+    scope = 'analytics'
+
+
+class PaymentThrottle(TokenBucketThrottle):
+    """Payment writes, kept apart from every other bucket."""
+    scope = 'payments'
+
+
+# Load shedding ----------------------------------------------------------------
+
+class LoadSheddingMiddleware:
+    """
+    Refuse API requests with 503 while the host has too many in flight.
+
+    Requests matching ``LOAD_SHED_CRITICAL_PATHS`` (payment writes) are always
+    admitted. Requests matching ``LOAD_SHED_EXPENSIVE_PATHS`` are refused
+    once ``LOAD_SHED_MAX_EXPENSIVE`` of them are in flight, and any other
+    request once ``LOAD_SHED_MAX_IN_FLIGHT`` requests are.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.prefix = _setting('LOAD_SHED_PATH_PREFIX', '/api/')
+        self.critical = [re.compile(pattern) for pattern in _setting('LOAD_SHED_CRITICAL_PATHS', ())]
+        self.expensive = [re.compile(pattern) for pattern in _setting('LOAD_SHED_EXPENSIVE_PATHS', ())]
+
+    def __call__(self, request):
+        path = request.path_info
+        if not _setting('LOAD_SHED_ENABLED', True) or not path.startswith(self.prefix):
+            return self.get_response(request)
+
+        store = get_store()
+        expensive = any(pattern.search(path) for pattern in self.expensive)
+        if not any(pattern.search(path) for pattern in self.critical):
+            total, heavy = store.in_flight()
+            if total >= _setting('LOAD_SHED_MAX_IN_FLIGHT', 64) or (
+                expensive and heavy >= _setting('LOAD_SHED_MAX_EXPENSIVE', 8)
+            ):
+                return self.shed()
+
+        store.add(expensive, 1)
+        try:
+            return self.get_response(request)
+        finally:
+            store.add(expensive, -1)
+
+    def shed(self):
+        response = JsonResponse({'error': 'The server is busy, please retry shortly'}, status=503)
+        response['Retry-After'] = str(_setting('LOAD_SHED_RETRY_AFTER', 1))
+        return response
@@ -7,6 +7,7 @@ urlpatterns = [
     path('auth/register/fintech/', views.register_fintech, name='register-fintech'),
     path('auth/login/', views.login_view, name='login'),
     path('auth/logout/', views.logout_view, name='logout'),
+    path('ws/ticket/', views.ws_ticket, name='ws-ticket'),
     
     # Dashboard endpoints
     path('dashboard/stats/', views.get_dashboard_stats, name='dashboard-stats'),
@@ -15,17 +16,46 @@ urlpatterns = [
     path('retailers/', views.get_retailers, name='retailers-list'),
     path('retailers/search/', views.search_retailers, name='retailers-search'),
     path('retailers/recent/', views.get_recent_retailers, name='recent-retailers'),
+    path('retailers/details/', views.get_retailer_details_batch, name='retailer-details-batch'),
     path('retailers/<int:retailer_id>/', views.get_retailer_details, name='retailer-details'),
     
     # Dues endpoints
     path('dues/', views.get_dues, name='dues-list'),
+    path('dues/aging/', views.get_dues_aging, name='dues-aging'),
     path('dues/create/', views.create_due, name='create-due'),
     path('dues/<int:due_id>/', views.due_detail, name='due-detail'),
     path('dues/<int:due_id>/pay/', views.make_payment, name='make-payment'),
+    path('dues/<int:due_id>/accruals/', views.due_accruals, name='due-accruals'),
+    
+    # Payment endpoints
+    path('payments/', views.create_payment, name='create-payment'),
+    path('reconciliations/', views.reconciliations, name='reconciliations'),
+    path('reconciliations/<int:reconciliation_id>/', views.reconciliation_detail, name='reconciliation-detail'),
+    path('reconciliations/<int:reconciliation_id>/unmatched/', views.reconciliation_unmatched, name='reconciliation-unmatched'),
     
     # Transaction endpoints
     path('transactions/', views.get_transactions, name='transactions-list'),
     path('transactions/history/', views.get_transaction_history, name='transaction-history'),
+    path('sync/', views.sync_changes, name='sync-changes'),
+    path('mutations/', views.apply_mutations, name='apply-mutations'),
+
+    # Document endpoints
+    path('documents/', views.retailer_documents, name='documents'),
+    path('documents/<int:document_id>/', views.document_detail, name='document-detail'),
+    path('documents/uploads/', views.start_document_upload, name='document-upload-start'),
+    path('documents/uploads/<uuid:upload_id>/', views.document_upload_detail, name='document-upload-detail'),
+
+    # Fintech endpoints
+    path('fintech/retailers/', views.get_fintech_retailers, name='fintech-retailers'),
+    path('fintech/dashboard/stats/', views.get_fintech_dashboard_stats, name='fintech-dashboard-stats'),
+    path('fintech/analytics/', views.get_fintech_analytics, name='fintech-analytics'),
+    path('fintech/stress-tests/', views.start_stress_test, name='fintech-stress-test'),
+    path('fintech/dues/<int:due_id>/emi-plans/', views.get_emi_plans, name='emi-plans'),
+    path('fintech/dues/<int:due_id>/emi-plans/<str:plan_id>/', views.get_emi_schedule, name='emi-schedule'),
+    path('fintech/dues/<int:due_id>/emi-plans/<str:plan_id>/activate/', views.activate_emi_plan, name='emi-activate'),
+
+    # Background job endpoints
+    path('jobs/<int:job_id>/', views.job_status, name='job-status'),
 
     # Credit Assessment endpoints
     path('credit-assessment/request/', views.request_credit_assessment, name='request-credit-assessment'),
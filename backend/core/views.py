@@ -1,22 +1,31 @@
+from django.conf import settings
 from django.shortcuts import get_object_or_404
 from django.contrib.auth import login, authenticate, logout
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.models import User
-from django.http import JsonResponse
+from django.http import FileResponse, JsonResponse
 from django.views.decorators.csrf import ensure_csrf_cookie
-from django.db.models import Sum, Count, Q
+from django.db.models import Avg, Sum, Count, ExpressionWrapper, F, Q
 from django.utils import timezone
 from datetime import timedelta
+import re
 from django.db import transaction
 from rest_framework import status
-from rest_framework.decorators import api_view, permission_classes
+from rest_framework.decorators import api_view, permission_classes, renderer_classes, throttle_classes
 from rest_framework.permissions import IsAuthenticated, AllowAny
 from rest_framework.response import Response
-from .models import UserProfile, RetailerProfile, DueEntry, Transaction, Payment, BankDetails, CreditAssessment, ExistingLoan
+from .models import UserProfile, RetailerProfile, DueEntry, Transaction, Payment, BankDetails, CreditAssessment, ExistingLoan, Document, DocumentUpload, Job, EMIPlan, RetailerRisk, StatementReconciliation, SupplierRetailer, Accrual
 from .serializers import (
-    UserProfileSerializer, RetailerProfileSerializer, DueEntrySerializer,
-    TransactionSerializer, BankDetailsSerializer,PaymentSerializer,CreditAssessmentSerializer
+    RetailerProfileSerializer, DueEntrySerializer,
+    TransactionSerializer, BankDetailsSerializer,PaymentSerializer,CreditAssessmentSerializer,
+    DocumentSerializer, DocumentUploadSerializer, JobSerializer, RetailerRiskSerializer,
+    StatementReconciliationSerializer, AccrualSerializer, due_entry_rows, transaction_rows, user_profile_rows
 )
+from . import aging, analytics, changefeed, documents, emi, jobs, mutations, relationships, risk, ws_auth
+from .fields import MoneyField
+from .renderers import FAST_RENDERERS
+from .throttling import AnalyticsThrottle, DashboardThrottle, PaymentThrottle, SearchThrottle
+from .allocation import BALANCE, OPEN_STATUSES, AllocationError, apply_payment
 
 @api_view(['POST'])
 @permission_classes([AllowAny])
@@ -162,6 +171,13 @@ def logout_view(request):
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+def ws_ticket(request):
+    """Short-lived ticket authenticating a WebSocket connection as the current user."""
+    return Response({'ticket': ws_auth.issue_ticket(request.user)})
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+@throttle_classes([DashboardThrottle])
 def get_dashboard_stats(request):
     user_profile = get_object_or_404(UserProfile, user=request.user)
     
@@ -172,18 +188,18 @@ def get_dashboard_stats(request):
             total_due = DueEntry.objects.filter(
                 retailer=user_profile,
                 status__in=['pending', 'overdue']
-            ).aggregate(total=Sum('amount'))['total'] or 0
+            ).aggregate(total=Sum(BALANCE))['total'] or 0
             
             due_today = DueEntry.objects.filter(
                 retailer=user_profile,
                 status='pending',
                 due_date=timezone.now().date()
-            ).aggregate(total=Sum('amount'))['total'] or 0
+            ).aggregate(total=Sum(BALANCE))['total'] or 0
             
             overdue_amount = DueEntry.objects.filter(
                 retailer=user_profile,
                 status='overdue'
-            ).aggregate(total=Sum('amount'))['total'] or 0
+            ).aggregate(total=Sum(BALANCE))['total'] or 0
             
             return Response({
                 'totalDue': total_due,
@@ -195,14 +211,11 @@ def get_dashboard_stats(request):
             })
             
         elif user_profile.user_type == 'supplier':
-            total_outstanding = DueEntry.objects.filter(
-                supplier=user_profile,
-                status__in=['pending', 'overdue']
-            ).aggregate(total=Sum('amount'))['total'] or 0
-            
-            active_retailers = DueEntry.objects.filter(
-                supplier=user_profile
-            ).values('retailer').distinct().count()
+            links = SupplierRetailer.objects.filter(supplier=user_profile).aggregate(
+                total=Sum('open_balance'), retailers=Count('id')
+            )
+            total_outstanding = links['total'] or 0
+            active_retailers = links['retailers']
             
             monthly_sales = Transaction.objects.filter(
                 supplier=user_profile,
@@ -212,7 +225,7 @@ def get_dashboard_stats(request):
             overdue_amount = DueEntry.objects.filter(
                 supplier=user_profile,
                 status='overdue'
-            ).aggregate(total=Sum('amount'))['total'] or 0
+            ).aggregate(total=Sum(BALANCE))['total'] or 0
             
             return Response({
                 'totalOutstanding': total_outstanding,
@@ -306,44 +319,56 @@ def get_dashboard_analytics(request):
     return Response({'error': 'Invalid user type'}, status=status.HTTP_400_BAD_REQUEST)
 
 @api_view(['GET'])
+@renderer_classes(FAST_RENDERERS)
 @permission_classes([IsAuthenticated])
+@throttle_classes([SearchThrottle])
 def get_retailers(request):
     """Get list of retailers"""
     try:
         retailers = UserProfile.objects.filter(user_type='retailer')
-        serializer = UserProfileSerializer(retailers, many=True)
-        return Response(serializer.data)
+        return Response(user_profile_rows.rows(retailers))
     except Exception as e:
         return Response(
             {'error': str(e)},
             status=status.HTTP_500_INTERNAL_SERVER_ERROR
         )
 
+def _retailer_details(retailer_ids):
+    """
+    Details for the given retailer ``UserProfile`` ids, keyed by id.
+
+    Profiles, users and due totals come from one annotated query.
+    """
+    dues = 'user_profile__received_dues'
+    retailer_profiles = RetailerProfile.objects.filter(
+        user_profile_id__in=retailer_ids,
+        user_profile__user_type='retailer'
+    ).select_related('user_profile__user').annotate(
+        total_dues=Sum(
+            ExpressionWrapper(F(f'{dues}__amount') - F(f'{dues}__amount_paid'), output_field=MoneyField()),
+            filter=Q(**{f'{dues}__status__in': OPEN_STATUSES})
+        ),
+        payment_history=Count(dues, filter=Q(**{f'{dues}__status': 'paid'}))
+    )
+    
+    details = {}
+    for retailer_profile in retailer_profiles:
+        details[retailer_profile.user_profile_id] = {
+            **RetailerProfileSerializer(retailer_profile).data,
+            'total_dues': retailer_profile.total_dues or 0,
+            'payment_history': retailer_profile.payment_history
+        }
+    return details
+
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def get_retailer_details(request, retailer_id):
     """Get detailed information about a specific retailer"""
     try:
-        retailer = get_object_or_404(UserProfile, id=retailer_id, user_type='retailer')
-        retailer_profile = get_object_or_404(RetailerProfile, user_profile=retailer)
-        
-        total_dues = DueEntry.objects.filter(
-            retailer=retailer,
-            status__in=['pending', 'overdue']
-        ).aggregate(total=Sum('amount'))['total'] or 0
-        
-        payment_history = DueEntry.objects.filter(
-            retailer=retailer,
-            status='paid'
-        ).count()
-        
-        data = {
-            **RetailerProfileSerializer(retailer_profile).data,
-            'total_dues': total_dues,
-            'payment_history': payment_history
-        }
-        
-        return Response(data)
+        details = _retailer_details([retailer_id])
+        if retailer_id not in details:
+            return Response({'error': 'Retailer not found'}, status=status.HTTP_404_NOT_FOUND)
+        return Response(details[retailer_id])
     except Exception as e:
         return Response(
             {'error': str(e)},
@@ -352,6 +377,29 @@ def get_retailer_details(request, retailer_id):
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+def get_retailer_details_batch(request):
+    """Details for up to RETAILER_DETAILS_BATCH_SIZE retailers, in the order requested"""
+    try:
+        retailer_ids = list(dict.fromkeys(
+            int(value) for value in request.query_params.get('ids', '').split(',') if value.strip()
+        ))
+    except ValueError:
+        return Response({'error': 'ids must be a comma-separated list of integers'}, status=status.HTTP_400_BAD_REQUEST)
+    
+    if not retailer_ids:
+        return Response({'error': 'ids is required'}, status=status.HTTP_400_BAD_REQUEST)
+    if len(retailer_ids) > settings.RETAILER_DETAILS_BATCH_SIZE:
+        return Response(
+            {'error': f'At most {settings.RETAILER_DETAILS_BATCH_SIZE} retailers can be requested at once'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    
+    details = _retailer_details(retailer_ids)
+    return Response([details[retailer_id] for retailer_id in retailer_ids if retailer_id in details])
+
+@api_view(['GET'])
+@renderer_classes(FAST_RENDERERS)
+@permission_classes([IsAuthenticated])
 def get_dues(request):
     user_profile = get_object_or_404(UserProfile, user=request.user)
     
@@ -360,8 +408,39 @@ def get_dues(request):
     else:  # retailer
         dues_list = DueEntry.objects.filter(retailer=user_profile)
         
-    serializer = DueEntrySerializer(dues_list, many=True)
-    return Response(serializer.data)
+    return Response(due_entry_rows.rows(dues_list))
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+@throttle_classes([AnalyticsThrottle])
+def get_dues_aging(request):
+    """Receivables aging per retailer and in total for the current supplier"""
+    user_profile = get_object_or_404(UserProfile, user=request.user)
+    
+    if user_profile.user_type != 'supplier':
+        return Response(
+            {'error': 'Only suppliers can view receivables aging'},
+            status=status.HTTP_403_FORBIDDEN
+        )
+    
+    try:
+        page = max(int(request.GET.get('page', 1)), 1)
+        page_size = min(max(int(request.GET.get('page_size', 50)), 1), 500)
+        report = aging.get_report(user_profile.id)
+        rows = aging.sort_rows(report['rows'], request.GET.get('sort', '-total'))
+    except ValueError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    
+    start = (page - 1) * page_size
+    return Response({
+        'asOf': report['as_of'],
+        'buckets': aging.BUCKETS,
+        'totals': report['totals'],
+        'count': len(rows),
+        'page': page,
+        'pageSize': page_size,
+        'results': rows[start:start + page_size]
+    })
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
@@ -396,7 +475,8 @@ def create_due(request):
         
         serializer = DueEntrySerializer(data=due_data)
         if serializer.is_valid():
-            serializer.save()
+            with transaction.atomic():
+                serializer.save()
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
         
@@ -407,17 +487,19 @@ def create_due(request):
         )
         
 @api_view(['GET'])
+@renderer_classes(FAST_RENDERERS)
 @permission_classes([IsAuthenticated])
+@throttle_classes([SearchThrottle])
 def search_retailers(request):
     query = request.GET.get('q', '')
     retailers = UserProfile.objects.filter(
         user_type='retailer',
         business_name__icontains=query
     )
-    serializer = UserProfileSerializer(retailers, many=True)
-    return Response(serializer.data)
+    return Response(user_profile_rows.rows(retailers))
 
 @api_view(['GET'])
+@renderer_classes(FAST_RENDERERS)
 @permission_classes([IsAuthenticated])
 def get_recent_retailers(request):
     user_profile = get_object_or_404(UserProfile, user=request.user)
@@ -427,14 +509,14 @@ def get_recent_retailers(request):
             status=status.HTTP_403_FORBIDDEN
         )
     
-    recent_dues = DueEntry.objects.filter(supplier=user_profile).values('retailer').distinct()[:5]
-    retailer_ids = [due['retailer'] for due in recent_dues]
-    retailers = UserProfile.objects.filter(id__in=retailer_ids)
+    retailer_ids = relationships.recent_retailer_ids(user_profile)
+    rows = user_profile_rows.rows(UserProfile.objects.filter(id__in=retailer_ids))
+    rows.sort(key=lambda row: retailer_ids.index(row['id']))
     
-    serializer = UserProfileSerializer(retailers, many=True)
-    return Response(serializer.data)
+    return Response(rows)
 
 @api_view(['GET', 'POST'])
+@renderer_classes(FAST_RENDERERS)
 @permission_classes([IsAuthenticated])
 def dues(request):
     user_profile = get_object_or_404(UserProfile, user=request.user)
@@ -445,8 +527,7 @@ def dues(request):
         else:  # retailer
             dues_list = DueEntry.objects.filter(retailer=user_profile)
             
-        serializer = DueEntrySerializer(dues_list, many=True)
-        return Response(serializer.data)
+        return Response(due_entry_rows.rows(dues_list))
     
     elif request.method == 'POST':
         if user_profile.user_type != 'supplier':
@@ -469,7 +550,8 @@ def dues(request):
         
         serializer = DueEntrySerializer(data=due_data)
         if serializer.is_valid():
-            serializer.save()
+            with transaction.atomic():
+                serializer.save()
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
@@ -498,7 +580,8 @@ def due_detail(request, due_id):
             
         serializer = DueEntrySerializer(due, data=request.data, partial=True)
         if serializer.is_valid():
-            serializer.save()
+            with transaction.atomic():
+                serializer.save()
             return Response(serializer.data)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
     
@@ -512,8 +595,34 @@ def due_detail(request, due_id):
         due.delete()
         return Response(status=status.HTTP_204_NO_CONTENT)
 
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def due_accruals(request, due_id):
+    """Interest and late fees accrued on a due, newest first, with their totals"""
+    due = get_object_or_404(DueEntry, id=due_id)
+    user_profile = get_object_or_404(UserProfile, user=request.user)
+    
+    lender = user_profile.user_type == 'fintech' and EMIPlan.objects.filter(
+        due=due, fintech=user_profile, status='active'
+    ).exists()
+    if user_profile not in [due.supplier, due.retailer] and not lender:
+        return Response(
+            {'error': 'You do not have permission to access this due'},
+            status=status.HTTP_403_FORBIDDEN
+        )
+    
+    accruals = Accrual.objects.filter(due=due).order_by('-accrual_date')
+    totals = accruals.aggregate(interest=Sum('interest'), late_fees=Sum('late_fee'))
+    return Response({
+        'due': due.id,
+        'interest': totals['interest'] or 0,
+        'late_fees': totals['late_fees'] or 0,
+        'accruals': AccrualSerializer(accruals, many=True).data
+    })
+
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
+@throttle_classes([PaymentThrottle])
 def make_payment(request, due_id):
     due = get_object_or_404(DueEntry, id=due_id)
     user_profile = get_object_or_404(UserProfile, user=request.user)
@@ -530,20 +639,70 @@ def make_payment(request, due_id):
             status=status.HTTP_400_BAD_REQUEST
         )
     
-    payment = Payment.objects.create(
-        transaction=due,
-        amount=request.data['amount'],
-        payment_method=request.data['payment_method'],
-        status='completed',
-        reference_id=request.data.get('reference_id', '')
-    )
+    try:
+        payment, allocations = apply_payment(
+            retailer=user_profile,
+            amount=request.data.get('amount', due.balance),
+            payment_method=request.data.get('payment_method', ''),
+            reference_id=request.data.get('reference_id', ''),
+            supplier=due.supplier,
+            due_ids=[due.id]
+        )
+    except AllocationError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
     
-    due.status = 'paid'
-    due.save()
+    due.refresh_from_db()
     
-    return Response({'message': 'Payment successful'}, status=status.HTTP_200_OK)
+    return Response({
+        'message': 'Payment successful',
+        'payment': PaymentSerializer(payment).data,
+        'due': DueEntrySerializer(due).data
+    }, status=status.HTTP_200_OK)
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+@throttle_classes([PaymentThrottle])
+def create_payment(request):
+    """Apply a lump-sum payment across the retailer's open dues"""
+    user_profile = get_object_or_404(UserProfile, user=request.user)
+    
+    if user_profile.user_type != 'retailer':
+        return Response(
+            {'error': 'Only retailers can make payments'},
+            status=status.HTTP_403_FORBIDDEN
+        )
+    
+    supplier = None
+    if request.data.get('supplier'):
+        supplier = get_object_or_404(UserProfile, id=request.data['supplier'], user_type='supplier')
+    
+    try:
+        payment, allocations = apply_payment(
+            retailer=user_profile,
+            amount=request.data.get('amount'),
+            payment_method=request.data.get('payment_method', ''),
+            reference_id=request.data.get('reference_id', ''),
+            supplier=supplier,
+            strategy=request.data.get('strategy')
+        )
+    except AllocationError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    
+    return Response({
+        'message': 'Payment successful',
+        'payment': PaymentSerializer(payment).data,
+        'allocations': [
+            {
+                'due': allocation.due_id,
+                'amount': str(allocation.amount),
+                'status': allocation.status
+            }
+            for allocation in allocations
+        ]
+    }, status=status.HTTP_201_CREATED)
 
 @api_view(['GET'])
+@renderer_classes(FAST_RENDERERS)
 @permission_classes([IsAuthenticated])
 def get_transactions(request):
     user_profile = get_object_or_404(UserProfile, user=request.user)
@@ -553,10 +712,10 @@ def get_transactions(request):
     else:  # retailer
         transactions = Transaction.objects.filter(retailer=user_profile)
         
-    serializer = TransactionSerializer(transactions, many=True)
-    return Response(serializer.data)
+    return Response(transaction_rows.rows(transactions))
 
 @api_view(['GET'])
+@renderer_classes(FAST_RENDERERS)
 @permission_classes([IsAuthenticated])
 def get_transaction_history(request):
     user_profile = get_object_or_404(UserProfile, user=request.user)
@@ -567,25 +726,22 @@ def get_transaction_history(request):
         transactions = Transaction.objects.filter(retailer=user_profile)
         
     transactions = transactions.order_by('-created_at')[:10]  # Get last 10 transactions
-    serializer = TransactionSerializer(transactions, many=True)
-    return Response(serializer.data)
+    return Response(transaction_rows.rows(transactions))
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@throttle_classes([DashboardThrottle])
 def get_dashboard_stats(request):
     """Get dashboard statistics for the current user"""
     try:
         user_profile = get_object_or_404(UserProfile, user=request.user)
         
         if user_profile.user_type == 'supplier':
-            total_outstanding = DueEntry.objects.filter(
-                supplier=user_profile,
-                status__in=['pending', 'overdue']
-            ).aggregate(total=Sum('amount'))['total'] or 0
-            
-            active_retailers = DueEntry.objects.filter(
-                supplier=user_profile
-            ).values('retailer').distinct().count()
+            links = SupplierRetailer.objects.filter(supplier=user_profile).aggregate(
+                total=Sum('open_balance'), retailers=Count('id')
+            )
+            total_outstanding = links['total'] or 0
+            active_retailers = links['retailers']
             
             monthly_sales = Transaction.objects.filter(
                 supplier=user_profile,
@@ -595,7 +751,7 @@ def get_dashboard_stats(request):
             overdue_amount = DueEntry.objects.filter(
                 supplier=user_profile,
                 status='overdue'
-            ).aggregate(total=Sum('amount'))['total'] or 0
+            ).aggregate(total=Sum(BALANCE))['total'] or 0
             
             return Response({
                 'totalOutstanding': total_outstanding,
@@ -610,18 +766,18 @@ def get_dashboard_stats(request):
             total_due = DueEntry.objects.filter(
                 retailer=user_profile,
                 status__in=['pending', 'overdue']
-            ).aggregate(total=Sum('amount'))['total'] or 0
+            ).aggregate(total=Sum(BALANCE))['total'] or 0
             
             due_today = DueEntry.objects.filter(
                 retailer=user_profile,
                 status='pending',
                 due_date=timezone.now().date()
-            ).aggregate(total=Sum('amount'))['total'] or 0
+            ).aggregate(total=Sum(BALANCE))['total'] or 0
             
             overdue_amount = DueEntry.objects.filter(
                 retailer=user_profile,
                 status='overdue'
-            ).aggregate(total=Sum('amount'))['total'] or 0
+            ).aggregate(total=Sum(BALANCE))['total'] or 0
             
             return Response({
                 'totalDue': total_due,
@@ -739,4 +895,438 @@ def get_credit_assessment_status(request):
         return Response(
             {'error': str(e)},
             status=status.HTTP_500_INTERNAL_SERVER_ERROR
-        )
\ No newline at end of file
+        )
+
+@api_view(['GET', 'POST'])
+@permission_classes([IsAuthenticated])
+def retailer_documents(request):
+    """List the retailer's documents or upload one in a single multipart request"""
+    user_profile = get_object_or_404(UserProfile, user=request.user)
+    
+    if user_profile.user_type != 'retailer':
+        return Response(
+            {'error': 'Only retailers can manage documents'},
+            status=status.HTTP_403_FORBIDDEN
+        )
+    
+    retailer_profile = get_object_or_404(RetailerProfile, user_profile=user_profile)
+    
+    if request.method == 'GET':
+        docs = Document.objects.filter(retailer=retailer_profile).order_by('-uploaded_at')
+        return Response(DocumentSerializer(docs, many=True).data)
+    
+    uploaded_file = request.FILES.get('file')
+    if uploaded_file is None:
+        return Response({'error': 'No file provided'}, status=status.HTTP_400_BAD_REQUEST)
+    
+    try:
+        document = documents.create_document(
+            retailer_profile, request.data.get('document_type'), uploaded_file
+        )
+    except documents.UploadError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    
+    return Response(DocumentSerializer(document).data, status=status.HTTP_201_CREATED)
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def document_detail(request, document_id):
+    """Get a document and its processing status"""
+    document = get_object_or_404(
+        Document, id=document_id, retailer__user_profile__user=request.user
+    )
+    return Response(DocumentSerializer(document).data)
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def start_document_upload(request):
+    """Open a resumable chunked upload session"""
+    retailer_profile = get_object_or_404(RetailerProfile, user_profile__user=request.user)
+    
+    try:
+        upload = documents.start_upload(
+            retailer_profile,
+            request.data.get('document_type'),
+            request.data.get('filename'),
+            request.data.get('size')
+        )
+    except documents.UploadError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    
+    return Response({
+        **DocumentUploadSerializer(upload).data,
+        'chunk_size': documents.max_chunk_size()
+    }, status=status.HTTP_201_CREATED)
+
+CONTENT_RANGE = re.compile(r'^bytes (\d+)-(\d+)/(\d+|\*)$')
+
+@api_view(['GET', 'PUT'])
+@permission_classes([IsAuthenticated])
+def document_upload_detail(request, upload_id):
+    """
+    GET reports how many bytes were received so a client can resume.
+    PUT appends a raw chunk described by its Content-Range header.
+    """
+    upload = get_object_or_404(
+        DocumentUpload, id=upload_id, retailer__user_profile__user=request.user
+    )
+    
+    if request.method == 'GET':
+        return Response(DocumentUploadSerializer(upload).data)
+    
+    match = CONTENT_RANGE.match(request.headers.get('Content-Range', ''))
+    if not match:
+        return Response(
+            {'error': 'A Content-Range header is required'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    offset, end = int(match.group(1)), int(match.group(2))
+    
+    try:
+        documents.write_chunk(upload, offset, end - offset + 1, request.stream)
+    except documents.UploadConflict as e:
+        return Response(
+            {'error': str(e), 'received': upload.received},
+            status=status.HTTP_409_CONFLICT
+        )
+    except documents.UploadError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    
+    return Response(DocumentUploadSerializer(upload).data)
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def job_status(request, job_id):
+    """Poll the progress of a background job"""
+    jobs = Job.objects.all()
+    if not request.user.is_staff:
+        jobs = jobs.filter(created_by=request.user)
+    job = get_object_or_404(jobs, id=job_id)
+    
+    data = JobSerializer(job).data
+    if not request.user.is_staff:
+        # Only the final line of the traceback is shown to the job owner
+        data['error'] = job.error.strip().splitlines()[-1] if job.error.strip() else ''
+    return Response(data)
+
+def _emi_context(request, due_id):
+    """Resolve the due and the lenders whose plans the current user may see"""
+    due = get_object_or_404(DueEntry, id=due_id)
+    user_profile = get_object_or_404(UserProfile, user=request.user)
+    
+    if user_profile.user_type == 'fintech':
+        if user_profile.interest_rate is None:
+            return due, user_profile, []
+        return due, user_profile, [(user_profile.id, str(user_profile.interest_rate))]
+    if user_profile not in [due.supplier, due.retailer]:
+        return None, user_profile, None
+    return due, user_profile, emi.active_lenders()
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def get_emi_plans(request, due_id):
+    """EMI plans for the outstanding balance of a due across tenures and lenders"""
+    due, user_profile, lenders = _emi_context(request, due_id)
+    if due is None:
+        return Response(
+            {'error': 'You do not have permission to access this due'},
+            status=status.HTTP_403_FORBIDDEN
+        )
+    if due.status == 'paid':
+        return Response({'error': 'This due has already been paid'}, status=status.HTTP_400_BAD_REQUEST)
+    
+    balance = emi.to_paise(due.balance)
+    all_lenders = emi.active_lenders()
+    plans = emi.cached_offers(due.id, balance, all_lenders)
+    if plans is None:
+        plans = emi.build_plans(balance, lenders)
+    elif lenders != all_lenders:
+        lender_ids = {fintech_id for fintech_id, _ in lenders}
+        plans = [plan for plan in plans if plan['fintech'] in lender_ids]
+    return Response(plans)
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def get_emi_schedule(request, due_id, plan_id):
+    """Full amortization schedule for one EMI plan"""
+    due, user_profile, lenders = _emi_context(request, due_id)
+    if due is None:
+        return Response(
+            {'error': 'You do not have permission to access this due'},
+            status=status.HTTP_403_FORBIDDEN
+        )
+    
+    try:
+        fintech_id, tenure = emi.parse_plan_id(plan_id)
+    except ValueError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    
+    rates = dict(lenders)
+    if fintech_id not in rates or tenure not in emi.tenures():
+        return Response({'error': 'EMI plan not found'}, status=status.HTTP_404_NOT_FOUND)
+    
+    schedule = emi.amortization_schedule(emi.to_paise(due.balance), rates[fintech_id], tenure)
+    return Response({
+        'id': plan_id,
+        'tenure_months': tenure,
+        'interest_rate': rates[fintech_id],
+        'schedule': emi.schedule_rows(schedule)
+    })
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def activate_emi_plan(request, due_id, plan_id):
+    """Activate an EMI plan for a due and store its schedule"""
+    due, user_profile, lenders = _emi_context(request, due_id)
+    if due is None or user_profile == due.supplier:
+        return Response(
+            {'error': 'Only the retailer or the lender can activate an EMI plan'},
+            status=status.HTTP_403_FORBIDDEN
+        )
+    if due.status == 'paid':
+        return Response({'error': 'This due has already been paid'}, status=status.HTTP_400_BAD_REQUEST)
+    
+    try:
+        fintech_id, tenure = emi.parse_plan_id(plan_id)
+    except ValueError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    
+    rates = dict(lenders)
+    if fintech_id not in rates or tenure not in emi.tenures():
+        return Response({'error': 'EMI plan not found'}, status=status.HTTP_404_NOT_FOUND)
+    
+    if EMIPlan.objects.filter(due=due, status='active').exists():
+        return Response(
+            {'error': 'This due already has an active EMI plan'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    
+    principal = emi.to_paise(due.balance)
+    schedule = emi.amortization_schedule(principal, rates[fintech_id], tenure)
+    payments = schedule.sum(axis=1)
+    plan = EMIPlan.objects.create(
+        due=due,
+        fintech_id=fintech_id,
+        principal=emi.from_paise(principal),
+        interest_rate=rates[fintech_id],
+        tenure_months=tenure,
+        monthly_amount=emi.from_paise(payments[0]),
+        total_amount=emi.from_paise(payments.sum()),
+        schedule=emi.pack_schedule(schedule),
+        activated_by=request.user
+    )
+    
+    return Response({
+        'message': 'EMI plan activated',
+        'id': plan.id,
+        'plan_id': plan_id,
+        'tenure_months': plan.tenure_months,
+        'monthly_amount': plan.monthly_amount,
+        'total_amount': plan.total_amount,
+        'schedule': emi.schedule_rows(schedule)
+    }, status=status.HTTP_201_CREATED)
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def get_fintech_retailers(request):
+    """Retailer portfolio with risk columns, sorted and keyset-paginated"""
+    user_profile = get_object_or_404(UserProfile, user=request.user)
+    if user_profile.user_type != 'fintech':
+        return Response(
+            {'error': 'Only fintech users can view the retailer portfolio'},
+            status=status.HTTP_403_FORBIDDEN
+        )
+    
+    try:
+        limit = min(int(request.query_params.get('limit', 50)), 500)
+        queryset = risk.filter_queryset(RetailerRisk.objects.all(), request.query_params)
+        rows, next_cursor = risk.page(
+            queryset,
+            request.query_params.get('sort', '-credit_score'),
+            cursor=request.query_params.get('cursor'),
+            limit=max(limit, 1)
+        )
+    except ValueError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    
+    response = Response(RetailerRiskSerializer(rows, many=True).data)
+    if next_cursor:
+        response['X-Next-Cursor'] = next_cursor
+    return response
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+@throttle_classes([DashboardThrottle])
+def get_fintech_dashboard_stats(request):
+    """Portfolio totals for the fintech dashboard, from the risk rows"""
+    user_profile = get_object_or_404(UserProfile, user=request.user)
+    if user_profile.user_type != 'fintech':
+        return Response(
+            {'error': 'Only fintech users can view portfolio statistics'},
+            status=status.HTTP_403_FORBIDDEN
+        )
+    
+    totals = RetailerRisk.objects.aggregate(
+        total_credit=Sum('credit_limit'),
+        total_due=Sum('outstanding'),
+        active=Count('retailer', filter=Q(outstanding__gt=0)),
+        pending=Count('retailer', filter=Q(assessment_status__in=['none', 'pending'])),
+        defaulted=Count('retailer', filter=Q(oldest_open_due_date__lt=risk.default_cutoff())),
+        borrowers=Count('retailer', filter=Q(due_count__gt=0)),
+    )
+    average_rate = UserProfile.objects.filter(
+        user_type='fintech', interest_rate__isnull=False
+    ).aggregate(rate=Avg('interest_rate'))['rate'] or 0
+    default_rate = totals['defaulted'] * 100 / totals['borrowers'] if totals['borrowers'] else 0
+    
+    return Response({
+        'totalCreditExtended': totals['total_credit'] or 0,
+        'activeRetailers': totals['active'],
+        'pendingAssessments': totals['pending'],
+        'averageInterestRate': round(float(average_rate), 2),
+        'defaultRate': round(default_rate, 2),
+        'totalDueAmount': totals['total_due'] or 0
+    })
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+@throttle_classes([AnalyticsThrottle])
+def get_fintech_analytics(request):
+    """Cohort, exposure and distribution analytics for the credit book"""
+    user_profile = get_object_or_404(UserProfile, user=request.user)
+    if user_profile.user_type != 'fintech':
+        return Response(
+            {'error': 'Only fintech users can view portfolio analytics'},
+            status=status.HTTP_403_FORBIDDEN
+        )
+    return Response(analytics.report())
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def start_stress_test(request):
+    """Queue a Monte Carlo stress test of the credit book"""
+    user_profile = get_object_or_404(UserProfile, user=request.user)
+    if user_profile.user_type != 'fintech':
+        return Response(
+            {'error': 'Only fintech users can run stress tests'},
+            status=status.HTTP_403_FORBIDDEN
+        )
+    
+    try:
+        params = {
+            'scenarios': int(request.data.get('scenarios', settings.STRESS_SCENARIOS)),
+            'correlation': float(request.data.get('correlation', settings.STRESS_CORRELATION)),
+            'approved_only': str(request.data.get('approved_only', 'true')).lower() in ('1', 'true'),
+        }
+        if request.data.get('seed') is not None:
+            params['seed'] = int(request.data['seed'])
+    except (TypeError, ValueError):
+        return Response({'error': 'Invalid stress test parameters'}, status=status.HTTP_400_BAD_REQUEST)
+    
+    if not 0 < params['scenarios'] <= settings.STRESS_MAX_SCENARIOS:
+        return Response(
+            {'error': f'Scenarios must be between 1 and {settings.STRESS_MAX_SCENARIOS}'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    if not 0 <= params['correlation'] < 1:
+        return Response({'error': 'Correlation must be in [0, 1)'}, status=status.HTTP_400_BAD_REQUEST)
+    
+    job = jobs.enqueue('stress.run', params, user=request.user)
+    return Response(JobSerializer(job).data, status=status.HTTP_202_ACCEPTED)
+
+@api_view(['GET'])
+@renderer_classes(FAST_RENDERERS)
+@permission_classes([IsAuthenticated])
+def sync_changes(request):
+    """Dues, transactions and payments changed since a sync token, with tombstones"""
+    user_profile = get_object_or_404(UserProfile, user=request.user)
+    
+    since = request.query_params.get('since')
+    if since in (None, ''):
+        # No token yet: load the full lists, then sync from here.
+        return Response({'reset': True, 'token': changefeed.head(), 'more': False})
+    try:
+        since = int(since)
+        limit = min(int(request.query_params.get('limit', settings.SYNC_PAGE_SIZE)), settings.SYNC_PAGE_SIZE)
+    except ValueError:
+        return Response({'error': 'Invalid sync token'}, status=status.HTTP_400_BAD_REQUEST)
+    if since < 0 or limit < 1:
+        return Response({'error': 'Invalid sync token'}, status=status.HTTP_400_BAD_REQUEST)
+    
+    return Response(changefeed.changes_since(user_profile.id, since, limit))
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+@throttle_classes([PaymentThrottle])
+def apply_mutations(request):
+    """Apply a batch of queued client operations in order; replays return the stored outcome"""
+    user_profile = get_object_or_404(UserProfile, user=request.user)
+    
+    try:
+        operations = mutations.parse(request.data)
+    except mutations.MutationError as e:
+        return Response({'error': e.error}, status=e.status_code)
+    
+    return Response({'results': mutations.apply(user_profile, operations)})
+
+@api_view(['GET', 'POST'])
+@permission_classes([IsAuthenticated])
+def reconciliations(request):
+    """List the supplier's statement reconciliations or upload a bank statement CSV to reconcile"""
+    user_profile = get_object_or_404(UserProfile, user=request.user)
+    
+    if user_profile.user_type != 'supplier':
+        return Response(
+            {'error': 'Only suppliers can reconcile bank statements'},
+            status=status.HTTP_403_FORBIDDEN
+        )
+    
+    if request.method == 'GET':
+        items = StatementReconciliation.objects.filter(
+            supplier=user_profile
+        ).select_related('job').order_by('-created_at')
+        return Response(StatementReconciliationSerializer(items, many=True).data)
+    
+    uploaded_file = request.FILES.get('file')
+    if uploaded_file is None:
+        return Response({'error': 'No file provided'}, status=status.HTTP_400_BAD_REQUEST)
+    if uploaded_file.size > settings.RECONCILE_MAX_STATEMENT_SIZE:
+        return Response({'error': 'Statement is too large'}, status=status.HTTP_400_BAD_REQUEST)
+    
+    with transaction.atomic():
+        item = StatementReconciliation.objects.create(
+            supplier=user_profile,
+            statement=uploaded_file,
+            original_name=uploaded_file.name[:255]
+        )
+        item.job = jobs.enqueue('reconciliation.run', {'reconciliation_id': item.id}, user=request.user)
+        item.save(update_fields=['job'])
+    
+    return Response(StatementReconciliationSerializer(item).data, status=status.HTTP_202_ACCEPTED)
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def reconciliation_detail(request, reconciliation_id):
+    """A statement reconciliation with its job progress and match counts"""
+    item = get_object_or_404(
+        StatementReconciliation.objects.select_related('job'),
+        id=reconciliation_id, supplier__user=request.user
+    )
+    return Response(StatementReconciliationSerializer(item).data)
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def reconciliation_unmatched(request, reconciliation_id):
+    """Download the statement lines a reconciliation could not settle, as CSV"""
+    item = get_object_or_404(
+        StatementReconciliation, id=reconciliation_id, supplier__user=request.user
+    )
+    if not item.unmatched_report:
+        return Response({'error': 'Reconciliation has not finished'}, status=status.HTTP_404_NOT_FOUND)
+    
+    return FileResponse(
+        item.unmatched_report.open('rb'),
+        as_attachment=True,
+        filename=f'unmatched-{item.id}.csv',
+        content_type='text/csv'
+    )
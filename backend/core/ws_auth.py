@@ -0,0 +1,51 @@
+"""
+WebSocket authentication.
+
+Browsers on the API's host authenticate the socket with the session cookie,
+through channels' ``AuthMiddlewareStack``. Clients that cannot send the
+cookie (another origin, native apps) first fetch a ticket from
+``/api/ws/ticket/`` and connect with ``?ticket=<ticket>``. A ticket is a
+signed, timestamped user id that is only accepted for ``WS_TICKET_MAX_AGE``
+seconds.
+"""
+from urllib.parse import parse_qs
+
+from channels.auth import AuthMiddlewareStack
+from channels.db import database_sync_to_async
+from channels.middleware import BaseMiddleware
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core import signing
+
+SALT = 'core.ws_auth.ticket'
+
+
+def issue_ticket(user):
+    return signing.dumps(user.pk, salt=SALT)
+
+
+def user_for_ticket(ticket):
+    """The active user a ticket was issued to, or ``None`` if it is invalid or stale."""
+    try:
+        user_id = signing.loads(ticket, salt=SALT, max_age=getattr(settings, 'WS_TICKET_MAX_AGE', 60))
+    except signing.BadSignature:
+        return None
+    return User.objects.filter(pk=user_id, is_active=True).first()
+
+
+class TicketAuthMiddleware(BaseMiddleware):
+    """Authenticate ``?ticket=`` connections that have no session user."""
+
+    async def __call__(self, scope, receive, send):
+        user = scope.get('user')
+        if user is None or not user.is_authenticated:
+            tickets = parse_qs(scope.get('query_string', b'').decode()).get('ticket')
+            if tickets:
+                ticket_user = await database_sync_to_async(user_for_ticket)(tickets[0])
+                if ticket_user is not None:
+                    scope = dict(scope, user=ticket_user)
+        return await super().__call__(scope, receive, send)
+
+
+def TicketAuthMiddlewareStack(inner):
+    return AuthMiddlewareStack(TicketAuthMiddleware(inner))
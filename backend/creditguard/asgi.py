@@ -1,14 +1,17 @@
 import os
 from django.core.asgi import get_asgi_application
 from channels.routing import ProtocolTypeRouter, URLRouter
-from channels.auth import AuthMiddlewareStack
-from core.routing import websocket_urlpatterns
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'creditguard.settings')
 
+django_asgi_app = get_asgi_application()
+
+from core.routing import websocket_urlpatterns  # noqa: E402 (needs the app registry)
+from core.ws_auth import TicketAuthMiddlewareStack  # noqa: E402
+
 application = ProtocolTypeRouter({
-    "http": get_asgi_application(),
-    "websocket": AuthMiddlewareStack(
+    "http": django_asgi_app,
+    "websocket": TicketAuthMiddlewareStack(
         URLRouter(websocket_urlpatterns)
     ),
-})
\ No newline at end of file
+})
@@ -33,9 +33,11 @@ MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
+    'core.throttling.LoadSheddingMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'core.profiling.ProfilingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -61,10 +63,17 @@ TEMPLATES = [
 WSGI_APPLICATION = 'creditguard.wsgi.application'
 ASGI_APPLICATION = 'creditguard.asgi.application'
 
-# Channel Layers for WebSocket
+# Channel Layers for WebSocket. The SQLite layer is shared by every worker
+# process on the host (see core.channel_layers); use channels_redis to span
+# hosts.
 CHANNEL_LAYERS = {
     'default': {
-        'BACKEND': 'channels.layers.InMemoryChannelLayer'
+        'BACKEND': 'core.channel_layers.SQLiteChannelLayer',
+        'CONFIG': {
+            'path': BASE_DIR / 'channels.sqlite3',
+            'expiry': 60,
+            'capacity': 100,
+        },
     },
 }
 
@@ -76,6 +85,20 @@ DATABASES = {
     }
 }
 
+# 'default' is per process. 'shared' is seen by every process on the host (web
+# workers, run_workers, management commands) and holds invalidation versions,
+# one small entry per supplier, which must not be culled.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'shared': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': BASE_DIR / 'cache',
+        'OPTIONS': {'MAX_ENTRIES': 1_000_000},
+    },
+}
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -97,6 +120,9 @@ USE_I18N = True
 USE_TZ = True
 
 STATIC_URL = 'static/'
+
+MEDIA_URL = 'media/'
+MEDIA_ROOT = BASE_DIR / 'media'
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 # REST Framework settings
@@ -107,6 +133,9 @@ REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
     ],
+    'DEFAULT_THROTTLE_CLASSES': [
+        'core.throttling.UserThrottle',
+    ],
 }
 
 # CORS Settings
@@ -117,6 +146,8 @@ CORS_ALLOWED_ORIGINS = [
 
 CORS_ALLOW_CREDENTIALS = True
 
+CORS_EXPOSE_HEADERS = ['X-Next-Cursor']
+
 # CSRF Settings
 CSRF_TRUSTED_ORIGINS = [
     'http://localhost:5173',
@@ -131,4 +162,156 @@ CSRF_COOKIE_SECURE = False
 # Session Settings
 SESSION_COOKIE_SECURE = False
 SESSION_COOKIE_SAMESITE = 'Lax'
-SESSION_COOKIE_AGE = 1209600  # 2 weeks in seconds
\ No newline at end of file
+SESSION_COOKIE_AGE = 1209600  # 2 weeks in seconds
+
+# Payment allocation
+# Order in which a payment is spread over open dues: fifo, lifo,
+# smallest_first or largest_first (see core.allocation.STRATEGIES).
+PAYMENT_ALLOCATION_STRATEGY = os.getenv('PAYMENT_ALLOCATION_STRATEGY', 'fifo')
+
+
+# Document uploads
+DOCUMENT_UPLOAD_MAX_SIZE = 100 * 1024 * 1024
+DOCUMENT_UPLOAD_CHUNK_SIZE = 5 * 1024 * 1024
+DOCUMENT_UPLOAD_TEMP_DIR = os.getenv('DOCUMENT_UPLOAD_TEMP_DIR') or None
+DOCUMENT_IMAGE_MAX_DIMENSION = 2048
+DOCUMENT_THUMBNAIL_SIZE = 256
+DOCUMENT_ALLOWED_MIME_TYPES = (
+    'application/pdf',
+    'image/jpeg',
+    'image/png',
+    'text/csv',
+    'text/plain',
+    'application/vnd.ms-excel',
+    'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+)
+
+
+# Background jobs (manage.py run_workers)
+JOB_WORKER_CONCURRENCY = int(os.getenv('JOB_WORKER_CONCURRENCY', '4'))
+JOB_POLL_INTERVAL = 1.0
+JOB_VISIBILITY_TIMEOUT = 300  # seconds a claimed job stays leased without progress
+JOB_MAX_ATTEMPTS = 5
+JOB_RETRY_BACKOFF = 5  # seconds, doubled on every attempt
+JOB_RETRY_BACKOFF_MAX = 3600
+
+
+# Payment reminders (manage.py run_reminders)
+REMINDER_OFFSETS_DAYS = (3, 1, 0, -1, -7)  # days before the due date; negative is after
+REMINDER_HOUR = 9
+REMINDER_BATCH_SIZE = 500
+REMINDER_SYNC_INTERVAL = 30  # seconds between incremental syncs of other processes' writes
+REMINDER_SYNC_SETTLE_SECONDS = 60  # re-read behind the sync watermark for transactions that commit late
+REMINDER_SINKS = [
+    'core.reminders.ChannelLayerSink',
+    'core.reminders.LoggingSink',
+]
+
+# EMI plans
+EMI_TENURES = (3, 6, 9, 12, 18, 24)  # months
+EMI_OFFER_MIN_AMOUNT = 5000  # smallest balance precompute_emi_offers makes offers for
+
+
+# Fintech portfolio
+RISK_DEFAULT_DAYS = 90  # an open due this many days past its due date counts as a default
+
+# Portfolio stress testing (stress.run jobs)
+STRESS_SCENARIOS = 100_000
+STRESS_MAX_SCENARIOS = 1_000_000
+STRESS_CHUNK_SIZE = 10_000  # scenarios per process pool task
+STRESS_WORKERS = None  # defaults to the number of CPUs
+STRESS_CORRELATION = 0.15  # asset correlation with the systematic factors
+STRESS_SECTOR_WEIGHT = 0.6  # share of each business type factor driven by the global factor
+STRESS_LOSS_GIVEN_DEFAULT = 0.6
+STRESS_CREDIT_CONVERSION_FACTOR = 0.5  # share of undrawn credit drawn before default
+STRESS_CONFIDENCE_LEVELS = (0.95, 0.99, 0.999)
+
+# Largest number of retailers /retailers/details/?ids= returns at once
+RETAILER_DETAILS_BATCH_SIZE = 100
+
+# Delta sync (/api/sync/)
+SYNC_PAGE_SIZE = 1000  # most change entries read per sync request
+SYNC_RETENTION_DAYS = 30  # older tokens get a full reload
+SYNC_SETTLE_SECONDS = 0  # raise to a few seconds where transactions can commit out of id order (PostgreSQL)
+
+# Batched offline mutations (/api/mutations/)
+MUTATION_BATCH_SIZE = 100  # most operations per request
+MUTATION_RETENTION_DAYS = 30  # how long replays of an operation return its stored outcome
+
+# Real-time event outbox (manage.py relay_outbox). Events accumulate until a
+# relay is running.
+OUTBOX_BATCH_SIZE = 500  # events read per relay batch
+OUTBOX_EVENTS_PER_MESSAGE = 100  # events per channel layer message to one user
+OUTBOX_POLL_INTERVAL = 0.2  # seconds between polls once the outbox is drained
+OUTBOX_RETRY_DELAY = 5  # seconds a recipient is backed off after a failed send
+
+# WebSocket connections (ws/updates/), per worker process
+WS_TICKET_MAX_AGE = 60  # seconds a /api/ws/ticket/ ticket can be used to connect
+WS_MAX_CONNECTIONS = 20000  # further connections are refused with 1013
+WS_MAX_CONNECTIONS_PER_USER = 5  # a newer connection closes the user's oldest
+WS_SEND_QUEUE_SIZE = 256  # messages queued for one client before it is disconnected
+WS_SEND_TIMEOUT = 10  # seconds one send may take before the client is disconnected
+WS_HEARTBEAT_INTERVAL = 30  # seconds between server pings
+WS_IDLE_TIMEOUT = 75  # seconds without client traffic before the connection is closed
+
+# Interest and late-fee accrual on overdue dues (manage.py accrue_interest, nightly)
+ACCRUAL_DEFAULT_RATE = 18  # annual % for dues without an active EMI plan from a lender with an interest_rate
+ACCRUAL_LATE_FEE_PERCENT = 2  # of the balance, charged on a due's first accrual
+ACCRUAL_GRACE_DAYS = 0  # days past the due date before a due accrues
+ACCRUAL_BATCH_SIZE = 5000  # dues priced and written per transaction
+
+# Bank statement reconciliation (POST /api/reconciliations/)
+RECONCILE_EARLY_DAYS = 3  # a credit may arrive this many days before the purchase date
+RECONCILE_LATE_DAYS = 30  # ... or this many days after the due date
+RECONCILE_CHUNK_SIZE = 1000  # statement lines checked for earlier settlement per query
+RECONCILE_SETTLE_BATCH_SIZE = 1000  # matches settled per transaction
+RECONCILE_MAX_STATEMENT_SIZE = 50 * 1024 * 1024  # bytes
+
+# Bank statement analytics (RetailerProfile.bank_statement_score)
+BANK_STATEMENT_MAX_DOCUMENTS = 12  # most recent statements combined into a retailer's score
+BANK_STATEMENT_WORKERS = None  # processes parsing statements in score_bank_statements; None = CPU count
+
+# Admin changelists over the ledger tables (core.admin.LedgerAdmin)
+ADMIN_COUNT_LIMIT = 10000  # rows counted for a filtered changelist before the count is capped
+ADMIN_SEARCH_PROFILE_LIMIT = 500  # business-name prefix matches a search filters on
+
+# Token-bucket throttles and load shedding (core.throttling), shared by the
+# processes of one host through a memory-mapped file
+THROTTLE_STORE_PATH = BASE_DIR / 'throttle.bin'
+THROTTLE_STORE_BUCKETS = 4096  # hash sets of 8 buckets each
+THROTTLE_BUCKETS = {  # scope: (burst, tokens refilled per second), per user (or IP when anonymous)
+    'user': (120, 20),
+    'dashboard': (10, 0.5),
+    'search': (20, 2),
+    'analytics': (5, 0.2),
+    'payments': (30, 5),
+}
+LOAD_SHED_ENABLED = True
+LOAD_SHED_MAX_IN_FLIGHT = 64  # API requests in flight on the host before non-critical ones get 503
+LOAD_SHED_MAX_EXPENSIVE = 8  # expensive read requests in flight before more of them get 503
+LOAD_SHED_RETRY_AFTER = 1  # seconds
+LOAD_SHED_CRITICAL_PATHS = (  # never shed
+    r'^/api/payments/$',
+    r'^/api/dues/\d+/pay/$',
+    r'^/api/mutations/$',
+)
+LOAD_SHED_EXPENSIVE_PATHS = (
+    r'^/api/dashboard/',
+    r'^/api/retailers/(search/)?$',
+    r'^/api/dues/aging/',
+    r'^/api/fintech/(dashboard|analytics|retailers)/',
+)
+
+# Request profiling (core.profiling): a staff user's request with "X-Profile: 1",
+# or a sample of all requests, is captured to PROFILING_DIR; see profile_hotspots
+PROFILING_ENABLED = True
+PROFILING_SAMPLE_RATE = 0.0  # fraction of requests profiled without the header
+PROFILING_DIR = BASE_DIR / 'profiles'
+PROFILING_MAX_CAPTURES = 200  # newest captures kept, older ones are deleted
+PROFILING_MAX_QUERIES = 1000  # queries recorded per capture (all are counted)
+
+# Benchmarks (core.benchmarks; run_benchmarks --save writes a baseline, compare_benchmarks checks it)
+BENCHMARK_REPEAT = 15  # timed calls per measurement
+BENCHMARK_WARMUP = 3  # untimed calls before them
+BENCHMARK_BASELINE_PATH = BASE_DIR / 'benchmarks.json'
+BENCHMARK_REGRESSION_THRESHOLD = 0.2  # slowdown of a median, beyond the baseline's IQR, that fails the comparison
@@ -1,18 +1,23 @@
-import { useState, useEffect, useCallback } from 'react';
+import { useState, useEffect, useCallback, useRef } from 'react';
 import { Due, dues } from '../services/api/dues';
+import { sync, applyChanges } from '../services/api/sync';
 import { useWebSocket } from './useWebSocket';
 
 export function useDuesList() {
-  const [duesList, setDuesList] = useState([]);
+  const [duesList, setDuesList] = useState<Due[]>([]);
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState<string | null>(null);
+  const syncToken = useRef<number | null>(null);
   const websocket = useWebSocket();
 
   const loadDues = useCallback(async () => {
     try {
       setLoading(true);
       setError(null);
+      // Take the token first so nothing written during the load is missed
+      const { token } = await sync.getChanges();
       const data = await dues.getAll();
+      syncToken.current = token;
       setDuesList(data as Due[]);
     } catch (err: any) {
       setError(err.message || 'Failed to load dues');
@@ -22,11 +27,31 @@ export function useDuesList() {
     }
   }, []);
 
+  const syncDues = useCallback(async () => {
+    if (syncToken.current === null) {
+      return loadDues();
+    }
+    try {
+      let changes;
+      do {
+        changes = await sync.getChanges(syncToken.current);
+        if (changes.reset) {
+          return loadDues();
+        }
+        const { dues: changed, deleted_dues: deleted } = changes;
+        setDuesList(list => applyChanges(list, changed as Due[], deleted));
+        syncToken.current = changes.token;
+      } while (changes.more);
+    } catch (err: any) {
+      console.error('Dues sync error:', err);
+    }
+  }, [loadDues]);
+
   useEffect(() => {
     loadDues();
 
     // Listen for real-time updates
-    const handleDueUpdate = () => loadDues();
+    const handleDueUpdate = () => syncDues();
     websocket.addListener('due_created', handleDueUpdate);
     websocket.addListener('due_updated', handleDueUpdate);
     websocket.addListener('payment_made', handleDueUpdate);
@@ -36,10 +61,10 @@ export function useDuesList() {
       websocket.removeListener('due_updated', handleDueUpdate);
       websocket.removeListener('payment_made', handleDueUpdate);
     };
-  }, [loadDues, websocket]);
+  }, [loadDues, syncDues, websocket]);
 
   const refreshDues = async () => {
-    await loadDues();
+    await syncDues();
   };
 
   return { duesList, loading, error, refreshDues };
@@ -7,7 +7,7 @@ export function useWebSocket() {
 
   useEffect(() => {
     if (user) {
-      websocketService.connect(user.id.toString(), user.user_type);
+      websocketService.connect();
       return () => websocketService.disconnect();
     }
   }, [user]);
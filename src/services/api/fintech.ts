@@ -22,7 +22,7 @@ export interface EMIPlan {
 export const fintech = {
   getRetailersForAssessment: async (): Promise<RetailerAssessment[]> => {
     try {
-      const response = await api.get('/fintech/retailers');
+      const response = await api.get('/fintech/retailers/');
       return response.data;
     } catch (error) {
       console.error('Error fetching retailers:', error);
@@ -44,7 +44,7 @@ export const fintech = {
 
   getEMIPlans: async (dueId: string): Promise<EMIPlan[]> => {
     try {
-      const response = await api.get(`/fintech/dues/${dueId}/emi-plans`);
+      const response = await api.get(`/fintech/dues/${dueId}/emi-plans/`);
       return response.data;
     } catch (error) {
       console.error('Error fetching EMI plans:', error);
@@ -54,7 +54,7 @@ export const fintech = {
 
   activateEMIPlan: async (dueId: string, planId: string) => {
     try {
-      const response = await api.post(`/fintech/dues/${dueId}/emi-plans/${planId}/activate`);
+      const response = await api.post(`/fintech/dues/${dueId}/emi-plans/${planId}/activate/`);
       return response.data;
     } catch (error) {
       console.error('Error activating EMI plan:', error);
@@ -84,7 +84,7 @@ export const fintech = {
 
   getDashboardStats: async () => {
     try {
-      const response = await api.get('/fintech/dashboard/stats');
+      const response = await api.get('/fintech/dashboard/stats/');
       return response.data;
     } catch (error) {
       console.error('Error fetching dashboard stats:', error);
@@ -94,7 +94,7 @@ export const fintech = {
 
   getAnalytics: async () => {
     try {
-      const response = await api.get('/fintech/analytics');
+      const response = await api.get('/fintech/analytics/');
       return response.data;
     } catch (error) {
       console.error('Error fetching analytics:', error);
@@ -0,0 +1,74 @@
+import api from '../api';
+
+export type MutationOp = 'create_due' | 'update_due' | 'delete_due' | 'make_payment';
+
+export interface Mutation {
+  id: string;
+  op: MutationOp;
+  data: Record<string, any>;
+}
+
+export interface MutationResult {
+  id: string;
+  status: number;
+  replayed: boolean;
+  data?: any;
+  error?: any;
+}
+
+const QUEUE_KEY = 'pendingMutations';
+const BATCH_SIZE = 100;
+
+function newId(): string {
+  return `${Date.now().toString(36)}-${Math.random().toString(36).slice(2, 10)}`;
+}
+
+function readQueue(): Mutation[] {
+  try {
+    return JSON.parse(localStorage.getItem(QUEUE_KEY) || '[]');
+  } catch {
+    return [];
+  }
+}
+
+function writeQueue(queue: Mutation[]) {
+  localStorage.setItem(QUEUE_KEY, JSON.stringify(queue));
+}
+
+export const mutations = {
+  apply: async (operations: Mutation[]): Promise<MutationResult[]> => {
+    try {
+      const response = await api.post('/mutations/', { operations });
+      return response.data.results;
+    } catch (error) {
+      console.error('Mutation batch error:', error);
+      throw error;
+    }
+  },
+
+  // Queue an operation to be sent with the next flush. Returns its client id,
+  // which later operations can use as a due reference ("@<id>").
+  enqueue: (op: MutationOp, data: Record<string, any>): string => {
+    const id = newId();
+    writeQueue([...readQueue(), { id, op, data }]);
+    return id;
+  },
+
+  pending: (): Mutation[] => readQueue(),
+
+  // Send queued operations in order. Operations are removed once the server
+  // has answered for them; a lost response is safe to retry because replays
+  // return the stored outcome.
+  flush: async (): Promise<MutationResult[]> => {
+    const results: MutationResult[] = [];
+    let queue = readQueue();
+    while (queue.length) {
+      const batch = queue.slice(0, BATCH_SIZE);
+      results.push(...await mutations.apply(batch));
+      const sent = new Set(batch.map(op => op.id));
+      queue = readQueue().filter(op => !sent.has(op.id));
+      writeQueue(queue);
+    }
+    return results;
+  }
+};
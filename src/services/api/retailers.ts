@@ -31,6 +31,16 @@ export const retailers = {
     }
   },
 
+  getByIds: async (ids: string[]): Promise<Retailer[]> => {
+    try {
+      const response = await api.get(`/retailers/details/?ids=${ids.map(encodeURIComponent).join(',')}`);
+      return response.data;
+    } catch (error) {
+      console.error('Get retailers error:', error);
+      throw error;
+    }
+  },
+
   getRecent: async (): Promise<Retailer[]> => {
     try {
       const response = await api.get('/retailers/recent/');
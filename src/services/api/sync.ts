@@ -0,0 +1,43 @@
+import api from '../api';
+
+export interface SyncChanges {
+  reset: boolean;
+  token: number;
+  more: boolean;
+  dues?: any[];
+  deleted_dues?: number[];
+  transactions?: any[];
+  deleted_transactions?: number[];
+  payments?: any[];
+  deleted_payments?: number[];
+}
+
+export const sync = {
+  getChanges: async (since?: number): Promise<SyncChanges> => {
+    try {
+      const params = since === undefined ? {} : { since };
+      const response = await api.get('/sync/', { params });
+      return response.data;
+    } catch (error) {
+      console.error('Sync error:', error);
+      throw error;
+    }
+  }
+};
+
+// Replace changed rows and drop deleted ones, keeping the list's order.
+export function applyChanges<T extends { id: any }>(list: T[], changed: T[] = [], deleted: any[] = []): T[] {
+  const updates = new Map(changed.map(row => [String(row.id), row]));
+  const removed = new Set(deleted.map(String));
+  const result = list
+    .filter(row => !removed.has(String(row.id)))
+    .map(row => {
+      const update = updates.get(String(row.id));
+      if (update) {
+        updates.delete(String(row.id));
+        return update;
+      }
+      return row;
+    });
+  return [...Array.from(updates.values()), ...result];
+}
@@ -1,24 +1,133 @@
 import { API_URL } from "./config";
+import api from "./api";
+
+// How many recent event ids are remembered to drop redelivered events.
+const SEEN_EVENT_LIMIT = 1000;
+const MAX_RECONNECT_DELAY = 30000;
+
+// Close codes after which reconnecting would not help: the session is gone,
+// or a newer tab of the same user took this connection's place.
+const CLOSE_UNAUTHENTICATED = 4401;
+const CLOSE_REPLACED = 4409;
+
+const SOCKET_URL = API_URL.replace(/^http/, 'ws').replace(/\/api\/?$/, '') + '/ws/updates/';
 
 class WebSocketService {
   private isConnected: boolean = false;
+  private listeners: Map<string, Set<Function>> = new Map();
+  private seenEvents: Set<number> = new Set();
+  private socket: WebSocket | null = null;
+  private shouldReconnect: boolean = false;
+  private reconnectDelay: number = 1000;
+  private reconnectTimer: ReturnType<typeof setTimeout> | null = null;
+  private connecting: Promise<void> | null = null;
+
+  // The server identifies the user from a short-lived ticket, so this only
+  // needs to know where to connect. Calls made while the ticket is being
+  // fetched share that attempt, so only one socket is opened per user.
+  connect(): Promise<void> {
+    this.shouldReconnect = true;
+    if (this.socket) {
+      return Promise.resolve();
+    }
+    if (!this.connecting) {
+      this.connecting = this.open().finally(() => {
+        this.connecting = null;
+      });
+    }
+    return this.connecting;
+  }
 
-  connect(userId: string, userType: string) {
-    this.isConnected = true;
-    console.log('Mock WebSocket connected');
+  private async open() {
+    let ticket: string;
+    try {
+      ticket = (await api.get('/ws/ticket/')).data.ticket;
+    } catch {
+      this.scheduleReconnect();
+      return;
+    }
+    if (!this.shouldReconnect) {
+      return;
+    }
+
+    const socket = new WebSocket(`${SOCKET_URL}?ticket=${encodeURIComponent(ticket)}`);
+    this.socket = socket;
+    socket.onopen = () => {
+      this.isConnected = true;
+      this.reconnectDelay = 1000;
+    };
+    socket.onmessage = (event) => {
+      const message = JSON.parse(event.data);
+      if (message.type === 'ping') {
+        socket.send(JSON.stringify({ type: 'pong' }));
+        return;
+      }
+      this.handleMessage(event.data);
+    };
+    socket.onclose = (event) => {
+      if (this.socket !== socket) {
+        return;
+      }
+      this.isConnected = false;
+      this.socket = null;
+      if (event.code === CLOSE_UNAUTHENTICATED || event.code === CLOSE_REPLACED) {
+        this.shouldReconnect = false;
+      }
+      // Events missed while disconnected are picked up by delta sync.
+      this.scheduleReconnect();
+    };
   }
 
   disconnect() {
+    this.shouldReconnect = false;
+    if (this.reconnectTimer) {
+      clearTimeout(this.reconnectTimer);
+      this.reconnectTimer = null;
+    }
+    this.socket?.close();
+    this.socket = null;
     this.isConnected = false;
-    console.log('Mock WebSocket disconnected');
+  }
+
+  private scheduleReconnect() {
+    if (!this.shouldReconnect || this.reconnectTimer) {
+      return;
+    }
+    // Jittered so a restarted server is not reconnected to all at once.
+    const delay = this.reconnectDelay * (0.5 + Math.random());
+    this.reconnectDelay = Math.min(this.reconnectDelay * 2, MAX_RECONNECT_DELAY);
+    this.reconnectTimer = setTimeout(() => {
+      this.reconnectTimer = null;
+      this.connect();
+    }, delay);
   }
 
   addListener(event: string, callback: Function) {
-    // Mock implementation for POC
+    if (!this.listeners.has(event)) {
+      this.listeners.set(event, new Set());
+    }
+    this.listeners.get(event)!.add(callback);
   }
 
   removeListener(event: string, callback: Function) {
-    // Mock implementation for POC
+    this.listeners.get(event)?.delete(callback);
+  }
+
+  // Dispatch a server message to its listeners. Outbox events carry an id
+  // and may be delivered more than once; repeats are ignored.
+  handleMessage(raw: string) {
+    const message = JSON.parse(raw);
+    if (message.id !== undefined) {
+      if (this.seenEvents.has(message.id)) {
+        return;
+      }
+      this.seenEvents.add(message.id);
+      if (this.seenEvents.size > SEEN_EVENT_LIMIT) {
+        const oldest = this.seenEvents.values().next().value;
+        this.seenEvents.delete(oldest);
+      }
+    }
+    this.listeners.get(message.type)?.forEach(callback => callback(message.data));
   }
 
   getConnectionStatus(): boolean {
@@ -26,4 +135,4 @@ class WebSocketService {
   }
 }
 
-export const websocketService = new WebSocketService();
\ No newline at end of file
+export const websocketService = new WebSocketService();